@@ -0,0 +1,42 @@
+from collections import OrderedDict
+
+from posts.pagination import CursorPaginator, InvalidCursor
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class CursorPagination(BasePagination):
+    """Keyset pagination with the same opaque cursors as the HTML feeds, ordered by view.cursor_ordering."""
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+
+    def get_page_size(self, request, view):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, ''))
+        except ValueError:
+            return view.page_size
+        return min(max(size, 1), self.max_page_size)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        paginator = CursorPaginator(queryset, self.get_page_size(request, view), ordering=view.cursor_ordering)
+        try:
+            self.page = paginator.page(request.query_params.get(self.cursor_query_param))
+        except InvalidCursor:
+            raise NotFound('Invalid cursor')
+        return list(self.page)
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self._link(self.page.next_cursor)),
+            ('previous', self._link(self.page.previous_cursor)),
+            ('results', data),
+        ]))
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+
+from django.contrib.auth import get_user_model
+from posts.models import Post, Group, Comment
+from rest_framework import serializers
+
+User = get_user_model()
+
+
+class SparseFieldsSerializer(serializers.ModelSerializer):
+    """
+    Serializes only the fields listed in the `fields` query parameter, e.g. ?fields=id,text.
+    Meta.columns maps a field to the model columns it reads, views pass them to only().
+    """
+    fields_query_param = 'fields'
+
+    @classmethod
+    def requested_fields(cls, request):
+        requested = request.query_params.get(cls.fields_query_param) if request is not None else None
+        if not requested:
+            return list(cls.Meta.fields)
+        names = [name for name in requested.split(',') if name]
+        unknown = set(names) - set(cls.Meta.fields)
+        if unknown:
+            raise serializers.ValidationError({cls.fields_query_param: f'Unknown fields: {", ".join(sorted(unknown))}'})
+        return [name for name in cls.Meta.fields if name in names]
+
+    @classmethod
+    def columns(cls, names):
+        columns = getattr(cls.Meta, 'columns', {})
+        return [column for name in names for column in columns.get(name, (name,))]
+
+    def get_fields(self):
+        fields = super().get_fields()
+        names = self.requested_fields(self.context.get('request'))
+        return OrderedDict((name, fields[name]) for name in names)
+
+
+class PostSerializer(SparseFieldsSerializer):
+    author = serializers.CharField(source='author.username')
+    group = serializers.CharField(source='group.slug', allow_null=True)
+
+    class Meta:
+        model = Post
+        fields = ('id', 'text', 'pub_date', 'author', 'group', 'image', 'comments_count')
+        columns = {'author': ('author__username',), 'group': ('group__slug',)}
+
+
+class CommentSerializer(SparseFieldsSerializer):
+    author = serializers.CharField(source='author.username')
+
+    class Meta:
+        model = Comment
+        fields = ('id', 'post', 'author', 'text', 'created_date')
+        columns = {'author': ('author__username',)}
+
+
+class GroupSerializer(SparseFieldsSerializer):
+    class Meta:
+        model = Group
+        fields = ('slug', 'title', 'description')
+
+
+class ProfileSerializer(SparseFieldsSerializer):
+    posts_count = serializers.IntegerField(source='stats.posts_count')
+    followers_count = serializers.IntegerField(source='stats.followers_count')
+    following_count = serializers.IntegerField(source='stats.following_count')
+
+    class Meta:
+        model = User
+        fields = ('username', 'first_name', 'last_name', 'posts_count', 'followers_count', 'following_count')
+        columns = {
+            'posts_count': ('stats__posts_count',),
+            'followers_count': ('stats__followers_count',),
+            'following_count': ('stats__following_count',),
+        }
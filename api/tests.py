@@ -0,0 +1,107 @@
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from posts.models import Post, Group, Comment, Follow
+
+User = get_user_model()
+
+
+def api_url(name, **kwargs):
+    return reverse(f'api:{name}', kwargs={'version': 'v1', **kwargs})
+
+
+@override_settings(TASKS_EAGER=True)
+class TestApi(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', email='author@email.com', password='12345')
+        self.reader = User.objects.create_user(username='reader', email='reader@email.com', password='12345')
+        self.group = Group.objects.create(title='Group', slug='group', description='')
+        self.posts = [Post.objects.create(text=f'text_{number}', author=self.author,
+                                          group=self.group if number % 2 else None) for number in range(25)]
+        for post in self.posts[-3:]:
+            Comment.objects.create(post=post, author=self.reader, text=f'comment_{post.pk}')
+        Follow.objects.create(user=self.reader, author=self.author)
+
+    def assertQueries(self, count, url, **params):
+        cache.clear()
+        with self.assertNumQueries(count):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_post_list(self):
+        data = self.assertQueries(1, api_url('post_list'))
+        self.assertEqual(len(data['results']), 20)
+        self.assertEqual(data['results'][0]['comments_count'], 1)
+        self.assertEqual(data['results'][0]['author'], 'author')
+        following = self.assertQueries(1, data['next'])
+        self.assertEqual(len(following['results']), 5)
+        self.assertIsNone(following['next'])
+
+    def test_post_detail(self):
+        data = self.assertQueries(1, api_url('post_detail', post_id=self.posts[-1].pk))
+        self.assertEqual(data['text'], 'text_24')
+        self.assertIsNone(data['group'])
+
+    def test_comment_list(self):
+        data = self.assertQueries(2, api_url('comment_list', post_id=self.posts[-1].pk))
+        self.assertEqual([comment['author'] for comment in data['results']], ['reader'])
+
+    def test_group_list_and_detail(self):
+        data = self.assertQueries(1, api_url('group_list'))
+        self.assertEqual([group['slug'] for group in data['results']], ['group'])
+        data = self.assertQueries(1, api_url('group_detail', slug='group'))
+        self.assertEqual(data['title'], 'Group')
+
+    def test_group_list_follows_new_and_deleted_groups(self):
+        url = api_url('group_list')
+        self.client.get(url)
+        Group.objects.create(title='New', slug='new', description='')
+        self.assertEqual([group['slug'] for group in self.client.get(url).json()['results']], ['group', 'new'])
+        self.group.delete()
+        self.assertEqual([group['slug'] for group in self.client.get(url).json()['results']], ['new'])
+
+    def test_group_posts(self):
+        data = self.assertQueries(2, api_url('group_posts', slug='group'))
+        self.assertEqual(len(data['results']), 12)
+        self.assertEqual(self.client.get(api_url('group_posts', slug='missing')).status_code, 404)
+
+    def test_profile(self):
+        data = self.assertQueries(1, api_url('profile_detail', username='author'))
+        self.assertEqual((data['posts_count'], data['followers_count']), (25, 1))
+        data = self.assertQueries(2, api_url('profile_posts', username='author'))
+        self.assertEqual(len(data['results']), 20)
+
+    def test_feed(self):
+        self.assertEqual(self.client.get(api_url('feed')).status_code, 403)
+        self.client.force_login(self.reader)
+        # session, user, pull authors and the feed page
+        data = self.assertQueries(4, api_url('feed'))
+        self.assertEqual(data['results'][0]['text'], 'text_24')
+
+    def test_sparse_fields(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.assertQueries(1, api_url('post_list'), fields='id,comments_count')
+        self.assertEqual(set(data['results'][0]), {'id', 'comments_count'})
+        self.assertNotIn('auth_user', queries[0]['sql'])
+        self.assertNotIn('"text"', queries[0]['sql'])
+        data = self.assertQueries(1, api_url('profile_detail', username='author'), fields='username')
+        self.assertEqual(data, {'username': 'author'})
+        response = self.client.get(api_url('post_list'), {'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_invalid_version_and_cursor(self):
+        self.assertEqual(self.client.get(reverse('api:post_list', kwargs={'version': 'v9'})).status_code, 404)
+        self.assertEqual(self.client.get(api_url('post_list'), {'cursor': 'broken'}).status_code, 404)
+
+    def test_cache_shares_invalidation_with_html(self):
+        url = api_url('post_detail', post_id=self.posts[0].pk)
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json()['comments_count'], 0)
+        Comment.objects.create(post=self.posts[0], author=self.reader, text='new_comment')
+        self.assertEqual(self.client.get(url).json()['comments_count'], 1)
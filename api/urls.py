@@ -0,0 +1,21 @@
+from django.urls import path
+from posts.page_cache import GROUPS_SCOPE, cache_feed
+from . import views
+
+app_name = 'api'
+
+# Anonymous responses share the generations of the HTML pages, so the same signals invalidate both
+urlpatterns = [
+    path('posts/', cache_feed('index')(views.PostList.as_view()), name='post_list'),
+    path('posts/<int:post_id>/', cache_feed('index')(views.PostDetail.as_view()), name='post_detail'),
+    path('posts/<int:post_id>/comments/', cache_feed('index')(views.CommentList.as_view()), name='comment_list'),
+    path('groups/', cache_feed(GROUPS_SCOPE)(views.GroupList.as_view()), name='group_list'),
+    path('groups/<slug:slug>/', cache_feed('group:{slug}')(views.GroupDetail.as_view()), name='group_detail'),
+    path('groups/<slug:slug>/posts/', cache_feed('group:{slug}')(views.GroupPostList.as_view()),
+         name='group_posts'),
+    path('profiles/<str:username>/', cache_feed('profile:{username}')(views.ProfileDetail.as_view()),
+         name='profile_detail'),
+    path('profiles/<str:username>/posts/', cache_feed('profile:{username}')(views.ProfilePostList.as_view()),
+         name='profile_posts'),
+    path('feed/', views.FeedList.as_view(), name='feed'),
+]
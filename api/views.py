@@ -0,0 +1,112 @@
+from django.contrib.auth import get_user_model
+from django.shortcuts import get_object_or_404
+from posts import feed
+from posts.models import Post, Group, Comment, FeedEntry
+from rest_framework import generics
+from rest_framework.permissions import IsAuthenticated
+
+from .serializers import PostSerializer, CommentSerializer, GroupSerializer, ProfileSerializer
+
+User = get_user_model()
+
+
+class TunedQuerysetMixin:
+    """Loads only the columns the requested fields read and joins just the relations they cross."""
+    cursor_ordering = ('-pub_date', '-id')
+    page_size = 20
+
+    def tune_queryset(self, queryset, prefix=''):
+        serializer_class = self.get_serializer_class()
+        columns = [prefix + column
+                   for column in serializer_class.columns(serializer_class.requested_fields(self.request))]
+        columns += [field.lstrip('-') for field in self.cursor_ordering]
+        related = {column.rsplit('__', 1)[0] for column in columns if '__' in column}
+        queryset = queryset.select_related(None)
+        if related:
+            # select_related() without arguments would follow every foreign key
+            queryset = queryset.select_related(*related)
+        return queryset.only(*columns)
+
+
+class PostList(TunedQuerysetMixin, generics.ListAPIView):
+    serializer_class = PostSerializer
+
+    def get_queryset(self):
+        return self.tune_queryset(Post.objects.all())
+
+
+class PostDetail(TunedQuerysetMixin, generics.RetrieveAPIView):
+    serializer_class = PostSerializer
+    lookup_url_kwarg = 'post_id'
+
+    def get_queryset(self):
+        return self.tune_queryset(Post.objects.all())
+
+
+class CommentList(TunedQuerysetMixin, generics.ListAPIView):
+    serializer_class = CommentSerializer
+    cursor_ordering = ('created_date', 'id')
+
+    def get_queryset(self):
+        post = get_object_or_404(Post.objects.only('pk'), pk=self.kwargs['post_id'])
+        return self.tune_queryset(Comment.objects.filter(post=post))
+
+
+class GroupList(TunedQuerysetMixin, generics.ListAPIView):
+    serializer_class = GroupSerializer
+    cursor_ordering = ('slug',)
+
+    def get_queryset(self):
+        return self.tune_queryset(Group.objects.all())
+
+
+class GroupDetail(TunedQuerysetMixin, generics.RetrieveAPIView):
+    serializer_class = GroupSerializer
+    cursor_ordering = ('slug',)
+    lookup_field = 'slug'
+
+    def get_queryset(self):
+        return self.tune_queryset(Group.objects.all())
+
+
+class GroupPostList(TunedQuerysetMixin, generics.ListAPIView):
+    serializer_class = PostSerializer
+
+    def get_queryset(self):
+        group = get_object_or_404(Group.objects.only('pk'), slug=self.kwargs['slug'])
+        return self.tune_queryset(Post.objects.filter(group=group))
+
+
+class ProfileDetail(TunedQuerysetMixin, generics.RetrieveAPIView):
+    serializer_class = ProfileSerializer
+    cursor_ordering = ('username',)
+    lookup_field = 'username'
+
+    def get_queryset(self):
+        return self.tune_queryset(User.objects.all())
+
+
+class ProfilePostList(TunedQuerysetMixin, generics.ListAPIView):
+    serializer_class = PostSerializer
+
+    def get_queryset(self):
+        author = get_object_or_404(User.objects.only('pk'), username=self.kwargs['username'])
+        return self.tune_queryset(Post.objects.filter(author=author))
+
+
+class FeedList(TunedQuerysetMixin, generics.ListAPIView):
+    serializer_class = PostSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        queryset = feed.feed_queryset(self.request.user)
+        if queryset.model is FeedEntry:
+            self.cursor_ordering = ('-pub_date', '-post_id')
+            return self.tune_queryset(queryset, prefix='post__')
+        return self.tune_queryset(queryset)
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        if queryset.model is FeedEntry:
+            page = [entry.post for entry in page]
+        return page
@@ -1,12 +1,39 @@
 from django.contrib import admin
-from .models import Post, Group, Comment, Follow
+from .admin_changelist import LargeTableAdmin
+from .models import Post, Group, Comment, Follow, DeletionJob
+from . import deletion, search
 
 
-class PostAdmin(admin.ModelAdmin):
+class SoftDeleteAdminMixin:
+    """Delete through posts/deletion.py instead of the CASCADE collector, which loads every related row."""
+    delete_function = None
+
+    def get_deleted_objects(self, objs, request):
+        # The confirmation page would otherwise run the collector just to list the related rows
+        return [str(obj) for obj in objs], {self.model._meta.verbose_name_plural: len(objs)}, set(), []
+
+    def delete_model(self, request, obj):
+        self.delete_function(obj)
+
+    def delete_queryset(self, request, queryset):
+        for obj in queryset:
+            self.delete_function(obj)
+
+
+class PostAdmin(SoftDeleteAdminMixin, LargeTableAdmin, admin.ModelAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group', 'image')
-    list_filter = ('pub_date',)
+    list_select_related = ('author', 'group')
+    date_hierarchy = 'pub_date'
+    raw_id_fields = ('author', 'group')
     search_fields = ('text',)
     empty_value_display = '-пусто-'
+    keyset_ordering = ('-pub_date', '-id')
+    delete_function = staticmethod(deletion.delete_post)
+
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term or not search.is_available():
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(pk__in=search.matching_ids(search_term)), False
 
 
 class GroupAdmin(admin.ModelAdmin):
@@ -16,17 +43,42 @@ class GroupAdmin(admin.ModelAdmin):
     empty_value_display = '-пусто-'
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(LargeTableAdmin, admin.ModelAdmin):
     list_display = ('pk', 'text', 'author', 'post', 'created_date')
+    list_select_related = ('author', 'post')
+    date_hierarchy = 'created_date'
+    raw_id_fields = ('author', 'post')
     empty_value_display = '-пусто-'
+    keyset_ordering = ('-created_date', '-id')
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdmin, admin.ModelAdmin):
     list_display = ('pk', 'user', 'author')
     list_editable = ('user', 'author')
+    list_select_related = ('user', 'author')
+    # Plain id inputs instead of a <select> of every user in each row
+    raw_id_fields = ('user', 'author')
+
+
+class DeletionJobAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'description', 'kind', 'progress', 'created_date', 'finished_date')
+    list_filter = ('kind', 'finished_date')
+    readonly_fields = ('kind', 'object_id', 'description', 'created_date', 'finished_date', 'total', 'deleted',
+                       'locked_until')
+
+    def progress(self, job):
+        if job.finished_date:
+            return f'{job.deleted} rows, done'
+        if not job.total:
+            return 'waiting'
+        return f'{job.deleted} of {job.total} rows ({job.deleted * 100 // job.total}%)'
+
+    def has_add_permission(self, request):
+        return False
 
 
 admin.site.register(Post, PostAdmin)
 admin.site.register(Group, GroupAdmin)
 admin.site.register(Comment, CommentAdmin)
 admin.site.register(Follow, FollowAdmin)
+admin.site.register(DeletionJob, DeletionJobAdmin)
@@ -0,0 +1,206 @@
+"""
+Admin changelists that cost the same on a table of a hundred rows and of millions.
+
+LargeTableAdmin pages by keyset (the CursorPaginator of the feeds) in its default ordering and only falls back
+to offset pages when a column header is clicked. Unfiltered lists show the row count estimated from the table
+statistics, filtered ones count at most ADMIN_COUNT_CAP rows. The date hierarchy is drawn by seeking the date
+index bucket by bucket instead of SELECT DISTINCT over the whole table.
+"""
+import datetime
+
+from django.conf import settings
+from django.contrib.admin.options import IS_POPUP_VAR, TO_FIELD_VAR, IncorrectLookupParameters
+from django.contrib.admin.views.main import ALL_VAR, ERROR_FLAG, ORDER_TYPE_VAR, ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max, Min, QuerySet
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .pagination import CursorPaginator, InvalidCursor
+
+CURSOR_VAR = 'cursor'
+# Query string parameters that do not narrow the list down
+NOT_FILTERING = {CURSOR_VAR, ORDER_VAR, ORDER_TYPE_VAR, PAGE_VAR, ALL_VAR, ERROR_FLAG, IS_POPUP_VAR, TO_FIELD_VAR}
+
+
+def _table_estimate(connection, model):
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [table])
+            row = cursor.fetchone()
+            if row and row[0] >= 0:
+                return int(row[0])
+        elif connection.vendor == 'sqlite':
+            try:
+                # Filled in by ANALYZE; the first number of a stat is the row count
+                cursor.execute('SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1', [table])
+                row = cursor.fetchone()
+            except Exception:
+                row = None
+            if row:
+                return int(row[0].split()[0])
+        # No statistics: the highest primary key is one index seek and close enough for an autoincrement table
+        pk = connection.ops.quote_name(model._meta.pk.column)
+        cursor.execute(f'SELECT MAX({pk}) FROM {connection.ops.quote_name(table)}')
+        return cursor.fetchone()[0] or 0
+
+
+def estimated_count(model, using='default'):
+    """Approximate number of rows in the model's table, cached for ADMIN_COUNT_CACHE_TIMEOUT."""
+    key = f'admin_count:{using}:{model._meta.db_table}'
+    count = cache.get(key)
+    if count is None:
+        count = _table_estimate(connections[using], model)
+        cache.set(key, count, settings.ADMIN_COUNT_CACHE_TIMEOUT)
+    return count
+
+
+class EstimatedCountPaginator(Paginator):
+    """count is the table estimate when estimated, otherwise exact up to ADMIN_COUNT_CAP."""
+
+    def __init__(self, *args, estimated=False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.estimated = estimated
+
+    @cached_property
+    def _count(self):
+        if self.estimated:
+            return estimated_count(self.object_list.model, self.object_list.db)
+        return self.object_list.order_by()[:settings.ADMIN_COUNT_CAP + 1].count()
+
+    @property
+    def count(self):
+        return self._count if self.estimated else min(self._count, settings.ADMIN_COUNT_CAP)
+
+    @property
+    def count_is_capped(self):
+        return not self.estimated and self._count > settings.ADMIN_COUNT_CAP
+
+
+class IndexedDatesQuerySet(QuerySet):
+    """
+    dates() and min/max aggregates answered by ordered LIMIT 1 seeks of the field's index, which is what the
+    admin date hierarchy asks for; a loose index scan costs one seek per distinct year, month or day.
+    """
+
+    def _edge(self, field, last=False):
+        return self.order_by(f'-{field}' if last else field).values_list(field, flat=True).first()
+
+    def aggregate(self, *args, **kwargs):
+        edges = {Min: False, Max: True}
+        seekable = not args and bool(kwargs) and all(
+            type(aggregate) in edges and len(aggregate.source_expressions) == 1
+            and hasattr(aggregate.source_expressions[0], 'name') and not aggregate.filter
+            for aggregate in kwargs.values())
+        if not seekable:
+            return super().aggregate(*args, **kwargs)
+        return {alias: self._edge(aggregate.source_expressions[0].name, edges[type(aggregate)])
+                for alias, aggregate in kwargs.items()}
+
+    def dates(self, field_name, kind, order='ASC'):
+        if kind not in ('year', 'month', 'day'):
+            return super().dates(field_name, kind, order)
+        found = []
+        value = self._edge(field_name)
+        while value is not None:
+            start = _bucket_start(value, kind)
+            found.append(start)
+            value = self.filter(**{f'{field_name}__gte': _as_bound(_next_bucket(start, kind))})._edge(field_name)
+        return found[::-1] if order == 'DESC' else found
+
+
+def _bucket_start(value, kind):
+    if isinstance(value, datetime.datetime):
+        if settings.USE_TZ:
+            value = timezone.localtime(value)
+        value = value.date()
+    if kind == 'year':
+        return value.replace(month=1, day=1)
+    if kind == 'month':
+        return value.replace(day=1)
+    return value
+
+
+def _next_bucket(start, kind):
+    if kind == 'year':
+        return start.replace(year=start.year + 1)
+    if kind == 'month':
+        return (start + datetime.timedelta(days=32)).replace(day=1)
+    return start + datetime.timedelta(days=1)
+
+
+def _as_bound(day):
+    """The first moment of day, in the same time zone the changelist's date filters use."""
+    moment = datetime.datetime(day.year, day.month, day.day)
+    return timezone.make_aware(moment) if settings.USE_TZ else moment
+
+
+class KeysetChangeList(ChangeList):
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(CURSOR_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Sorting and filter links start from the first page again
+        return super().get_query_string(new_params, [CURSOR_VAR] + list(remove or []))
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        return IndexedDatesQuerySet(queryset.model, query=queryset.query, using=queryset.db)
+
+    def get_results(self, request):
+        self.keyset_page = None
+        if ORDER_VAR in self.params:
+            super().get_results(request)
+            self.result_count_is_capped = self.paginator.count_is_capped
+            self.result_count_is_estimate = self.paginator.estimated
+            return
+        counter = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        keyset = CursorPaginator(self.queryset, self.list_per_page, ordering=self.model_admin.keyset_ordering)
+        try:
+            page = keyset.page(request.GET.get(CURSOR_VAR))
+        except InvalidCursor as e:
+            raise IncorrectLookupParameters(e) from e
+        result_list = page.object_list
+        if self.list_editable:
+            # The list_editable formset wants a queryset
+            result_list = self.queryset.filter(pk__in=[obj.pk for obj in page]).order_by(*keyset.ordering)
+        self.keyset_page = page
+        self.result_count = counter.count
+        self.result_count_is_capped = counter.count_is_capped
+        self.result_count_is_estimate = counter.estimated
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = result_list
+        # The stock offset page links are not drawn, admin/posts/pagination.html links the cursors instead
+        self.can_show_all = False
+        self.multi_page = False
+        self.paginator = counter
+
+    def cursor_url(self, cursor):
+        return self.get_query_string({CURSOR_VAR: cursor})
+
+    @property
+    def next_page_url(self):
+        return self.cursor_url(self.keyset_page.next_cursor)
+
+    @property
+    def previous_page_url(self):
+        return self.cursor_url(self.keyset_page.previous_cursor)
+
+
+class LargeTableAdmin:
+    """ModelAdmin mixin: keyset pages in keyset_ordering (same direction, unique, backed by an index)."""
+    keyset_ordering = ('-id',)
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_paginator(self, request, queryset, per_page, orphans=0, allow_empty_first_page=True):
+        filtered = any(key not in NOT_FILTERING for key in request.GET)
+        return EstimatedCountPaginator(queryset, per_page, orphans, allow_empty_first_page, estimated=not filtered)
@@ -0,0 +1,53 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+from yatube.metrics import record_cache
+from .models import Post
+
+CONTROLS_MARKER = '<!-- post-controls -->'
+
+
+def card_key(post):
+    # pub_date guards against reused ids, e.g. after restoring a database dump
+    return f'post_card:{post.pk}:{post.version}:{post.pub_date.timestamp():.6f}'
+
+
+def bump_versions(posts):
+    """Invalidate cached cards of every post in the queryset."""
+    return posts.update(version=F('version') + 1)
+
+
+def iter_cards(posts, user=None):
+    """
+    Render post cards one by one, shared between all viewers and cached by (post id, version).
+    A page of cards costs one get_many and at most one set_many.
+    Per-viewer edit/delete links are rendered separately and spliced into the marker.
+    """
+    posts = list(posts)
+    keys = [card_key(post) for post in posts]
+    cached = cache.get_many(keys)
+    rendered = {}
+    for key, post in zip(keys, posts):
+        html = cached.get(key)
+        if html is None:
+            html = rendered[key] = render_to_string('post_item.html', {'post': post})
+        if user is not None and user.is_authenticated and user.pk == post.author_id:
+            html = html.replace(CONTROLS_MARKER, render_to_string('post_item_controls.html', {'post': post}))
+        yield html
+    record_cache(len(cached), len(rendered))
+    if rendered:
+        cache.set_many(rendered, settings.POST_CARD_CACHE_TIMEOUT)
+
+
+def render_cards(posts, user=None):
+    return mark_safe(''.join(iter_cards(posts, user)))
+
+
+def bump_author_posts(author_id):
+    bump_versions(Post.objects.filter(author_id=author_id))
+
+
+def bump_group_posts(group_id):
+    bump_versions(Post.objects.filter(group_id=group_id))
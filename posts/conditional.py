@@ -0,0 +1,85 @@
+import datetime
+import hashlib
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.db.models import Max
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+from .models import Post, Group
+from . import page_cache, write_behind
+
+User = get_user_model()
+
+
+def conditional_page(freshness, *scopes):
+    """
+    Answer If-None-Match / If-Modified-Since with 304 without rendering the view.
+    freshness(**kwargs) returns the last modification time of the page content from a single cheap query
+    (None for a missing object, the view then renders its 404). Changes that do not move that time (edits,
+    deletions, follows, renames, thumbnails) bump the page cache scopes: Last-Modified is the later of the two
+    times, and the ETag covers the generations of scopes,
+    the user, because authenticated pages differ per user, and the user's queued write-behind ops, which
+    the page shows before they are committed.
+    """
+    def decorator(view):
+        def scope_names(kwargs):
+            return (page_cache.GLOBAL_SCOPE, *[scope.format(**kwargs) for scope in scopes])
+
+        def modified(request, **kwargs):
+            if not hasattr(request, '_page_last_modified'):
+                last_modified = freshness(**kwargs)
+                if last_modified is not None:
+                    bumped = page_cache.last_bumped(*scope_names(kwargs))
+                    last_modified = max(last_modified, datetime.datetime.fromtimestamp(bumped, datetime.timezone.utc))
+                request._page_last_modified = last_modified
+            return request._page_last_modified
+
+        def etag(request, *args, **kwargs):
+            last_modified = modified(request, **kwargs)
+            if last_modified is None:
+                return None
+            generations = page_cache.get_generations(*scope_names(kwargs))
+            pending = ''
+            if request.user.is_authenticated and write_behind.enabled():
+                pending = ','.join(op['token'] for op in write_behind.pending(request.user.pk))
+            key = f'{last_modified.timestamp():.6f}:{sorted(generations.items())}:{request.user.pk}:{pending}'
+            return hashlib.md5(key.encode()).hexdigest()
+
+        def last_modified(request, *args, **kwargs):
+            # Dates alone cannot tell a logged in visitor's copy from the anonymous one
+            if request.user.is_authenticated:
+                return None
+            return modified(request, **kwargs)
+
+        conditional_view = condition(etag_func=etag, last_modified_func=last_modified)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
+
+
+def post_modified(username, post_id, **kwargs):
+    """Edits and comments both move Post.updated_at."""
+    return Post.objects.filter(pk=post_id, author__username=username)\
+        .values_list('updated_at', flat=True).first()
+
+
+def _newest(queryset, created_field):
+    """The later of created_field and the newest pub_date of the related posts, served by the post indexes."""
+    row = queryset.annotate(newest=Max('posts__pub_date')).values_list(created_field, 'newest').first()
+    if row is None:
+        return None
+    return max(value for value in row if value is not None)
+
+
+def profile_modified(username, **kwargs):
+    return _newest(User.objects.filter(username=username), 'date_joined')
+
+
+def group_modified(slug, **kwargs):
+    return _newest(Group.objects.filter(slug=slug), 'updated_at')
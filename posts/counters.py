@@ -0,0 +1,79 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.contrib.auth import get_user_model
+from .models import Post, Comment, Follow, UserStats
+
+User = get_user_model()
+
+
+def _bump(queryset, field, delta):
+    """Atomically add delta to field on every row of queryset, never going below zero."""
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def bump_comments(post_id, delta):
+    """Change the comment counter, the card version and the modification time of the post in a single UPDATE."""
+    posts = Post.objects.filter(pk=post_id)
+    if delta < 0:
+        posts = posts.filter(comments_count__gte=-delta)
+    posts.update(comments_count=F('comments_count') + delta, version=F('version') + 1, updated_at=timezone.now())
+
+
+def bump_user_stats(user_id, field, delta):
+    updated = _bump(UserStats.objects.filter(pk=user_id), field, delta)
+    if not updated and delta > 0:
+        # The row is missing (user created before counters existed) - build it from scratch.
+        recount_user_stats(user_ids=[user_id])
+
+
+def _count(model, field):
+    rows = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    return Coalesce(Subquery(rows.annotate(total=Count('pk')).values('total'), output_field=IntegerField()), 0)
+
+
+def recount_comments(post_ids=None, dry_run=False):
+    """Repair Post.comments_count, return the number of drifted rows."""
+    posts = Post.objects.all()
+    if post_ids is not None:
+        posts = posts.filter(pk__in=post_ids)
+    drifted = posts.annotate(real=_count(Comment, 'post')).exclude(comments_count=F('real'))
+    fixed = 0
+    for pk, real in drifted.values_list('pk', 'real').iterator():
+        if not dry_run:
+            Post.objects.filter(pk=pk).update(comments_count=real)
+        fixed += 1
+    return fixed
+
+
+def recount_user_stats(user_ids=None, dry_run=False):
+    """Create missing UserStats rows and repair drifted ones, return the number of touched rows."""
+    users = User.objects.filter(stats__isnull=True)
+    if user_ids is not None:
+        users = users.filter(pk__in=user_ids)
+    missing = list(users.values_list('pk', flat=True))
+    if not dry_run:
+        UserStats.objects.bulk_create([UserStats(user_id=pk) for pk in missing], ignore_conflicts=True)
+
+    stats = UserStats.objects.all()
+    if user_ids is not None:
+        stats = stats.filter(pk__in=user_ids)
+    drifted = stats.annotate(
+        real_posts=_count(Post, 'author'),
+        real_followers=_count(Follow, 'author'),
+        real_following=_count(Follow, 'user'),
+    ).exclude(
+        posts_count=F('real_posts'),
+        followers_count=F('real_followers'),
+        following_count=F('real_following'),
+    )
+    fixed = 0
+    for pk, posts, followers, following in drifted.values_list(
+            'pk', 'real_posts', 'real_followers', 'real_following').iterator():
+        if not dry_run:
+            UserStats.objects.filter(pk=pk).update(posts_count=posts, followers_count=followers,
+                                                   following_count=following)
+        fixed += 1
+    return len(missing) + fixed
@@ -0,0 +1,169 @@
+"""
+Soft delete with a chunked background purge.
+
+Deleting a post or a user only hides it: the post gets is_deleted (Post.objects, which every feed reads,
+skips it), the user loses is_active and all of their posts are flagged, and the counters are fixed in a few
+UPDATEs. A DeletionJob then removes the related rows DELETION_BATCH_SIZE at a time, each batch in its own
+short transaction, instead of the one long CASCADE transaction that would lock SQLite for seconds.
+Post jobs start in the background right away; the purge_deleted command works off the rest.
+"""
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from .models import (Comment, DeletionJob, FeedEntry, Follow, Post, PostActivity, Recommendation,
+                     StaleRecommendation, TrendingPost, UserStats)
+from . import counters, page_cache, search, thumbnails
+from .tasks import defer
+
+User = get_user_model()
+
+_state = threading.local()
+
+
+@contextmanager
+def purging():
+    """Signal handlers skip the per-row bookkeeping (counters, caches) that the purge does in bulk."""
+    _state.purging = True
+    try:
+        yield
+    finally:
+        _state.purging = False
+
+
+def is_purging():
+    return getattr(_state, 'purging', False)
+
+
+def delete_post(post):
+    """Hide post right away and queue the purge of its comments and feed entries."""
+    with transaction.atomic():
+        if not Post.objects.filter(pk=post.pk).update(is_deleted=True, version=F('version') + 1):
+            return None
+        counters.bump_user_stats(post.author_id, 'posts_count', -1)
+        search.unindex_post(post.pk, post.text)
+        TrendingPost.objects.filter(post_id=post.pk).delete()
+        job = DeletionJob.objects.create(kind=DeletionJob.POST, object_id=post.pk,
+                                         description=f'Post {post.pk} by {post.author.username}')
+    page_cache.bump(*page_cache.post_scopes(post))
+    defer(run_job, job.pk)
+    return job
+
+
+def delete_user(user):
+    """Deactivate user, hide all of their posts and take their follows out of the counters; purge later."""
+    pending = DeletionJob.objects.filter(kind=DeletionJob.USER, object_id=user.pk, finished_date=None).first()
+    if pending is not None:
+        return pending
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=['is_active'])
+        # Only live posts are in the search index (rebuild skips hidden ones), each leaves it exactly once here
+        search.unindex_posts(list(Post.objects.filter(author=user).values_list('pk', 'text')))
+        Post.objects.filter(author=user).update(is_deleted=True)
+        followers = Follow.objects.filter(author=user).values('user_id')
+        UserStats.objects.filter(pk__in=followers, following_count__gt=0)\
+            .update(following_count=F('following_count') - 1)
+        following = Follow.objects.filter(user=user).values('author_id')
+        UserStats.objects.filter(pk__in=following, followers_count__gt=0)\
+            .update(followers_count=F('followers_count') - 1)
+        UserStats.objects.filter(pk=user.pk).update(posts_count=0, followers_count=0, following_count=0)
+        job = DeletionJob.objects.create(kind=DeletionJob.USER, object_id=user.pk,
+                                         description=f'User {user.username}')
+    # Their posts and comments may be on any cached page
+    page_cache.bump(page_cache.GLOBAL_SCOPE)
+    return job
+
+
+def _release_posts(posts):
+    # The posts left the search index when they were hidden
+    for image in posts.exclude(image='').exclude(image=None).values_list('image', flat=True):
+        defer(thumbnails.release_image, image)
+
+
+def _uncount_comments(comments):
+    for post_id, total in Counter(comments.values_list('post_id', flat=True)).items():
+        counters.bump_comments(post_id, -total)
+
+
+def _steps(job):
+    """[(queryset, hook run on each batch before it is deleted)] in an order that leaves no big cascade."""
+    pk = job.object_id
+    if job.kind == DeletionJob.POST:
+        return [
+            (FeedEntry.objects.filter(post_id=pk), None),
+            (Comment.objects.filter(post_id=pk), None),
+            (PostActivity.objects.filter(post_id=pk), None),
+            (Post.all_objects.filter(pk=pk), _release_posts),
+        ]
+    return [
+        (FeedEntry.objects.filter(author_id=pk), None),
+        (FeedEntry.objects.filter(user_id=pk), None),
+        (Comment.objects.filter(post__author_id=pk), None),
+        (Comment.objects.filter(author_id=pk), _uncount_comments),
+        (Follow.objects.filter(Q(user_id=pk) | Q(author_id=pk)), None),
+        (Recommendation.objects.filter(Q(user_id=pk) | Q(suggested_id=pk)), None),
+        (StaleRecommendation.objects.filter(user_id=pk), None),
+        (PostActivity.objects.filter(post__author_id=pk), None),
+        (Post.all_objects.filter(author_id=pk), _release_posts),
+        (User.objects.filter(pk=pk), None),
+    ]
+
+
+def _lease():
+    return timezone.now() + timedelta(seconds=settings.DELETION_JOB_LEASE)
+
+
+def claim_job(job_id=None):
+    """Lease one unfinished job (job_id or the oldest), None if there is none or it is taken."""
+    now = timezone.now()
+    jobs = DeletionJob.objects.filter(Q(locked_until__isnull=True) | Q(locked_until__lt=now), finished_date=None)
+    if job_id is not None:
+        jobs = jobs.filter(pk=job_id)
+    pk = jobs.order_by('pk').values_list('pk', flat=True).first()
+    lease = _lease()
+    if pk is None or not jobs.filter(pk=pk).update(locked_until=lease):
+        return None
+    return DeletionJob.objects.get(pk=pk)
+
+
+def purge(job, batch_size=None):
+    """Delete the rows of a claimed job batch by batch, yield the job after every batch."""
+    batch_size = batch_size or settings.DELETION_BATCH_SIZE
+    steps = _steps(job)
+    # Rows purged by an interrupted earlier run are already counted in job.deleted
+    job.total = job.deleted + sum(queryset.count() for queryset, hook in steps)
+    DeletionJob.objects.filter(pk=job.pk).update(total=job.total)
+    with purging():
+        for queryset, hook in steps:
+            while True:
+                with transaction.atomic():
+                    ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+                    if not ids:
+                        break
+                    batch = queryset.model._base_manager.filter(pk__in=ids)
+                    if hook is not None:
+                        hook(batch)
+                    batch.delete()
+                    job.deleted += len(ids)
+                    DeletionJob.objects.filter(pk=job.pk).update(deleted=job.deleted, locked_until=_lease())
+                yield job
+    job.finished_date = timezone.now()
+    DeletionJob.objects.filter(pk=job.pk).update(finished_date=job.finished_date, locked_until=None)
+    page_cache.bump(page_cache.GLOBAL_SCOPE)
+    yield job
+
+
+def run_job(job_id=None, batch_size=None):
+    """Claim and purge one job to the end, return it (None when there was nothing to claim)."""
+    job = claim_job(job_id)
+    if job is not None:
+        for job in purge(job, batch_size):
+            pass
+    return job
@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db.models import Q
+from .models import Post, Follow, FeedEntry, UserStats
+
+
+def pull_author_ids(user):
+    """Followed authors with too many followers to fan out to, their posts are pulled on read."""
+    return list(Follow.objects.filter(user=user, author__stats__followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS)
+                .values_list('author_id', flat=True))
+
+
+def _is_pull_author(author_id):
+    return UserStats.objects.filter(pk=author_id, followers_count__gte=settings.FEED_FANOUT_MAX_FOLLOWERS).exists()
+
+
+def fan_out_post(post_id):
+    """Push a new post into its author's followers' feeds, one bounded batch of followers at a time."""
+    post = Post.objects.filter(pk=post_id).values('author_id', 'pub_date').first()
+    if post is None or _is_pull_author(post['author_id']):
+        return
+    followers = Follow.objects.filter(author_id=post['author_id']).order_by('user_id')
+    last_user_id = 0
+    while True:
+        batch = list(followers.filter(user_id__gt=last_user_id)
+                     .values_list('user_id', flat=True)[:settings.FEED_FANOUT_BATCH_SIZE])
+        if not batch:
+            break
+        FeedEntry.objects.bulk_create(
+            [FeedEntry(user_id=user_id, post_id=post_id, author_id=post['author_id'], pub_date=post['pub_date'])
+             for user_id in batch],
+            ignore_conflicts=True,
+        )
+        last_user_id = batch[-1]
+
+
+def backfill(user_id, author_id):
+    """Copy the author's recent posts into the feed of a new follower."""
+    if _is_pull_author(author_id):
+        return
+    posts = Post.objects.filter(author_id=author_id).order_by('-pub_date', '-id')
+    FeedEntry.objects.bulk_create(
+        [FeedEntry(user_id=user_id, post_id=post_id, author_id=author_id, pub_date=pub_date)
+         for post_id, pub_date in posts.values_list('id', 'pub_date')[:settings.FEED_BACKFILL_SIZE]],
+        ignore_conflicts=True,
+    )
+
+
+def remove(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def feed_queryset(user):
+    """
+    FeedEntry rows of the user (an indexed range scan), or, when the user follows pull authors,
+    a Post queryset merging the materialized entries with those authors' posts.
+    """
+    pull_authors = pull_author_ids(user)
+    if not pull_authors:
+        return FeedEntry.objects.filter(user=user, post__is_deleted=False).select_related('post__author', 'post__group')
+    materialized = FeedEntry.objects.filter(user=user).values('post_id')
+    return Post.objects.filter(Q(pk__in=materialized) | Q(author_id__in=pull_authors))\
+        .select_related('author', 'group')
@@ -0,0 +1,67 @@
+import multiprocessing
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', None),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', 'file-cache'),
+    'sqlite': ('yatube.sqlite_cache.SQLiteCache', 'cache.sqlite3'),
+}
+
+
+def _worker(args):
+    backend, location, options = args
+    cache = import_string(backend)(location, {'OPTIONS': {'MAX_ENTRIES': options['keys'] * 2}})
+    rng = random.Random()
+    payload = 'x' * options['value_size']
+    hits = misses = 0
+    started = time.perf_counter()
+    for _ in range(options['operations']):
+        # Skewed key popularity, like feed pages and post cards
+        key = f'key:{int(rng.paretovariate(1.2)) % options["keys"]}'
+        roll = rng.random()
+        if roll < 0.05:
+            try:
+                cache.incr('generation')
+            except ValueError:
+                cache.add('generation', 1)
+        elif roll < 0.15:
+            cache.get_many([f'{key}:{i}' for i in range(10)])
+        elif cache.get(key) is None:
+            misses += 1
+            cache.set(key, payload, 300)
+        else:
+            hits += 1
+    return hits, misses, time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = 'Compare cache backends under multiprocess load'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--operations', type=int, default=5000, help='Operations per process')
+        parser.add_argument('--keys', type=int, default=2000)
+        parser.add_argument('--value-size', type=int, default=4096)
+        parser.add_argument('--backend', action='append', choices=sorted(BACKENDS), dest='backends')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'{"backend":<8} {"ops/sec":>10} {"hit rate":>9}')
+        context = multiprocessing.get_context('fork')
+        for name in options['backends'] or BACKENDS:
+            backend, location = BACKENDS[name]
+            with tempfile.TemporaryDirectory() as directory:
+                location = f'{directory}/{location}' if location else name
+                jobs = [(backend, location, options)] * options['processes']
+                started = time.perf_counter()
+                with context.Pool(options['processes']) as pool:
+                    results = pool.map(_worker, jobs)
+                elapsed = time.perf_counter() - started
+            hits = sum(result[0] for result in results)
+            misses = sum(result[1] for result in results)
+            total = options['operations'] * options['processes']
+            self.stdout.write(f'{name:<8} {total / elapsed:>10.0f} {hits / max(hits + misses, 1):>9.1%}')
@@ -0,0 +1,136 @@
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection, OperationalError
+from django.test import override_settings
+from posts import write_behind
+from posts.management.commands.benchmark_views import percentile
+from posts.models import Group, Post, Comment
+
+User = get_user_model()
+
+MODES = {
+    'default': {'journal_mode': 'DELETE'},
+    'production': dict(settings.SQLITE_PRAGMAS, journal_mode='WAL'),
+}
+
+
+class Command(BaseCommand):
+    help = 'Hammer a throwaway SQLite file with concurrent feed reads and comment writes, per pragma profile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5, help='Seconds per profile')
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--posts', type=int, default=2000)
+        parser.add_argument('--mode', action='append', choices=MODES, dest='modes')
+        parser.add_argument('--write-behind', action='store_true',
+                            help='Also run the production profile with comments going through the write-behind queue')
+
+    def handle(self, *args, **options):
+        results = {}
+        with override_settings(TASKS_EAGER=True, DEBUG=False):
+            for mode in options['modes'] or MODES:
+                with self._file_database(MODES[mode]):
+                    cache.clear()
+                    self.seed(options['posts'])
+                    results[mode] = self.run(options)
+        if options['write_behind']:
+            with override_settings(TASKS_EAGER=False, WRITE_BEHIND=True, DEBUG=False), \
+                    self._file_database(MODES['production']):
+                cache.clear()
+                self.seed(options['posts'])
+                results['write-behind'] = self.run(options, queued=True)
+        self.stdout.write(f'{"profile":<12} {"reads/s":>8} {"writes/s":>9} {"read p95":>9} {"write p95":>10} '
+                          f'{"locked":>7}')
+        for mode, result in results.items():
+            self.stdout.write(f'{mode:<12} {result["reads"]:>8.0f} {result["writes"]:>9.0f} '
+                              f'{result["read_p95"]:>7.1f}ms {result["write_p95"]:>8.1f}ms {result["locked"]:>7}')
+
+    @contextmanager
+    def _file_database(self, pragmas):
+        """A migrated database in a temporary file (the regular test database lives in memory)."""
+        settings_dict = connection.settings_dict
+        saved = settings_dict['NAME'], dict(settings_dict['TEST']), settings_dict.get('PRAGMAS')
+        settings_dict['TEST']['NAME'] = os.path.join(tempfile.gettempdir(), f'yatube-bench-{uuid.uuid4().hex}.sqlite3')
+        settings_dict['PRAGMAS'] = pragmas
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(saved[0], verbosity=0)
+            settings_dict['TEST'] = saved[1]
+            if saved[2] is None:
+                settings_dict.pop('PRAGMAS')
+            else:
+                settings_dict['PRAGMAS'] = saved[2]
+
+    def seed(self, posts):
+        rng = random.Random(0)
+        User.objects.bulk_create([User(username=f'bench_{i}') for i in range(20)])
+        Group.objects.create(title='Bench', slug='bench', description='')
+        user_ids = list(User.objects.values_list('pk', flat=True))
+        Post.objects.bulk_create([Post(text=f'Benchmark post {i}', author_id=rng.choice(user_ids))
+                                  for i in range(posts)])
+        self.user_ids = user_ids
+        self.post_ids = list(Post.objects.values_list('pk', flat=True))
+
+    def worker(self, seed, deadline, write_ratio, stats, queued):
+        rng = random.Random(seed)
+        reads, writes, locked = [], [], 0
+        try:
+            while time.monotonic() < deadline:
+                write = rng.random() < write_ratio
+                started = time.perf_counter()
+                try:
+                    if write and queued:
+                        write_behind.submit('comment', rng.choice(self.user_ids), post_id=rng.choice(self.post_ids),
+                                            text='Benchmark comment')
+                    elif write:
+                        Comment.objects.create(post_id=rng.choice(self.post_ids), author_id=rng.choice(self.user_ids),
+                                               text='Benchmark comment')
+                    else:
+                        list(Post.objects.select_related('author', 'group').order_by('-pub_date', '-id')[:10])
+                except OperationalError:
+                    locked += 1
+                    continue
+                (writes if write else reads).append((time.perf_counter() - started) * 1000)
+        finally:
+            connection.close()
+        with stats['lock']:
+            stats['reads'] += reads
+            stats['writes'] += writes
+            stats['locked'] += locked
+
+    def run(self, options, queued=False):
+        stats = {'lock': threading.Lock(), 'reads': [], 'writes': [], 'locked': 0}
+        started = time.monotonic()
+        deadline = started + options['duration']
+        threads = [threading.Thread(target=self.worker,
+                                    args=(number, deadline, options['write_ratio'], stats, queued))
+                   for number in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if queued:
+            # Throughput counts only what reached the database, including the tail still in the queue
+            write_behind.drain()
+            write_behind.shutdown()
+        elapsed = time.monotonic() - started
+        return {
+            'reads': len(stats['reads']) / options['duration'],
+            'writes': Comment.objects.count() / elapsed,
+            'read_p95': percentile(stats['reads'], 0.95) if stats['reads'] else 0,
+            'write_p95': percentile(stats['writes'], 0.95) if stats['writes'] else 0,
+            'locked': stats['locked'],
+        }
@@ -0,0 +1,213 @@
+import io
+import json
+import random
+import time
+import tracemalloc
+import uuid
+from contextlib import contextmanager
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from posts.models import Group, Post, Comment, Follow
+from yatube.metrics import execute_wrapper
+
+User = get_user_model()
+
+ROUTES = ('index', 'group', 'profile', 'post', 'follow_index', 'add_comment', 'new_post')
+
+
+@contextmanager
+def benchmark_database(in_place):
+    """Run against a throwaway test database unless in_place is set."""
+    if in_place:
+        yield
+        return
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+def consume(response, started):
+    """Read the whole response like a WSGI server would, return the time to its first byte in ms."""
+    if not response.streaming:
+        return (time.perf_counter() - started) * 1000
+    ttfb = None
+    for _ in response.streaming_content:
+        if ttfb is None:
+            ttfb = (time.perf_counter() - started) * 1000
+    response.close()
+    return ttfb if ttfb is not None else (time.perf_counter() - started) * 1000
+
+
+class QueryTimer:
+    """execute_wrapper counting queries and their time; queries_log rounds the time to the millisecond."""
+
+    def __init__(self):
+        self.queries, self.seconds = 0, 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.queries += 1
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * fraction), len(ordered) - 1)]
+
+
+class Command(BaseCommand):
+    help = 'Seed a dataset and report latency and SQL cost of every feed route'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=200)
+        parser.add_argument('--groups', type=int, default=10)
+        parser.add_argument('--posts', type=int, default=5000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=2000)
+        parser.add_argument('--requests', type=int, default=50, help='Requests per route')
+        parser.add_argument('--route', action='append', choices=ROUTES, dest='routes')
+        parser.add_argument('--anonymous', action='store_true', help='Measure read routes as an anonymous user')
+        parser.add_argument('--memory', action='store_true',
+                            help='Also report the peak memory allocated per request (slows requests down)')
+        parser.add_argument('--output', help='Write results to this JSON file')
+        parser.add_argument('--baseline', help='Compare with results of a previous run')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Allowed relative p95 slowdown')
+        parser.add_argument('--in-place', action='store_true',
+                            help='Use the configured database instead of a throwaway test database')
+
+    def handle(self, *args, **options):
+        with benchmark_database(options['in_place']), override_settings(TASKS_EAGER=True, DEBUG=False):
+            cache.clear()
+            started = time.perf_counter()
+            self.seed(options)
+            self.stdout.write(f'Seeded in {time.perf_counter() - started:.1f}s')
+            results = {
+                'created': timezone.now().isoformat(),
+                'volumes': {name: options[name] for name in ('users', 'groups', 'posts', 'comments', 'follows')},
+                'routes': {route: self.measure(route, options) for route in options['routes'] or ROUTES},
+            }
+        self.report(results['routes'])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(results, output, indent=2)
+        if options['baseline']:
+            self.compare(results['routes'], options['baseline'], options['threshold'])
+
+    def seed(self, options):
+        rng = random.Random(0)
+        password = make_password('benchmark')
+        prefix = f'bench{uuid.uuid4().hex[:8]}'
+        User.objects.bulk_create([User(username=f'{prefix}_{i}', password=password)
+                                  for i in range(options['users'])])
+        Group.objects.bulk_create([Group(title=f'Group {i}', slug=f'{prefix}-{i}', description='')
+                                   for i in range(options['groups'])])
+        user_ids = list(User.objects.filter(username__startswith=prefix).values_list('pk', flat=True))
+        group_ids = list(Group.objects.filter(slug__startswith=prefix).values_list('pk', flat=True))
+        Post.objects.bulk_create([
+            Post(text=f'Benchmark post {i} ' * 20, author_id=rng.choice(user_ids),
+                 group_id=rng.choice(group_ids) if group_ids and rng.random() < 0.5 else None)
+            for i in range(options['posts'])
+        ])
+        post_ids = list(Post.objects.filter(author__username__startswith=prefix).values_list('pk', flat=True))
+        if post_ids:
+            Comment.objects.bulk_create([
+                Comment(post_id=rng.choice(post_ids), author_id=rng.choice(user_ids), text=f'Comment {i}')
+                for i in range(options['comments'])
+            ])
+        pairs = {tuple(rng.sample(user_ids, 2)) for _ in range(options['follows'])} if len(user_ids) > 1 else set()
+        Follow.objects.bulk_create([Follow(user_id=user_id, author_id=author_id) for user_id, author_id in pairs],
+                                   ignore_conflicts=True)
+        # bulk_create skips signals, so derived data is rebuilt the same way as after an import
+        for command in ('recount_counters', 'rebuild_feed', 'rebuild_search_index', 'render_bodies'):
+            call_command(command, stdout=io.StringIO())
+        self.user_ids, self.group_ids, self.post_ids = user_ids, group_ids, post_ids
+
+    def _target(self, route, rng):
+        if route == 'group':
+            return reverse(route, kwargs={'slug': Group.objects.get(pk=rng.choice(self.group_ids)).slug}), None
+        if route == 'profile':
+            return reverse(route, kwargs={'username': User.objects.get(pk=rng.choice(self.user_ids)).username}), None
+        if route in ('post', 'add_comment'):
+            post = Post.objects.select_related('author').get(pk=rng.choice(self.post_ids))
+            kwargs = {'username': post.author.username, 'post_id': post.pk}
+            return reverse(route, kwargs=kwargs), {'text': 'Benchmark comment'} if route == 'add_comment' else None
+        if route == 'new_post':
+            return reverse(route), {'text': 'Benchmark post', 'group': rng.choice(self.group_ids)}
+        return reverse(route), None
+
+    def measure(self, route, options):
+        rng = random.Random(route)
+        client = Client()
+        if route in ('follow_index', 'add_comment', 'new_post') or not options['anonymous']:
+            client.force_login(User.objects.get(pk=rng.choice(self.user_ids)))
+        latencies, first_bytes, peaks, queries, sql_times = [], [], [], [], []
+        if options['memory']:
+            tracemalloc.start()
+        for _ in range(options['requests']):
+            url, data = self._target(route, rng)
+            if options['memory']:
+                tracemalloc.reset_peak()
+            timer = QueryTimer()
+            with execute_wrapper(timer):
+                started = time.perf_counter()
+                response = client.post(url, data) if data is not None else client.get(url)
+                first_bytes.append(consume(response, started))
+                latencies.append((time.perf_counter() - started) * 1000)
+            if options['memory']:
+                peaks.append(tracemalloc.get_traced_memory()[1] / 1024)
+            if response.status_code >= 400:
+                raise CommandError(f'{route} answered {response.status_code} for {url}')
+            queries.append(timer.queries)
+            sql_times.append(timer.seconds * 1000)
+        if options['memory']:
+            tracemalloc.stop()
+        return {
+            'ttfb_p95_ms': percentile(first_bytes, 0.95),
+            'peak_kb': max(peaks) if peaks else None,
+            'p50_ms': percentile(latencies, 0.5),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'queries': max(queries),
+            'sql_ms': sum(sql_times) / len(sql_times),
+        }
+
+    def report(self, routes):
+        self.stdout.write(f'{"route":<14} {"ttfb95":>8} {"p50 ms":>8} {"p95 ms":>8} {"p99 ms":>8} {"queries":>8} '
+                          f'{"sql ms":>8} {"peak kB":>8}')
+        for route, result in routes.items():
+            peak = f'{result["peak_kb"]:>8.0f}' if result['peak_kb'] is not None else f'{"-":>8}'
+            self.stdout.write(f'{route:<14} {result["ttfb_p95_ms"]:>8.1f} {result["p50_ms"]:>8.1f} '
+                              f'{result["p95_ms"]:>8.1f} {result["p99_ms"]:>8.1f} {result["queries"]:>8} '
+                              f'{result["sql_ms"]:>8.2f} {peak}')
+
+    def compare(self, routes, baseline_path, threshold):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)['routes']
+        regressions = []
+        for route, result in routes.items():
+            before = baseline.get(route)
+            if before is None:
+                continue
+            if result['queries'] > before['queries']:
+                regressions.append(f'{route}: {before["queries"]} -> {result["queries"]} queries')
+            if result['p95_ms'] > before['p95_ms'] * (1 + threshold):
+                regressions.append(f'{route}: p95 {before["p95_ms"]:.1f} -> {result["p95_ms"]:.1f} ms')
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(f'REGRESSION {regression}'))
+        if regressions:
+            raise CommandError(f'{len(regressions)} regressions against {baseline_path}')
+        self.stdout.write(self.style.SUCCESS(f'No regressions against {baseline_path}'))
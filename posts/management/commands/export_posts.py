@@ -0,0 +1,128 @@
+import datetime
+import json
+import os
+import tarfile
+import time
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.core.serializers.json import DjangoJSONEncoder
+from posts.models import Group, Post, Comment, Follow
+
+User = get_user_model()
+
+
+class ExportEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder drops microseconds, which would reorder posts sharing a millisecond."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+# Sections are written in dependency order, import_posts relies on it
+SECTIONS = (
+    ('user', User.objects.all(), {
+        'username': 'username', 'email': 'email', 'first_name': 'first_name', 'last_name': 'last_name',
+        'password': 'password', 'date_joined': 'date_joined', 'is_active': 'is_active',
+    }),
+    ('group', Group.objects.all(), {'slug': 'slug', 'title': 'title', 'description': 'description'}),
+    ('post', Post.objects.all(), {
+        'id': 'id', 'text': 'text', 'pub_date': 'pub_date', 'author': 'author__username', 'group': 'group__slug',
+        'image': 'image',
+    }),
+    # Only comments of the exported posts, not of hidden ones waiting for the purge
+    ('comment', Comment.objects.filter(post__is_deleted=False), {
+        'id': 'id', 'post': 'post_id', 'author': 'author__username', 'text': 'text', 'created_date': 'created_date',
+    }),
+    ('follow', Follow.objects.all(), {'user': 'user__username', 'author': 'author__username'}),
+)
+
+
+class Command(BaseCommand):
+    help = 'Stream users, groups, posts, comments and follows to a JSONL file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='JSONL file to write')
+        parser.add_argument('--images', help='Also pack post images into this tar archive')
+        parser.add_argument('--chunk-size', type=int, default=2000)
+        parser.add_argument('--checkpoint', help='Checkpoint file, an interrupted export resumes from it')
+
+    def handle(self, *args, **options):
+        checkpoint = self._load_checkpoint(options['checkpoint'])
+        if checkpoint:
+            # Rows and images written after the checkpoint are written again, and the last one may be torn
+            self._truncate(options['output'], checkpoint['output_offset'])
+            if options['images']:
+                self._truncate(options['images'], checkpoint['images_offset'], tarfile.NUL * tarfile.BLOCKSIZE * 2)
+        mode = 'a' if checkpoint else 'w'
+        output = open(options['output'], mode, encoding='utf-8')
+        images = tarfile.open(options['images'], mode) if options['images'] else None
+        started, rows = time.monotonic(), checkpoint.get('rows', 0)
+        try:
+            sections = [name for name, queryset, fields in SECTIONS]
+            first = sections.index(checkpoint['section']) if checkpoint else 0
+            for name, queryset, fields in SECTIONS[first:]:
+                last_pk = checkpoint.get('last_pk', 0) if checkpoint.get('section') == name else 0
+                for chunk_last_pk, count in self._export(name, queryset, fields, last_pk, output, images, options):
+                    rows += count
+                    self._save_checkpoint(options['checkpoint'], output, images,
+                                          {'section': name, 'last_pk': chunk_last_pk, 'rows': rows})
+                    self.stdout.write(f'{name}: {rows} rows, {rows / (time.monotonic() - started):.0f} rows/sec')
+        finally:
+            output.close()
+            if images:
+                images.close()
+        if options['checkpoint'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(f'Exported {rows} rows in {time.monotonic() - started:.1f}s'))
+
+    def _export(self, name, queryset, fields, last_pk, output, images, options):
+        """Write rows after last_pk, yield (last pk, rows) after every chunk."""
+        rows = queryset.filter(pk__gt=last_pk).order_by('pk').values('pk', *fields.values())
+        count = 0
+        for row in rows.iterator(chunk_size=options['chunk_size']):
+            record = {'model': name}
+            record.update({key: row[source] for key, source in fields.items()})
+            output.write(json.dumps(record, cls=ExportEncoder, ensure_ascii=False) + '\n')
+            if images is not None and record.get('image'):
+                path = os.path.join(settings.MEDIA_ROOT, record['image'])
+                if os.path.exists(path):
+                    images.add(path, arcname=record['image'])
+            count += 1
+            if count == options['chunk_size']:
+                yield row['pk'], count
+                count = 0
+            last_pk = row['pk']
+        if count:
+            yield last_pk, count
+
+    def _load_checkpoint(self, path):
+        if path and os.path.exists(path):
+            with open(path) as source:
+                return json.load(source)
+        return {}
+
+    def _truncate(self, path, offset, end=b''):
+        """Cut path back to offset; end is the end-of-archive marker tarfile needs to append."""
+        with open(path, 'r+b') as target:
+            target.truncate(offset)
+            target.seek(offset)
+            target.write(end)
+
+    def _save_checkpoint(self, path, output, images, state):
+        if not path:
+            return
+        output.flush()
+        os.fsync(output.fileno())
+        state['output_offset'] = os.fstat(output.fileno()).st_size
+        if images:
+            images.fileobj.flush()
+            os.fsync(images.fileobj.fileno())
+            # The end of the last complete member, the end-of-archive blocks are only written on close
+            state['images_offset'] = images.offset
+        with open(f'{path}.tmp', 'w') as target:
+            json.dump(state, target)
+        os.replace(f'{path}.tmp', path)
@@ -0,0 +1,167 @@
+import io
+import json
+import os
+import tarfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+from posts import page_cache
+from posts.models import Group, Post, Comment, Follow
+from posts.storage import CONTENT_ADDRESSED, image_storage
+
+User = get_user_model()
+
+
+@contextmanager
+def _keep_timestamps():
+    """Let bulk_create store exported dates instead of auto_now_add overwriting them with now."""
+    fields = [Post._meta.get_field('pub_date'), Comment._meta.get_field('created_date')]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Command(BaseCommand):
+    help = 'Load a JSONL file written by export_posts with batched bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='JSONL file to read')
+        parser.add_argument('--images', help='Tar archive with post images to unpack into MEDIA_ROOT')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per transaction')
+        parser.add_argument('--checkpoint', help='Checkpoint file, an interrupted import resumes from it')
+        parser.add_argument('--skip-rebuild', action='store_true',
+                            help='Do not recount counters and rebuild feeds, the search index and trending')
+
+    def handle(self, *args, **options):
+        if options['images']:
+            self._unpack_images(options['images'])
+        self.users, self.groups = {}, {}
+        done, self.offsets = self._load_checkpoint(options['checkpoint'])
+        started, line_number, imported = time.monotonic(), 0, 0
+        batch, model = [], None
+        with open(options['input'], encoding='utf-8') as source:
+            for line_number, line in enumerate(source, 1):
+                if line_number <= done:
+                    continue
+                record = json.loads(line)
+                if record['model'] != model or len(batch) >= options['batch_size']:
+                    imported += self._flush(model, batch, line_number - 1, options)
+                    batch, model = [], record['model']
+                batch.append(record)
+            imported += self._flush(model, batch, line_number, options)
+        if options['checkpoint'] and os.path.exists(options['checkpoint']):
+            os.remove(options['checkpoint'])
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} rows in {time.monotonic() - started:.1f}s'))
+
+        if not options['skip_rebuild']:
+            # bulk_create bypasses the signals maintaining derived data
+            for command in ('recount_counters', 'rebuild_feed', 'rebuild_search_index', 'render_bodies'):
+                call_command(command, stdout=self.stdout)
+            call_command('refresh_trending', rebuild=True, stdout=self.stdout)
+        page_cache.bump(page_cache.GLOBAL_SCOPE)
+
+    def _flush(self, model, batch, line_number, options):
+        if not batch:
+            return 0
+        started = time.monotonic()
+        with transaction.atomic(), _keep_timestamps():
+            objects = getattr(self, f'_build_{model}')(batch)
+            objects[0].__class__.objects.bulk_create(objects, ignore_conflicts=True)
+            if model == 'post':
+                self._count_images(objects)
+        # Replaying a batch after a crash right here is harmless, every section is unique on some key
+        self._save_checkpoint(options['checkpoint'], line_number)
+        elapsed = max(time.monotonic() - started, 1e-6)
+        self.stdout.write(f'{model}: {len(batch)} rows up to line {line_number}, {len(batch) / elapsed:.0f} rows/sec')
+        return len(batch)
+
+    def _count_images(self, posts):
+        """Reference the unpacked content-addressed images, migrate_images takes care of older names."""
+        for name, count in Counter(post.image.name for post in posts if post.image).items():
+            if CONTENT_ADDRESSED.fullmatch(name) and image_storage.exists(name):
+                image_storage.add_references(name, count)
+
+    def _resolve(self, mapping, model, field, keys):
+        """Fill mapping with ids of keys (usernames or slugs) not seen yet, one query per batch."""
+        missing = {key for key in keys if key and key not in mapping}
+        if missing:
+            mapping.update(model.objects.filter(**{f'{field}__in': missing}).values_list(field, 'pk'))
+        unknown = missing - set(mapping)
+        if unknown:
+            raise CommandError(f'Unknown {model.__name__} {field}: {", ".join(sorted(unknown)[:5])}')
+
+    def _build_user(self, batch):
+        return [User(username=record['username'], email=record['email'], first_name=record['first_name'],
+                     last_name=record['last_name'], password=record['password'], is_active=record['is_active'],
+                     date_joined=parse_datetime(record['date_joined'])) for record in batch]
+
+    def _build_group(self, batch):
+        return [Group(slug=record['slug'], title=record['title'], description=record['description'])
+                for record in batch]
+
+    def _build_post(self, batch):
+        self._resolve(self.users, User, 'username', [record['author'] for record in batch])
+        self._resolve(self.groups, Group, 'slug', [record['group'] for record in batch])
+        return [Post(id=record['id'] + self.offsets['post'], text=record['text'],
+                     pub_date=parse_datetime(record['pub_date']), author_id=self.users[record['author']],
+                     group_id=self.groups.get(record['group']), image=record['image'] or None)
+                for record in batch]
+
+    def _build_comment(self, batch):
+        self._resolve(self.users, User, 'username', [record['author'] for record in batch])
+        return [Comment(id=record['id'] + self.offsets['comment'], post_id=record['post'] + self.offsets['post'],
+                        author_id=self.users[record['author']],
+                        text=record['text'], created_date=parse_datetime(record['created_date']))
+                for record in batch]
+
+    def _build_follow(self, batch):
+        self._resolve(self.users, User, 'username', [record[key] for record in batch for key in ('user', 'author')])
+        return [Follow(user_id=self.users[record['user']], author_id=self.users[record['author']])
+                for record in batch]
+
+    def _unpack_images(self, path):
+        root = os.path.realpath(settings.MEDIA_ROOT)
+        with tarfile.open(path) as archive:
+            for member in archive:
+                target = os.path.realpath(os.path.join(root, member.name))
+                if not member.isfile() or not target.startswith(root + os.sep):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                with archive.extractfile(member) as source, open(target, 'wb') as output:
+                    while True:
+                        chunk = source.read(io.DEFAULT_BUFFER_SIZE * 16)
+                        if not chunk:
+                            break
+                        output.write(chunk)
+
+    def _load_checkpoint(self, path):
+        """(lines already imported, id offsets of posts and comments), the offsets of a resumed import are kept."""
+        if path and os.path.exists(path):
+            with open(path) as source:
+                state = json.load(source)
+            return state['line'], state.get('offsets', {'post': 0, 'comment': 0})
+        # Exported ids are shifted past every existing row, so a dump loaded into a non-empty database never
+        # lands on (or attaches comments to) existing posts; into an empty one the ids are kept as they were
+        offsets = {
+            'post': Post.all_objects.aggregate(last=Max('pk'))['last'] or 0,
+            'comment': Comment.objects.aggregate(last=Max('pk'))['last'] or 0,
+        }
+        return 0, offsets
+
+    def _save_checkpoint(self, path, line_number):
+        if path:
+            with open(f'{path}.tmp', 'w') as target:
+                json.dump({'line': line_number, 'offsets': self.offsets}, target)
+            os.replace(f'{path}.tmp', path)
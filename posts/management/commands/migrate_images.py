@@ -0,0 +1,82 @@
+import os
+
+from django.core.files import File
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from posts import cards, page_cache, thumbnails
+from posts.models import Post, ImageBlob
+from posts.storage import CONTENT_ADDRESSED, image_storage
+
+
+def _megabytes(size):
+    return f'{size / 1024 / 1024:.1f} MB'
+
+
+class Command(BaseCommand):
+    help = 'Move post images stored before content-addressed storage into it and report the space saved'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-originals', action='store_true', help='Do not delete the migrated files')
+
+    def handle(self, *args, **options):
+        # Soft-deleted posts keep their image until they are purged
+        legacy = Post.all_objects.exclude(image='').exclude(image__isnull=True)\
+            .exclude(image__in=ImageBlob.objects.values('name'))\
+            .order_by('image').values_list('image', flat=True).distinct()
+        before, migrated, registered, stored = 0, 0, 0, set()
+        for old_name in legacy.iterator():
+            path = image_storage.path(old_name)
+            if not os.path.exists(path):
+                self.stderr.write(f'{old_name}: file is missing, skipped')
+                continue
+            if CONTENT_ADDRESSED.fullmatch(old_name):
+                # Already stored under its digest (e.g. unpacked by an import), only the blob row is missing
+                image_storage.add_references(old_name, Post.all_objects.filter(image=old_name).count())
+                registered += 1
+                continue
+            size = os.path.getsize(path)
+            try:
+                with open(path, 'rb') as source:
+                    new_name = image_storage.save(old_name, File(source))
+            except Exception as error:
+                self.stderr.write(f'{old_name}: {error}, skipped')
+                continue
+            with transaction.atomic():
+                moved = Post.all_objects.filter(image=old_name).update(image=new_name)
+                # save() counted a single reference for all the posts sharing the file
+                ImageBlob.objects.filter(name=new_name).update(refcount=F('refcount') + moved - 1)
+            # Never remove the file the posts now point to
+            if not options['keep_originals'] and new_name != old_name:
+                os.remove(path)
+            thumbnails.enqueue(Post(image=new_name).image)
+            before += size
+            migrated += 1
+            stored.add(new_name)
+
+        repaired = self._recount()
+        if migrated:
+            cards.bump_versions(Post.objects.filter(image__in=stored))
+            page_cache.bump(page_cache.GLOBAL_SCOPE)
+        # An empty name__in short-circuits the query, aggregate() then gives None
+        after = ImageBlob.objects.filter(name__in=stored).aggregate(total=Sum('size'))['total'] or 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Migrated {migrated} images into {len(stored)} files: {_megabytes(before)} -> {_megabytes(after)}, '
+            f'saved {_megabytes(before - after)}; registered {registered} stored images, '
+            f'repaired {repaired} reference counts'
+        ))
+
+    def _recount(self):
+        """Set every refcount to the number of posts using the blob and release unused blobs."""
+        references = Post.all_objects.filter(image=OuterRef('name')).order_by().values('image')\
+            .annotate(total=Count('pk')).values('total')
+        actual = Coalesce(Subquery(references), 0)
+        drifted = ImageBlob.objects.annotate(actual=actual).exclude(refcount=F('actual'))
+        repaired = 0
+        for blob in drifted.iterator():
+            repaired += 1
+            ImageBlob.objects.filter(pk=blob.pk).update(refcount=blob.actual)
+            if not blob.actual:
+                thumbnails.release_image(blob.name)
+        return repaired
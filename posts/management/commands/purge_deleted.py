@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from posts import deletion
+
+
+class Command(BaseCommand):
+    help = 'Purge soft-deleted posts and users in short batches, reporting progress as it goes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Rows per transaction, DELETION_BATCH_SIZE by default')
+        parser.add_argument('--poll-interval', type=float, default=5.0)
+        parser.add_argument('--once', action='store_true', help='Exit when there is nothing left to purge')
+
+    def handle(self, *args, **options):
+        while True:
+            job = deletion.claim_job()
+            if job is None:
+                if options['once']:
+                    break
+                time.sleep(options['poll_interval'])
+                continue
+            for job in deletion.purge(job, options['batch_size']):
+                self.stdout.write(f'{job}: {job.deleted} of {job.total} rows', ending='\r')
+            self.stdout.write(self.style.SUCCESS(f'{job}: purged {job.deleted} rows'))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from posts import feed
+from posts.models import Follow, FeedEntry
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized follow feeds from the Follow table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', dest='usernames', action='append', help='Only rebuild feeds of these users')
+
+    def handle(self, *args, **options):
+        follows = Follow.objects.order_by('pk')
+        entries = FeedEntry.objects.all()
+        if options['usernames']:
+            follows = follows.filter(user__username__in=options['usernames'])
+            entries = entries.filter(user__username__in=options['usernames'])
+        entries.delete()
+        rebuilt = 0
+        for user_id, author_id in follows.values_list('user_id', 'author_id').iterator():
+            feed.backfill(user_id, author_id)
+            rebuilt += 1
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt feed entries for {rebuilt} follows'))
@@ -0,0 +1,21 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from posts import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index of posts in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=search.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not search.is_available():
+            raise CommandError('Full-text search requires the SQLite database backend')
+        started = time.monotonic()
+        indexed = 0
+        for indexed in search.rebuild(options['batch_size']):
+            self.stdout.write(f'Indexed {indexed} posts', ending='\r')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts in {elapsed:.1f}s'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from posts.counters import recount_comments, recount_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized comment, post and follower counters and repair drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Only report drifted rows')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        posts = recount_comments(dry_run=dry_run)
+        users = recount_user_stats(dry_run=dry_run)
+        verb = 'Found' if dry_run else 'Repaired'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {posts} post counters and {users} user counters'))
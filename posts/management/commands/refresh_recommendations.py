@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from posts import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Recompute "who to follow" suggestions of users whose follows changed since the last run'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recompute every user, e.g. nightly')
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        refreshed = 0
+        for refreshed in recommendations.refresh(full=options['full'], batch_size=options['batch_size']):
+            self.stdout.write(f'Refreshed {refreshed} users', ending='\r')
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Refreshed {refreshed} users in {elapsed:.1f}s'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = 'Decay the hourly activity buckets into the trending posts and groups, run it every few minutes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help='Recount the buckets of the whole window from comments and posts first')
+
+    def handle(self, *args, **options):
+        posts, groups = trending.rebuild() if options['rebuild'] else trending.refresh()
+        self.stdout.write(self.style.SUCCESS(f'Trending: {posts} posts, {groups} groups'))
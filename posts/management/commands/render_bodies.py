@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+from posts import page_cache, rendering
+from posts.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Render post and comment bodies stored by an older renderer (or never rendered) to HTML'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        total = 0
+        for model in (Post, Comment):
+            rendered = 0
+            for rendered in rendering.render_stale(model, options['batch_size']):
+                self.stdout.write(f'{model.__name__}: rendered {rendered}', ending='\r')
+            self.stdout.write(f'{model.__name__}: rendered {rendered}')
+            total += rendered
+        if total:
+            page_cache.bump(page_cache.GLOBAL_SCOPE)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'Rendered {total} bodies in {elapsed:.1f}s'))
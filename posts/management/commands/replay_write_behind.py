@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from posts import write_behind
+
+
+class Command(BaseCommand):
+    help = 'Commit comments and follows spilled to disk by the write-behind queue on shutdown'
+
+    def handle(self, *args, **options):
+        replayed = write_behind.replay_spill()
+        self.stdout.write(self.style.SUCCESS(f'Replayed {replayed} writes'))
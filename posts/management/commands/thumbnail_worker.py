@@ -0,0 +1,46 @@
+import multiprocessing
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from posts import thumbnails
+
+
+def _close_connections():
+    # Forked workers must not share the parent's database connections
+    connections.close_all()
+
+
+class Command(BaseCommand):
+    help = 'Drain the thumbnail job queue with a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=multiprocessing.cpu_count(),
+                            help='Size of the worker pool, 0 renders in this process')
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument('--poll-interval', type=float, default=2.0)
+        parser.add_argument('--once', action='store_true', help='Exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        pool = None
+        if options['processes']:
+            _close_connections()
+            pool = multiprocessing.get_context('fork').Pool(options['processes'], initializer=_close_connections)
+        try:
+            while True:
+                jobs = thumbnails.claim_jobs(options['batch_size'])
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+                    continue
+                names = [job.image for job in jobs]
+                errors = pool.map(thumbnails.generate, names) if pool else list(map(thumbnails.generate, names))
+                for job, error in zip(jobs, errors):
+                    thumbnails.finish_job(job, error)
+                failed = sum(error is not None for error in errors)
+                self.stdout.write(f'Rendered {len(jobs) - failed} images, {failed} failed')
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
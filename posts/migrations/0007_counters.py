@@ -0,0 +1,56 @@
+# Generated by Django 2.2.9 on 2026-10-18 17:34
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Follow = apps.get_model('posts', 'Follow')
+    UserStats = apps.get_model('posts', 'UserStats')
+
+    def count(model, field):
+        rows = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field)
+        return Coalesce(Subquery(rows.annotate(total=Count('pk')).values('total')), 0)
+
+    UserStats.objects.bulk_create([UserStats(user_id=pk) for pk in User.objects.values_list('pk', flat=True)])
+    Post.objects.update(comments_count=count(Comment, 'post'))
+    UserStats.objects.update(posts_count=count(Post, 'author'),
+                             followers_count=count(Follow, 'author'),
+                             following_count=count(Follow, 'user'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0011_update_proxy_permissions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0006_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='User')),
+                ('posts_count', models.PositiveIntegerField(default=0, verbose_name='Posts count')),
+                ('followers_count', models.PositiveIntegerField(default=0, verbose_name='Followers count')),
+                ('following_count', models.PositiveIntegerField(default=0, verbose_name='Following count')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Comments count'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='follow',
+            unique_together={('user', 'author')},
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
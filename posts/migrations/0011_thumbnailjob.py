@@ -0,0 +1,23 @@
+# Generated by Django 2.2.9 on 2026-10-18 17:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0010_post_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ThumbnailJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image', models.CharField(max_length=255, unique=True, verbose_name='Image')),
+                ('created_date', models.DateTimeField(auto_now_add=True, verbose_name='Created date')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Attempts')),
+                ('locked_until', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Locked until')),
+            ],
+        ),
+    ]
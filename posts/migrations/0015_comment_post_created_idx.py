@@ -0,0 +1,17 @@
+# Generated by Django 2.2.9 on 2026-10-18 17:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_imageblob'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['post', 'created_date', 'id'], name='comment_post_created_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+# Generated by Django 2.2.9 on 2026-10-18 18:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingPost',
+            fields=[
+                ('rank', models.PositiveSmallIntegerField(primary_key=True, serialize=False, verbose_name='Rank')),
+                ('score', models.FloatField(verbose_name='Score')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Post', verbose_name='Post')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TrendingGroup',
+            fields=[
+                ('rank', models.PositiveSmallIntegerField(primary_key=True, serialize=False, verbose_name='Rank')),
+                ('score', models.FloatField(verbose_name='Score')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Group', verbose_name='Group')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PostActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True, verbose_name='Hour')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Count')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Post', verbose_name='Post')),
+            ],
+            options={
+                'unique_together': {('post', 'hour')},
+            },
+        ),
+        migrations.CreateModel(
+            name='GroupActivity',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hour', models.DateTimeField(db_index=True, verbose_name='Hour')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Count')),
+                ('group', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='posts.Group', verbose_name='Group')),
+            ],
+            options={
+                'unique_together': {('group', 'hour')},
+            },
+        ),
+    ]
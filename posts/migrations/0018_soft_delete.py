@@ -0,0 +1,32 @@
+# Generated by Django 2.2.9 on 2026-10-18 18:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0017_trending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeletionJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('post', 'Post'), ('user', 'User')], max_length=8, verbose_name='Kind')),
+                ('object_id', models.PositiveIntegerField(verbose_name='Object id')),
+                ('description', models.CharField(max_length=200, verbose_name='Description')),
+                ('created_date', models.DateTimeField(auto_now_add=True, verbose_name='Created date')),
+                ('finished_date', models.DateTimeField(blank=True, null=True, verbose_name='Finished date')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Rows to delete')),
+                ('deleted', models.PositiveIntegerField(default=0, verbose_name='Rows deleted')),
+                ('locked_until', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Locked until')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='is_deleted',
+            field=models.BooleanField(default=False, editable=False, verbose_name='Deleted'),
+        ),
+    ]
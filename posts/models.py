@@ -1,22 +1,47 @@
 from django.db import models
 from django.contrib.auth import get_user_model
+from .storage import image_storage
 
 User = get_user_model()
 
 
+class LivePostManager(models.Manager):
+    """Posts not waiting for the background purge, see posts/deletion.py."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(is_deleted=False)
+
+
 class Post(models.Model):
     text = models.TextField(verbose_name='Text', )
+    text_html = models.TextField(verbose_name='Rendered text', default='', editable=False)
+    render_version = models.PositiveSmallIntegerField(verbose_name='Render version', default=0, editable=False)
     pub_date = models.DateTimeField(verbose_name='Publish date', auto_now_add=True)
     author = models.ForeignKey(User, verbose_name='Author', on_delete=models.CASCADE, related_name='posts')
     group = models.ForeignKey('Group', blank=True, null=True, verbose_name='Group', on_delete=models.CASCADE,
                               related_name='posts')
-    image = models.ImageField(verbose_name='Image', upload_to='posts/', blank=True, null=True)
+    image = models.ImageField(verbose_name='Image', upload_to='posts/', storage=image_storage, blank=True, null=True)
+    comments_count = models.PositiveIntegerField(verbose_name='Comments count', default=0, editable=False)
+    version = models.PositiveIntegerField(verbose_name='Version', default=0, editable=False)
+    updated_at = models.DateTimeField(verbose_name='Updated at', auto_now=True)
+    is_deleted = models.BooleanField(verbose_name='Deleted', default=False, editable=False)
+
+    objects = LivePostManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['pub_date', 'id'], name='post_pub_date_idx'),
+            models.Index(fields=['author', 'pub_date', 'id'], name='post_author_pub_date_idx'),
+            models.Index(fields=['group', 'pub_date', 'id'], name='post_group_pub_date_idx'),
+        ]
 
 
 class Group(models.Model):
     title = models.CharField(max_length=200, verbose_name='Title')
     slug = models.SlugField(verbose_name='Slug', unique=True)
     description = models.TextField(verbose_name='Description')
+    updated_at = models.DateTimeField(verbose_name='Updated at', auto_now=True)
 
     def __str__(self):
         return self.title
@@ -26,8 +51,16 @@ class Comment(models.Model):
     post = models.ForeignKey('Post', verbose_name='Post', on_delete=models.CASCADE, related_name='comments')
     author = models.ForeignKey(User, verbose_name='Author', on_delete=models.CASCADE, related_name='comments')
     text = models.TextField(verbose_name='Text', )
+    text_html = models.TextField(verbose_name='Rendered text', default='', editable=False)
+    render_version = models.PositiveSmallIntegerField(verbose_name='Render version', default=0, editable=False)
     created_date = models.DateTimeField(verbose_name='Created_date', auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['post', 'created_date', 'id'], name='comment_post_created_idx'),
+            models.Index(fields=['created_date', 'id'], name='comment_created_idx'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(User, verbose_name='Follower', on_delete=models.CASCADE, related_name='follower')
@@ -35,3 +68,111 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ['user', 'author']
+
+
+class UserStats(models.Model):
+    user = models.OneToOneField(User, verbose_name='User', on_delete=models.CASCADE, primary_key=True,
+                                related_name='stats')
+    posts_count = models.PositiveIntegerField(verbose_name='Posts count', default=0)
+    followers_count = models.PositiveIntegerField(verbose_name='Followers count', default=0)
+    following_count = models.PositiveIntegerField(verbose_name='Following count', default=0)
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(User, verbose_name='Reader', on_delete=models.CASCADE, related_name='feed_entries')
+    post = models.ForeignKey('Post', verbose_name='Post', on_delete=models.CASCADE, related_name='feed_entries')
+    author = models.ForeignKey(User, verbose_name='Author', on_delete=models.CASCADE, related_name='+')
+    pub_date = models.DateTimeField(verbose_name='Publish date')
+
+    class Meta:
+        unique_together = ['user', 'post']
+        indexes = [
+            models.Index(fields=['user', 'pub_date', 'post'], name='feed_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'], name='feed_user_author_idx'),
+        ]
+
+
+class ThumbnailJob(models.Model):
+    image = models.CharField(verbose_name='Image', max_length=255, unique=True)
+    created_date = models.DateTimeField(verbose_name='Created date', auto_now_add=True)
+    attempts = models.PositiveSmallIntegerField(verbose_name='Attempts', default=0)
+    locked_until = models.DateTimeField(verbose_name='Locked until', blank=True, null=True, db_index=True)
+
+
+class ImageBlob(models.Model):
+    name = models.CharField(verbose_name='Name', max_length=255, unique=True)
+    size = models.PositiveIntegerField(verbose_name='Size')
+    refcount = models.PositiveIntegerField(verbose_name='References', default=0)
+
+
+class Recommendation(models.Model):
+    COFOLLOW = 'cofollow'
+    GROUP = 'group'
+    REASONS = ((COFOLLOW, 'Followed by people you share authors with'), (GROUP, 'Writes in your groups'))
+
+    user = models.ForeignKey(User, verbose_name='User', on_delete=models.CASCADE, related_name='recommendations')
+    suggested = models.ForeignKey(User, verbose_name='Suggested author', on_delete=models.CASCADE, related_name='+')
+    rank = models.PositiveSmallIntegerField(verbose_name='Rank')
+    score = models.FloatField(verbose_name='Score')
+    reason = models.CharField(verbose_name='Reason', max_length=16, choices=REASONS)
+
+    class Meta:
+        unique_together = ['user', 'rank']
+
+
+class StaleRecommendation(models.Model):
+    # A marker only: follows deleted along with their user mark it stale mid-cascade, refresh() drops such rows
+    user = models.OneToOneField(User, verbose_name='User', on_delete=models.DO_NOTHING, db_constraint=False,
+                                primary_key=True, related_name='+')
+    marked_at = models.DateTimeField(verbose_name='Marked at', auto_now=True)
+
+
+class PostActivity(models.Model):
+    """Comments on a post per hour, see posts/trending.py."""
+    post = models.ForeignKey(Post, verbose_name='Post', on_delete=models.CASCADE, related_name='+')
+    hour = models.DateTimeField(verbose_name='Hour', db_index=True)
+    count = models.PositiveIntegerField(verbose_name='Count', default=0)
+
+    class Meta:
+        unique_together = ['post', 'hour']
+
+
+class GroupActivity(models.Model):
+    """Posts and comments in a group per hour."""
+    group = models.ForeignKey(Group, verbose_name='Group', on_delete=models.CASCADE, related_name='+')
+    hour = models.DateTimeField(verbose_name='Hour', db_index=True)
+    count = models.PositiveIntegerField(verbose_name='Count', default=0)
+
+    class Meta:
+        unique_together = ['group', 'hour']
+
+
+class TrendingPost(models.Model):
+    rank = models.PositiveSmallIntegerField(verbose_name='Rank', primary_key=True)
+    post = models.ForeignKey(Post, verbose_name='Post', on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(verbose_name='Score')
+
+
+class TrendingGroup(models.Model):
+    rank = models.PositiveSmallIntegerField(verbose_name='Rank', primary_key=True)
+    group = models.ForeignKey(Group, verbose_name='Group', on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField(verbose_name='Score')
+
+
+class DeletionJob(models.Model):
+    """Background purge of a soft-deleted post or user and everything hanging off it."""
+    POST = 'post'
+    USER = 'user'
+    KINDS = ((POST, 'Post'), (USER, 'User'))
+
+    kind = models.CharField(verbose_name='Kind', max_length=8, choices=KINDS)
+    object_id = models.PositiveIntegerField(verbose_name='Object id')
+    description = models.CharField(verbose_name='Description', max_length=200)
+    created_date = models.DateTimeField(verbose_name='Created date', auto_now_add=True)
+    finished_date = models.DateTimeField(verbose_name='Finished date', blank=True, null=True)
+    total = models.PositiveIntegerField(verbose_name='Rows to delete', default=0)
+    deleted = models.PositiveIntegerField(verbose_name='Rows deleted', default=0)
+    locked_until = models.DateTimeField(verbose_name='Locked until', blank=True, null=True, db_index=True)
+
+    def __str__(self):
+        return self.description
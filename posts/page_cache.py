@@ -0,0 +1,135 @@
+import hashlib
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ObjectDoesNotExist
+from django.http import HttpResponse
+from yatube.metrics import record_cache
+
+GLOBAL_SCOPE = 'all'
+# The list of groups (API), bumped when a group is created or deleted
+GROUPS_SCOPE = 'groups'
+
+
+def generation_key(scope):
+    return f'feed_gen:{scope}'
+
+
+def _initial_generation():
+    # Never collide with a generation stored before the key was evicted
+    return int(time.time() * 1000)
+
+
+def get_generations(*scopes, extra_keys=()):
+    """Current generations of the scopes (creating missing ones) plus the values of extra_keys."""
+    keys = [generation_key(scope) for scope in scopes]
+    values = cache.get_many(keys + list(extra_keys))
+    for key in keys:
+        if key not in values:
+            cache.add(key, _initial_generation(), None)
+            values[key] = cache.get(key)
+    return values
+
+
+def bumped_key(scope):
+    return f'feed_bumped:{scope}'
+
+
+def bump(*scopes):
+    for scope in scopes:
+        key = generation_key(scope)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, _initial_generation(), None)
+    # Last-Modified of the conditional pages moves with every change, not only with new posts
+    cache.set_many({bumped_key(scope): time.time() for scope in scopes}, None)
+
+
+def last_bumped(*scopes):
+    """Time of the latest bump of the scopes; a scope whose time was evicted counts as bumped now."""
+    keys = [bumped_key(scope) for scope in scopes]
+    values = cache.get_many(keys)
+    for key in keys:
+        if key not in values:
+            cache.add(key, time.time(), None)
+            values[key] = cache.get(key)
+    return max(values.values())
+
+
+def post_scopes(post):
+    """Scopes of the feed pages a post is rendered on."""
+    # A post may be on the trending page, which is cheap to re-render
+    scopes = ['index', 'trending', f'profile:{post.author.username}']
+    if post.group_id:
+        try:
+            scopes.append(f'group:{post.group.slug}')
+        except (AttributeError, ObjectDoesNotExist):
+            # The group itself is being deleted, which bumps every page anyway
+            pass
+    return scopes
+
+
+def cache_feed(*scopes):
+    """
+    Cache anonymous GET responses of a feed view until the generation of one of its scopes is bumped.
+    Scopes are formatted with the view kwargs, e.g. 'group:{slug}'. Pages are also refreshed after
+    FEED_CACHE_TIMEOUT; a stale copy is kept for FEED_CACHE_STALE_TIMEOUT and served to everybody
+    but the single worker that holds the rebuild lock.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+
+            path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+            page_key, lock_key = f'feed_page:{path}', f'feed_lock:{path}'
+            names = (GLOBAL_SCOPE, *[scope.format(**kwargs) for scope in scopes])
+            values = get_generations(*names, extra_keys=[page_key])
+            generations = [values[generation_key(name)] for name in names]
+            entry = values.get(page_key)
+
+            if entry is not None:
+                fresh = entry['generations'] == generations and entry['expires'] > time.time()
+                if fresh or not cache.add(lock_key, 1, settings.FEED_CACHE_LOCK_TIMEOUT):
+                    record_cache(1, 0)
+                    return _cached_response(entry)
+            record_cache(0, 1)
+            response = view(request, *args, **kwargs)
+
+            def store(content):
+                cache.set(page_key, {
+                    'generations': generations,
+                    'expires': time.time() + settings.FEED_CACHE_TIMEOUT,
+                    'content': content,
+                    'content_type': response['Content-Type'],
+                }, settings.FEED_CACHE_STALE_TIMEOUT)
+
+            if response.status_code == 200:
+                if response.streaming:
+                    response.streaming_content = _store_streamed(response.streaming_content, store)
+                else:
+                    if hasattr(response, 'render'):
+                        response.render()
+                    store(response.content)
+            if entry is not None:
+                cache.delete(lock_key)
+            return response
+        return wrapper
+    return decorator
+
+
+def _store_streamed(chunks, store):
+    """Pass a streamed page through and cache it once its last chunk is sent, not if the client hangs up."""
+    content = []
+    for chunk in chunks:
+        content.append(chunk)
+        yield chunk
+    store(b''.join(content))
+
+
+def _cached_response(entry):
+    return HttpResponse(entry['content'], content_type=entry['content_type'])
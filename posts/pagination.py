@@ -0,0 +1,157 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.http import Http404
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorPage:
+    """A page of a keyset paginated queryset, mimics the parts of django.core.paginator.Page templates use."""
+
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return f'<CursorPage of {len(self)} objects>'
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Keyset paginator: every page is a range scan starting right after (or before) the row encoded
+    in an opaque cursor, so page N costs the same as page 1 and no COUNT(*) is needed.
+    All ordering fields must share one direction and together be unique, e.g. ('-pub_date', '-id').
+    """
+
+    def __init__(self, queryset, per_page, ordering=('-pub_date', '-id'), count_cap=None):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.fields = tuple(field.lstrip('-') for field in self.ordering)
+        self.descending = self.ordering[0].startswith('-')
+        self.count_cap = count_cap
+
+    @cached_property
+    def _count(self):
+        queryset = self.queryset.order_by()
+        if self.count_cap is not None:
+            queryset = queryset[:self.count_cap + 1]
+        return queryset.count()
+
+    @property
+    def count(self):
+        """Total number of objects, capped at count_cap so that huge tables are never fully counted."""
+        if self.count_cap is not None:
+            return min(self._count, self.count_cap)
+        return self._count
+
+    @property
+    def count_is_capped(self):
+        return self.count_cap is not None and self._count > self.count_cap
+
+    def _position(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def encode_cursor(self, obj, previous=False):
+        """Build a cursor pointing right after obj (or right before it when previous is True)."""
+        values = [value.isoformat() if hasattr(value, 'isoformat') else value for value in self._position(obj)]
+        data = json.dumps(['p' if previous else 'n', values], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, values = json.loads(data.decode())
+            if direction not in ('n', 'p') or len(values) != len(self.fields):
+                raise ValueError
+            meta = self.queryset.model._meta
+            position = [meta.get_field(field).to_python(value) for field, value in zip(self.fields, values)]
+        except Exception:
+            raise InvalidCursor(cursor)
+        return direction == 'p', position
+
+    def _seek(self, position, backwards):
+        """Q selecting rows strictly after position in the page ordering (or before it when backwards)."""
+        lookup = 'lt' if self.descending != backwards else 'gt'
+        condition = Q()
+        for index, field in enumerate(self.fields):
+            step = Q(**{f'{field}__{lookup}': position[index]})
+            for prefix_field, value in zip(self.fields[:index], position[:index]):
+                step &= Q(**{prefix_field: value})
+            condition |= step
+        return condition
+
+    def _reversed_ordering(self):
+        return [field[1:] if field.startswith('-') else f'-{field}' for field in self.ordering]
+
+    def cursor_ending_at(self, obj):
+        """Cursor of the page that ends with obj, None when obj is on the first page."""
+        older = self.queryset.filter(self._seek(self._position(obj), True)).order_by(*self._reversed_ordering())
+        anchor = next(iter(older[self.per_page - 1:self.per_page]), None)
+        return None if anchor is None else self.encode_cursor(anchor)
+
+    def page(self, cursor=None):
+        if not cursor:
+            rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+            has_next, has_previous = len(rows) > self.per_page, False
+            rows = rows[:self.per_page]
+        else:
+            backwards, position = self.decode_cursor(cursor)
+            if backwards:
+                rows = list(self.queryset.filter(self._seek(position, True))
+                            .order_by(*self._reversed_ordering())[:self.per_page + 1])
+                has_next, has_previous = True, len(rows) > self.per_page
+                rows = rows[:self.per_page][::-1]
+            else:
+                rows = list(self.queryset.filter(self._seek(position, False))
+                            .order_by(*self.ordering)[:self.per_page + 1])
+                has_next, has_previous = len(rows) > self.per_page, True
+                rows = rows[:self.per_page]
+        if not rows:
+            has_next = has_previous = False
+        return CursorPage(
+            rows, self,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], previous=True) if has_previous else None,
+        )
+
+
+class CursorPaginationMixin:
+    """ListView mixin replacing offset pagination with CursorPaginator."""
+    cursor_kwarg = 'cursor'
+    cursor_ordering = ('-pub_date', '-id')
+    paginate_count_cap = None
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = CursorPaginator(queryset, page_size, ordering=self.cursor_ordering,
+                                    count_cap=self.paginate_count_cap)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        except InvalidCursor:
+            raise Http404('Invalid cursor')
+        return paginator, page, page.object_list, page.has_other_pages()
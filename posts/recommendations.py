@@ -0,0 +1,160 @@
+"""
+"Who to follow" suggestions computed offline from the follow graph.
+
+The graph is loaded once, CSR style: ordered scans of the follow table fill one sorted array('i') of ids per
+user and per author (the rows and columns of the sparse follow matrix A), and every user gets the top
+RECOMMENDATIONS_PER_USER authors of
+
+    cofollow(u) = sum over authors b followed by u, over followers a of b: A[a] / log(2 + followers(b))
+    group(u)    = sum over groups g u writes in or reads: share of g's posts written by each author
+
+minus the authors u already follows. Popular authors are down-weighted and only a random sample of at most
+RECOMMENDATION_MAX_COFOLLOWERS of their followers is used, so hubs do not dominate the product.
+Follow changes mark the follower and the other followers of the author stale; refresh() recomputes only
+stale users unless asked for a full run.
+"""
+import heapq
+import math
+import random
+from array import array
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from .models import Follow, Post, Recommendation, StaleRecommendation
+from . import page_cache
+
+User = get_user_model()
+
+
+def sample(ids, rng=random):
+    """At most RECOMMENDATION_MAX_COFOLLOWERS of ids, drawn uniformly with rng."""
+    if len(ids) <= settings.RECOMMENDATION_MAX_COFOLLOWERS:
+        return ids
+    return rng.sample(ids, settings.RECOMMENDATION_MAX_COFOLLOWERS)
+
+
+def mark_stale(user_id, author_id):
+    """The follower's own list changed and so did the co-follow neighbourhood of the author's followers."""
+    user_ids = {user_id}
+    followers = Follow.objects.filter(author_id=author_id).order_by('user_id').values_list('user_id', flat=True)
+    limit = settings.RECOMMENDATION_MAX_COFOLLOWERS
+    # A random window of the author's index every time, so the followers of a hub are all refreshed sooner or
+    # later without loading them
+    start = random.randint(0, max(followers.count() - limit, 0))
+    user_ids.update(followers[start:start + limit])
+    now = timezone.now()
+    StaleRecommendation.objects.filter(user_id__in=user_ids).update(marked_at=now)
+    StaleRecommendation.objects.bulk_create([StaleRecommendation(user_id=pk, marked_at=now) for pk in user_ids],
+                                            ignore_conflicts=True)
+
+
+def _adjacency(pairs):
+    """{key: array of values} from (key, value) pairs ordered by key and value."""
+    adjacency, last, row = {}, None, None
+    for key, value in pairs:
+        if key != last:
+            last, row = key, adjacency.setdefault(key, array('i'))
+        row.append(value)
+    return adjacency
+
+
+class FollowGraph:
+    def __init__(self):
+        # The rows of A by follower and its columns by author
+        self.following = _adjacency(Follow.objects.order_by('user_id', 'author_id')
+                                    .values_list('user_id', 'author_id').iterator())
+        self.followers = _adjacency(Follow.objects.order_by('author_id', 'user_id')
+                                    .values_list('author_id', 'user_id').iterator())
+        # author -> {group: posts}, group -> {author: share of the group's posts}
+        self.author_groups = defaultdict(Counter)
+        group_posts = defaultdict(Counter)
+        for row in Post.objects.exclude(group=None).values('author_id', 'group_id').annotate(posts=Count('pk'))\
+                .order_by().iterator():
+            self.author_groups[row['author_id']][row['group_id']] = row['posts']
+            group_posts[row['group_id']][row['author_id']] = row['posts']
+        self.group_authors = {}
+        for group_id, authors in group_posts.items():
+            total = sum(authors.values())
+            self.group_authors[group_id] = {author: posts / total for author, posts in authors.items()}
+
+    def cofollow_scores(self, user_id):
+        scores = Counter()
+        for author_id in self.following.get(user_id, ()):
+            followers = self.followers[author_id]
+            # The row of A summed in C by Counter.update, then scaled once
+            cofollowed = Counter()
+            # Seeded, so that a user gets the same suggestions from every run over the same graph
+            for other in sample(followers, random.Random(f'{user_id}:{author_id}')):
+                if other != user_id:
+                    cofollowed.update(self.following[other])
+            weight = 1 / math.log(2 + len(followers))
+            for candidate, count in cofollowed.items():
+                scores[candidate] += weight * count
+        return scores
+
+    def group_scores(self, user_id):
+        affinity = Counter(self.author_groups.get(user_id, {}))
+        for author_id in self.following.get(user_id, ()):
+            affinity.update(self.author_groups.get(author_id, {}))
+        scores = Counter()
+        for group_id, weight in affinity.items():
+            for author_id, share in self.group_authors[group_id].items():
+                scores[author_id] += weight * share
+        return scores
+
+    def recommend(self, user_id, limit):
+        """[(author_id, score, reason)] best first."""
+        excluded = {user_id, *self.following.get(user_id, ())}
+        cofollow = self.cofollow_scores(user_id)
+        group = self.group_scores(user_id)
+        candidates = {}
+        for author_id in (set(cofollow) | set(group)) - excluded:
+            social, topical = cofollow[author_id], settings.RECOMMENDATION_GROUP_WEIGHT * group[author_id]
+            reason = Recommendation.COFOLLOW if social >= topical else Recommendation.GROUP
+            candidates[author_id] = (social + topical, reason)
+        best = heapq.nlargest(limit, candidates.items(), key=lambda item: (item[1][0], -item[0]))
+        return [(author_id, score, reason) for author_id, (score, reason) in best]
+
+    def users(self):
+        return set(self.following) | set(self.author_groups)
+
+
+def _store(graph, user_ids):
+    rows = [
+        Recommendation(user_id=user_id, suggested_id=author_id, rank=rank, score=score, reason=reason)
+        for user_id in user_ids
+        for rank, (author_id, score, reason) in enumerate(graph.recommend(user_id, settings.RECOMMENDATIONS_PER_USER))
+    ]
+    with transaction.atomic():
+        Recommendation.objects.filter(user_id__in=user_ids).delete()
+        Recommendation.objects.bulk_create(rows)
+    # Own profile pages show the suggestions and answer conditional GETs by their generation
+    usernames = User.objects.filter(pk__in=user_ids).values_list('username', flat=True)
+    page_cache.bump(*[f'profile:{username}' for username in usernames])
+
+
+def refresh(full=False, batch_size=500):
+    """Recompute suggestions of stale users (every user when full), yield the number processed so far."""
+    started = timezone.now()
+    graph = FollowGraph()
+    if full:
+        user_ids = sorted(graph.users() | set(Recommendation.objects.values_list('user_id', flat=True).distinct()))
+    else:
+        user_ids = sorted(StaleRecommendation.objects.values_list('user_id', flat=True))
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start:start + batch_size]
+        _store(graph, batch)
+        yield start + len(batch)
+    # Users marked again while this run was computing stay stale for the next one
+    StaleRecommendation.objects.filter(marked_at__lte=started).delete()
+
+
+def for_user(user, limit=5):
+    """Suggestions of user minus authors followed since the last refresh, one indexed query."""
+    return list(Recommendation.objects.filter(user=user, suggested__is_active=True)
+                .exclude(suggested__following__user=user)
+                .select_related('suggested').order_by('rank')[:limit])
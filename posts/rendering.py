@@ -0,0 +1,104 @@
+"""
+Post and comment bodies rendered to HTML once, when they are saved.
+
+render() turns the text into sanitized HTML: Markdown (when POST_MARKDOWN is on and the optional markdown
+package is installed) with raw HTML escaped and links limited to SAFE_SCHEMES, or escaped text with line breaks
+otherwise. The result is stored in text_html together with version(); the templates print it as is and
+the render_bodies command re-renders rows stored by another version.
+"""
+import html
+import re
+import threading
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.template.defaultfilters import linebreaksbr
+from .models import Post
+from . import cards
+
+try:
+    import markdown
+    from markdown.extensions import Extension
+    from markdown.treeprocessors import Treeprocessor
+except ImportError:
+    markdown = None
+
+# Bump when the output of render() changes
+RENDERER_VERSION = 1
+SAFE_SCHEMES = ('', 'http', 'https', 'mailto')
+URL_ATTRIBUTES = {'a': 'href', 'img': 'src'}
+
+_local = threading.local()
+
+
+def markdown_enabled():
+    return settings.POST_MARKDOWN and markdown is not None
+
+
+def version():
+    """Stored next to every body; plain and Markdown output of one renderer are different versions."""
+    return RENDERER_VERSION * 2 + markdown_enabled()
+
+
+def is_safe_url(url):
+    # Browsers drop control characters and whitespace inside the scheme, e.g. 'java\tscript:'
+    url = re.sub(r'[\x00-\x20]', '', html.unescape(url))
+    try:
+        return urlsplit(url).scheme.lower() in SAFE_SCHEMES
+    except ValueError:
+        return False
+
+
+if markdown is not None:
+    class _SanitizeLinks(Treeprocessor):
+        def run(self, root):
+            for element in root.iter():
+                attribute = URL_ATTRIBUTES.get(element.tag)
+                if attribute and not is_safe_url(element.get(attribute, '')):
+                    del element.attrib[attribute]
+                if element.tag == 'a':
+                    element.set('rel', 'nofollow noopener')
+
+    class _SafeMarkdown(Extension):
+        def extendMarkdown(self, md):
+            # Raw HTML in the text is shown escaped instead of being passed through
+            md.preprocessors.deregister('html_block')
+            md.inlinePatterns.deregister('html')
+            md.treeprocessors.register(_SanitizeLinks(md), 'sanitize_links', 0)
+
+
+def _markdown():
+    # Markdown instances keep state between calls, so every thread gets its own
+    if getattr(_local, 'markdown', None) is None:
+        _local.markdown = markdown.Markdown(extensions=[_SafeMarkdown(), 'nl2br', 'sane_lists', 'fenced_code'])
+    return _local.markdown
+
+
+def render(text):
+    if not markdown_enabled():
+        return linebreaksbr(text, autoescape=True)
+    return _markdown().reset().convert(text)
+
+
+def render_instance(instance):
+    """Fill text_html and render_version of a Post or Comment from its text."""
+    instance.text_html = render(instance.text)
+    instance.render_version = version()
+
+
+def render_stale(model, batch_size=500):
+    """Re-render rows of model stored by another version in pk order, yield the number done so far."""
+    stale = model._base_manager.exclude(render_version=version()).order_by('pk').only('pk', 'text')
+    done, last_pk = 0, 0
+    while True:
+        batch = list(stale.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            break
+        for instance in batch:
+            render_instance(instance)
+        model._base_manager.bulk_update(batch, ['text_html', 'render_version'])
+        if model is Post:
+            cards.bump_versions(Post.all_objects.filter(pk__in=[post.pk for post in batch]))
+        last_pk = batch[-1].pk
+        done += len(batch)
+        yield done
@@ -0,0 +1,75 @@
+import re
+
+from django.db import connection
+from django.db.models.expressions import RawSQL
+from .models import Post
+
+TABLE = 'posts_post_fts'
+BATCH_SIZE = 1000
+
+
+def is_available():
+    return connection.vendor == 'sqlite'
+
+
+def match_expression(query):
+    """Turn user input into an FTS5 query matching all words, so that FTS syntax in input is never interpreted."""
+    words = re.findall(r'\w+', query)
+    return ' '.join('"{}"'.format(word) for word in words)
+
+
+def index_post(pk, text):
+    if is_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)', [pk, text])
+
+
+def unindex_post(pk, text):
+    """Remove a row from the external content index, text must be the indexed (old) value."""
+    if is_available():
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {TABLE} ({TABLE}, rowid, text) VALUES ('delete', %s, %s)", [pk, text])
+
+
+def unindex_posts(rows):
+    """unindex_post for many (pk, text) rows."""
+    if is_available() and rows:
+        with connection.cursor() as cursor:
+            cursor.executemany(f"INSERT INTO {TABLE} ({TABLE}, rowid, text) VALUES ('delete', %s, %s)", rows)
+
+
+def matching_ids(query):
+    """Expression selecting ids of posts matching query, usable in pk__in lookups."""
+    return RawSQL(f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s', (match_expression(query),))
+
+
+def search(query, limit, offset=0):
+    """Posts matching query, best bm25 rank first."""
+    expression = match_expression(query)
+    if not expression:
+        return []
+    if not is_available():
+        return list(Post.objects.filter(text__icontains=query).select_related('author', 'group')
+                    .order_by('-pub_date', '-id')[offset:offset + limit])
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT rowid FROM {TABLE} WHERE {TABLE} MATCH %s ORDER BY rank LIMIT %s OFFSET %s',
+                       [expression, limit, offset])
+        ids = [row[0] for row in cursor.fetchall()]
+    posts = Post.objects.select_related('author', 'group').in_bulk(ids)
+    return [posts[pk] for pk in ids if pk in posts]
+
+
+def rebuild(batch_size=BATCH_SIZE):
+    """Re-index every post, streaming the table in primary key order; yields the number of indexed rows."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {TABLE} ({TABLE}) VALUES ('delete-all')")
+    last_pk, indexed = 0, 0
+    while True:
+        rows = list(Post.objects.filter(pk__gt=last_pk).order_by('pk').values_list('pk', 'text')[:batch_size])
+        if not rows:
+            break
+        with connection.cursor() as cursor:
+            cursor.executemany(f'INSERT INTO {TABLE} (rowid, text) VALUES (%s, %s)', rows)
+        last_pk = rows[-1][0]
+        indexed += len(rows)
+        yield indexed
@@ -0,0 +1,125 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Post, Group, Comment, Follow, UserStats
+from . import cards, counters, deletion, feed, page_cache, recommendations, rendering, search, thumbnails, trending
+from .tasks import defer
+
+User = get_user_model()
+
+
+@receiver(pre_save, sender=User)
+def remember_username(sender, instance, update_fields=None, **kwargs):
+    if instance.pk and (update_fields is None or 'username' in update_fields):
+        instance._old_username = User.objects.filter(pk=instance.pk).values_list('username', flat=True).first()
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, **kwargs):
+    if created:
+        UserStats.objects.get_or_create(user=instance)
+    elif getattr(instance, '_old_username', instance.username) != instance.username:
+        defer(cards.bump_author_posts, instance.pk)
+        page_cache.bump(page_cache.GLOBAL_SCOPE)
+
+
+@receiver(post_save, sender=Group)
+def group_saved(sender, instance, created, **kwargs):
+    if created:
+        page_cache.bump(page_cache.GROUPS_SCOPE)
+    else:
+        defer(cards.bump_group_posts, instance.pk)
+        page_cache.bump(page_cache.GLOBAL_SCOPE)
+
+
+@receiver(post_delete, sender=Group)
+def group_deleted(sender, instance, **kwargs):
+    # Its posts went with it and may be on any cached page
+    page_cache.bump(page_cache.GLOBAL_SCOPE)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_comments(instance.post_id, 1)
+        defer(trending.record_comment, instance.post_id, instance.post.group_id, instance.created_date)
+        page_cache.bump(*page_cache.post_scopes(instance.post))
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if deletion.is_purging():
+        return
+    counters.bump_comments(instance.post_id, -1)
+    post = Post.objects.select_related('author', 'group').filter(pk=instance.post_id).first()
+    if post is not None:
+        page_cache.bump(*page_cache.post_scopes(post))
+
+
+@receiver(pre_save, sender=Post)
+@receiver(pre_save, sender=Comment)
+def render_text(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'text' in update_fields:
+        rendering.render_instance(instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_text(sender, instance, **kwargs):
+    if instance.pk:
+        instance._indexed_text, instance._old_image = Post.objects.filter(pk=instance.pk)\
+            .values_list('text', 'image').first() or (None, None)
+
+
+@receiver(post_save, sender=Post)
+def post_saved(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user_stats(instance.author_id, 'posts_count', 1)
+        defer(feed.fan_out_post, instance.pk)
+        if instance.group_id:
+            defer(trending.record_post, instance.group_id, instance.pub_date)
+        search.index_post(instance.pk, instance.text)
+    else:
+        cards.bump_versions(Post.objects.filter(pk=instance.pk))
+        old_text = getattr(instance, '_indexed_text', None)
+        if old_text != instance.text:
+            if old_text is not None:
+                search.unindex_post(instance.pk, old_text)
+            search.index_post(instance.pk, instance.text)
+        old_image = getattr(instance, '_old_image', None)
+        if old_image and old_image != instance.image.name:
+            defer(thumbnails.release_image, old_image)
+    page_cache.bump(*page_cache.post_scopes(instance))
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    if deletion.is_purging():
+        return
+    if not instance.is_deleted:
+        # A hidden post already left the counters and the search index
+        counters.bump_user_stats(instance.author_id, 'posts_count', -1)
+        search.unindex_post(instance.pk, instance.text)
+    if instance.image:
+        defer(thumbnails.release_image, instance.image.name)
+    page_cache.bump(*page_cache.post_scopes(instance))
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, **kwargs):
+    if created:
+        counters.bump_user_stats(instance.author_id, 'followers_count', 1)
+        counters.bump_user_stats(instance.user_id, 'following_count', 1)
+        defer(feed.backfill, instance.user_id, instance.author_id)
+        defer(recommendations.mark_stale, instance.user_id, instance.author_id)
+        page_cache.bump(f'profile:{instance.author.username}', f'profile:{instance.user.username}')
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    if deletion.is_purging():
+        return
+    counters.bump_user_stats(instance.author_id, 'followers_count', -1)
+    counters.bump_user_stats(instance.user_id, 'following_count', -1)
+    feed.remove(instance.user_id, instance.author_id)
+    defer(recommendations.mark_stale, instance.user_id, instance.author_id)
+    page_cache.bump(f'profile:{instance.author.username}', f'profile:{instance.user.username}')
@@ -0,0 +1,116 @@
+import hashlib
+import os
+import re
+import tempfile
+
+from PIL import Image, ImageOps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import transaction
+from django.db.models import F
+from django.utils.deconstruct import deconstructible
+
+# Formats stored as uploaded when they are small enough, everything else is re-encoded
+EXTENSIONS = {'JPEG': '.jpg', 'PNG': '.png', 'GIF': '.gif', 'WEBP': '.webp'}
+CHUNK_SIZE = 64 * 1024
+# posts/ab/cd/abcd<60 more hex digits>.jpg
+CONTENT_ADDRESSED = re.compile(r'(?:.*/)?([0-9a-f]{2})/([0-9a-f]{2})/\1\2[0-9a-f]{60}\.\w+')
+
+
+def _hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def normalize(path):
+    """
+    Downscale the image at path to POST_IMAGE_MAX_SIZE and re-encode it when it is too large or in an
+    unusual format. Return the path of the file to store (path itself when it is fine) and its extension.
+    """
+    with Image.open(path) as image:
+        image_format = image.format
+        small = (image.width <= settings.POST_IMAGE_MAX_SIZE[0] and image.height <= settings.POST_IMAGE_MAX_SIZE[1]
+                 and os.path.getsize(path) <= settings.POST_IMAGE_MAX_BYTES)
+        if image_format in EXTENSIONS and (small or getattr(image, 'is_animated', False)):
+            return path, EXTENSIONS[image_format]
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(settings.POST_IMAGE_MAX_SIZE, Image.LANCZOS)
+        transparent = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+        target = f'{path}.normalized'
+        if transparent:
+            image.save(target, 'PNG', optimize=True)
+            return target, '.png'
+        image.convert('RGB').save(target, 'JPEG', quality=settings.POST_IMAGE_QUALITY, optimize=True,
+                                  progressive=True)
+        return target, '.jpg'
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Stores every upload under its sha256, e.g. posts/ab/cd/abcd....jpg, so identical images share one file.
+    ImageBlob.refcount counts the names handed out by save(); the file goes away when the last one is released.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # The final name is derived from the content in _save
+        return name
+
+    def _save(self, name, content):
+        from .models import ImageBlob
+
+        temp_dir = self.path('.tmp')
+        os.makedirs(temp_dir, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=temp_dir, delete=False) as upload:
+            for chunk in content.chunks(CHUNK_SIZE):
+                upload.write(chunk)
+        stored = upload.name
+        try:
+            stored, extension = normalize(upload.name)
+            digest = _hash_file(stored)
+            name = os.path.join(os.path.dirname(name), digest[:2], digest[2:4], digest + extension)
+            path = self.path(name)
+            size = os.path.getsize(stored)
+            # The row lock (a write lock on SQLite) keeps release() from deleting a file being handed out
+            with transaction.atomic():
+                if not ImageBlob.objects.filter(name=name).update(refcount=F('refcount') + 1):
+                    ImageBlob.objects.create(name=name, size=size, refcount=1)
+                if not os.path.exists(path):
+                    os.makedirs(os.path.dirname(path), exist_ok=True)
+                    os.replace(stored, path)
+                    if self.file_permissions_mode is not None:
+                        os.chmod(path, self.file_permissions_mode)
+        finally:
+            for leftover in {upload.name, stored}:
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        return name.replace('\\', '/')
+
+    def add_references(self, name, count=1):
+        """Count references to a file put under its content-addressed name without save(), e.g. by an import."""
+        from .models import ImageBlob
+
+        with transaction.atomic():
+            if not ImageBlob.objects.filter(name=name).update(refcount=F('refcount') + count):
+                ImageBlob.objects.create(name=name, size=self.size(name), refcount=count)
+
+    def release(self, name):
+        """Drop one reference to name, return True if that removed the file."""
+        from .models import ImageBlob
+
+        with transaction.atomic():
+            if ImageBlob.objects.filter(name=name, refcount__gt=1).update(refcount=F('refcount') - 1):
+                return False
+            deleted, _ = ImageBlob.objects.filter(name=name).delete()
+            if deleted:
+                super().delete(name)
+        return bool(deleted)
+
+    def delete(self, name):
+        self.release(name)
+
+
+image_storage = ContentAddressedStorage()
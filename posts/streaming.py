@@ -0,0 +1,34 @@
+"""
+Streamed feed pages (FEED_STREAMING).
+
+The page shell - base.html, navigation, headings and the paginator - is rendered with a marker in place of
+every {% post_cards %}, and the response sends the shell up to the first marker right away. The cards are
+rendered and sent one at a time afterwards, so the browser starts loading CSS before the cards exist and
+the whole page is never held in memory as one string.
+"""
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from .cards import iter_cards
+
+CARDS_MARKER = '<!-- streamed-post-cards -->'
+
+
+def _stream(parts, card_lists, user):
+    yield parts[0]
+    for posts, part in zip(card_lists, parts[1:]):
+        yield from iter_cards(posts, user)
+        yield part
+
+
+class StreamingCardsMixin:
+    """TemplateView mixin streaming the post cards of the page, see the module docstring."""
+
+    def render_to_response(self, context, **response_kwargs):
+        if not settings.FEED_STREAMING:
+            return super().render_to_response(context, **response_kwargs)
+        # {% post_cards %} leaves the marker and collects its posts here instead of rendering them
+        context['streamed_cards'] = card_lists = []
+        response = super().render_to_response(context, **response_kwargs)
+        parts = response.rendered_content.split(CARDS_MARKER)
+        return StreamingHttpResponse(_stream(parts, card_lists, self.request.user),
+                                     content_type=response['Content-Type'], status=response.status_code)
@@ -0,0 +1,36 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.TASKS_WORKERS, thread_name_prefix='yatube-task')
+    return _executor
+
+
+def _run(func, args, kwargs):
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', func.__name__)
+    finally:
+        connection.close()
+
+
+def defer(func, *args, **kwargs):
+    """
+    Run func off the request path once the current transaction commits.
+    With TASKS_EAGER the call happens inline, which is what the test suite relies on.
+    """
+    if settings.TASKS_EAGER:
+        func(*args, **kwargs)
+        return
+    transaction.on_commit(lambda: _get_executor().submit(_run, func, args, kwargs))
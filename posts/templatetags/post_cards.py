@@ -0,0 +1,20 @@
+from django import template
+from django.utils.safestring import mark_safe
+from posts.cards import render_cards
+from posts.streaming import CARDS_MARKER
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def post_cards(context, posts):
+    streamed = context.get('streamed_cards')
+    if streamed is not None:
+        streamed.append(list(posts))
+        return mark_safe(CARDS_MARKER)
+    return render_cards(posts, context.get('user'))
+
+
+@register.simple_tag(takes_context=True)
+def post_card(context, post):
+    return render_cards([post], context.get('user'))
@@ -0,0 +1,13 @@
+from django import template
+from posts.thumbnails import ready_thumbnail
+
+register = template.Library()
+
+
+@register.simple_tag
+def thumbnail_url(image, alias):
+    """URL of a pre-rendered thumbnail, or of the original image while the worker has not got to it."""
+    if not image:
+        return ''
+    thumbnail = ready_thumbnail(image, alias)
+    return thumbnail.url if thumbnail else image.url
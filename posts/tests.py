@@ -1,15 +1,34 @@
+import hashlib
 import io
+import json
+import os
+import random
+import tarfile
+import time
+from array import array
+from datetime import timedelta
+from unittest import mock
 
 from PIL import Image
 from django.core.files.base import ContentFile
 from django.urls import reverse
 from django.test import TestCase, Client, override_settings
 from django.contrib.auth.models import User
-from .models import Group, Post
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .models import (Group, Post, Comment, Follow, UserStats, FeedEntry, ThumbnailJob, ImageBlob, Recommendation,
+                     GroupActivity, PostActivity, TrendingGroup, DeletionJob, StaleRecommendation)
+from .admin_changelist import IndexedDatesQuerySet
+from . import cards, deletion, recommendations, rendering, search, trending, write_behind
+from .management.commands import export_posts
 from tempfile import TemporaryDirectory
 from django.core.cache import cache
+from django.conf import settings
+from django.utils import timezone
 
 
+@override_settings(TASKS_EAGER=True)
 class TestPost(TestCase):
     def setUp(self):
         self.client = Client()
@@ -141,11 +160,26 @@ class TestPost(TestCase):
                     self.assertContains(response, '<img', msg_prefix=f'Image do not uploaded to url: {url}')
 
     def test_cache(self):
-        self.auth_client.get('/')
+        cache.clear()
+        # A streamed page is cached once it was sent completely
+        self.client.get('/').getvalue()
+        self.assertIsNotNone(cache.get(f'feed_page:{hashlib.md5(b"/").hexdigest()}'))
         data = {'text': 'test_text', 'group': self.group_id, 'author': self.user}
         self.auth_client.post(reverse('new_post'), data=data)
-        response = self.auth_client.get('/')
-        self.assertNotContains(response, 'test_text', msg_prefix='Page do not must contain new post')
+        response = self.client.get('/')
+        self.assertContains(response, 'test_text', msg_prefix='New post must invalidate cached page')
+
+    def test_cache_serves_stale_page_while_rebuilding(self):
+        cache.clear()
+        self.client.get('/').getvalue()
+        Post.objects.create(text='test_text', author=self.user)
+        path = hashlib.md5(b'/').hexdigest()
+        cache.add(f'feed_lock:{path}', 1)
+        response = self.client.get('/')
+        self.assertNotContains(response, 'test_text', msg_prefix='Stale page must be served during rebuild')
+        cache.delete(f'feed_lock:{path}')
+        response = self.client.get('/')
+        self.assertContains(response, 'test_text')
 
     def test_follow_auth(self):
         following = User.objects.create(username='author', password='12345', email='example@ex.com')
@@ -190,3 +224,924 @@ class TestPost(TestCase):
         visiter_client.force_login(visiter)
         response = visiter_client.get(reverse('follow_index'))
         self.assertNotContains(response, 'following_text')
+
+
+@override_settings(TASKS_EAGER=True)
+class TestCounters(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author', email='author@email.com')
+        self.reader = User.objects.create(username='reader', email='reader@email.com')
+        self.post = Post.objects.create(text='counted_text', author=self.author)
+
+    def test_counters_follow_changes(self):
+        Comment.objects.create(post=self.post, author=self.reader, text='comment')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.author).followers_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.reader).following_count, 1)
+
+        Comment.objects.all().delete()
+        Follow.objects.all().delete()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertEqual(UserStats.objects.get(user=self.author).followers_count, 0)
+        self.assertEqual(UserStats.objects.get(user=self.reader).following_count, 0)
+
+    def test_recount_repairs_drift(self):
+        Comment.objects.create(post=self.post, author=self.reader, text='comment')
+        Post.objects.update(comments_count=10)
+        UserStats.objects.filter(user=self.author).delete()
+        call_command('recount_counters', stdout=io.StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.author).posts_count, 1)
+
+    def test_index_queries_do_not_depend_on_comments(self):
+        for i in range(5):
+            post = Post.objects.create(text=f'text_{i}', author=self.author)
+            Comment.objects.create(post=post, author=self.reader, text='comment')
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('index'))
+        self.assertContains(response, '1 комментариев')
+
+
+@override_settings(TASKS_EAGER=True)
+class TestCursorPagination(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author', email='author@email.com')
+        for i in range(25):
+            Post.objects.create(text=f'post_number_{i}_', author=self.author)
+
+    def test_next_and_previous_pages(self):
+        response = self.client.get(reverse('profile', kwargs={'username': 'author'}))
+        page = response.context['page_obj']
+        self.assertEqual([post.text for post in page], [f'post_number_{i}_' for i in range(24, 14, -1)])
+        self.assertFalse(page.has_previous())
+
+        response = self.client.get(reverse('profile', kwargs={'username': 'author'}), {'cursor': page.next_cursor})
+        page = response.context['page_obj']
+        self.assertEqual([post.text for post in page], [f'post_number_{i}_' for i in range(14, 4, -1)])
+
+        response = self.client.get(reverse('profile', kwargs={'username': 'author'}),
+                                   {'cursor': page.previous_cursor})
+        page = response.context['page_obj']
+        self.assertEqual(page[0].text, 'post_number_24_')
+        self.assertFalse(page.has_previous())
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('profile', kwargs={'username': 'author'}), {'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(TASKS_EAGER=True)
+class TestFollowFeed(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author', email='author@email.com')
+        self.reader = User.objects.create(username='reader', email='reader@email.com')
+        self.reader_client = Client()
+        self.reader_client.force_login(self.reader)
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        Post.objects.create(text='old_text', author=self.author)
+        self.reader_client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        Post.objects.create(text='new_text', author=self.author)
+        self.assertEqual(FeedEntry.objects.filter(user=self.reader).count(), 2)
+        response = self.reader_client.get(reverse('follow_index'))
+        self.assertEqual([post.text for post in response.context['page_obj']], ['new_text', 'old_text'])
+
+        self.reader_client.get(reverse('profile_unfollow', kwargs={'username': 'author'}))
+        self.assertFalse(FeedEntry.objects.filter(user=self.reader).exists())
+        response = self.reader_client.get(reverse('follow_index'))
+        self.assertNotContains(response, 'new_text')
+
+    @override_settings(FEED_FANOUT_MAX_FOLLOWERS=1)
+    def test_pull_authors_are_read_on_demand(self):
+        self.reader_client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        Post.objects.create(text='pulled_text', author=self.author)
+        self.assertFalse(FeedEntry.objects.exists())
+        response = self.reader_client.get(reverse('follow_index'))
+        self.assertContains(response, 'pulled_text')
+
+
+@override_settings(TASKS_EAGER=True)
+class TestPostCardCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author', email='author@email.com')
+        self.author_client = Client()
+        self.author_client.force_login(self.author)
+        self.post = Post.objects.create(text='card_text', author=self.author)
+
+    def test_cards_are_shared_between_viewers(self):
+        edit_url = reverse('post_edit', kwargs={'username': 'author', 'post_id': self.post.pk})
+        response = self.author_client.get(reverse('index'))
+        self.assertContains(response, edit_url)
+        self.assertIsNotNone(cache.get(cards.card_key(self.post)))
+        response = self.client.get(reverse('profile', kwargs={'username': 'author'}))
+        self.assertContains(response, 'card_text')
+        self.assertNotContains(response, edit_url)
+
+    def test_comment_bumps_card_version(self):
+        self.client.get(reverse('profile', kwargs={'username': 'author'}))
+        Comment.objects.create(post=self.post, author=self.author, text='comment')
+        response = self.client.get(reverse('profile', kwargs={'username': 'author'}))
+        self.assertContains(response, '1 комментариев')
+
+    def test_author_rename_bumps_card_version(self):
+        self.client.get(reverse('profile', kwargs={'username': 'author'}))
+        self.author.username = 'renamed'
+        self.author.save()
+        response = self.client.get(reverse('profile', kwargs={'username': 'renamed'}))
+        self.assertContains(response, '@renamed')
+
+
+@override_settings(TASKS_EAGER=True)
+class TestThumbnailQueue(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='author', email='author@email.com')
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+
+    def test_upload_is_rendered_by_worker(self):
+        with TemporaryDirectory() as temp_directory, override_settings(MEDIA_ROOT=temp_directory):
+            bytes_image = io.BytesIO()
+            Image.new('RGB', size=(1000, 1000), color=(255, 0, 0)).save(bytes_image, format='jpeg')
+            image = ContentFile(bytes_image.getvalue(), 'test.jpeg')
+            self.auth_client.post(reverse('new_post'), data={'text': 'text', 'image': image})
+            post = Post.objects.get()
+            self.assertTrue(ThumbnailJob.objects.filter(image=post.image.name).exists())
+
+            response = self.client.get(reverse('profile', kwargs={'username': 'author'}))
+            self.assertContains(response, f'src="{post.image.url}"')
+
+            call_command('thumbnail_worker', processes=0, once=True, stdout=io.StringIO())
+            self.assertFalse(ThumbnailJob.objects.exists())
+            content = self.client.get(reverse('profile', kwargs={'username': 'author'})).getvalue().decode()
+            self.assertNotIn(f'src="{post.image.url}"', content)
+            self.assertIn('<img', content)
+
+
+@override_settings(TASKS_EAGER=True)
+class TestSearch(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author', email='author@email.com')
+        self.post = Post.objects.create(text='Yatube loves sqlite', author=self.author)
+        Post.objects.create(text='something else', author=self.author)
+
+    def test_search_follows_edits_and_deletes(self):
+        response = self.client.get(reverse('search'), {'q': 'sqlite'})
+        self.assertEqual(response.context['posts'], [self.post])
+
+        self.post.text = 'Yatube loves postgres'
+        self.post.save()
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'sqlite'}).context['posts'], [])
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'postgres'}).context['posts'], [self.post])
+
+        self.post.delete()
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'postgres'}).context['posts'], [])
+
+    def test_fts_syntax_is_escaped(self):
+        response = self.client.get(reverse('search'), {'q': 'sqlite" OR NEAR('})
+        self.assertEqual(response.status_code, 200)
+
+    def test_rebuild_index(self):
+        with connection.cursor() as cursor:
+            cursor.execute("INSERT INTO posts_post_fts (posts_post_fts) VALUES ('delete-all')")
+        call_command('rebuild_search_index', batch_size=1, stdout=io.StringIO())
+        response = self.client.get(reverse('search'), {'q': 'sqlite'})
+        self.assertEqual(response.context['posts'], [self.post])
+
+
+class TestBenchmarkViews(TestCase):
+    def test_benchmark_reports_every_route(self):
+        with TemporaryDirectory() as temp_directory:
+            output = f'{temp_directory}/results.json'
+            call_command('benchmark_views', in_place=True, users=5, groups=2, posts=20, comments=20, follows=5,
+                         requests=2, output=output, stdout=io.StringIO())
+            with open(output) as results:
+                routes = json.load(results)['routes']
+            call_command('benchmark_views', in_place=True, users=5, groups=2, posts=20, comments=20, follows=5,
+                         requests=2, baseline=output, threshold=100, stdout=io.StringIO())
+        self.assertEqual(set(routes), {'index', 'group', 'profile', 'post', 'follow_index', 'add_comment',
+                                       'new_post'})
+        self.assertGreater(routes['index']['queries'], 0)
+        # Sub-millisecond queries count too
+        self.assertGreater(routes['index']['sql_ms'], 0)
+
+
+@override_settings(TASKS_EAGER=True)
+class TestExportImport(TestCase):
+    def test_round_trip(self):
+        author = User.objects.create(username='author', email='author@email.com')
+        reader = User.objects.create(username='reader', email='reader@email.com')
+        group = Group.objects.create(title='Group', slug='group', description='')
+        post = Post.objects.create(text='exported_text', author=author, group=group)
+        Comment.objects.create(post=post, author=reader, text='exported_comment')
+        Follow.objects.create(user=reader, author=author)
+        pub_date = post.pub_date
+
+        with TemporaryDirectory() as temp_directory:
+            path = f'{temp_directory}/dump.jsonl'
+            call_command('export_posts', path, chunk_size=1, checkpoint=f'{temp_directory}/export.json',
+                         stdout=io.StringIO())
+            with open(path) as dump:
+                self.assertEqual([json.loads(line)['model'] for line in dump],
+                                 ['user', 'user', 'group', 'post', 'comment', 'follow'])
+            User.objects.all().delete()
+            Group.objects.all().delete()
+            call_command('import_posts', path, batch_size=1, checkpoint=f'{temp_directory}/import.json',
+                         stdout=io.StringIO())
+
+        post = Post.objects.select_related('author', 'group').get()
+        self.assertEqual((post.text, post.author.username, post.group.slug), ('exported_text', 'author', 'group'))
+        self.assertEqual(post.pub_date, pub_date)
+        self.assertEqual(post.comments_count, 1)
+        self.assertTrue(Follow.objects.filter(user__username='reader', author__username='author').exists())
+        self.assertTrue(FeedEntry.objects.filter(user__username='reader', post=post).exists())
+
+    def test_import_into_non_empty_database(self):
+        author = User.objects.create(username='author', email='author@email.com')
+        post = Post.objects.create(text='original', author=author)
+        Comment.objects.create(post=post, author=author, text='original comment')
+        hidden = Post.objects.create(text='hidden', author=author)
+        Comment.objects.create(post=hidden, author=author, text='hidden comment')
+        Post.objects.filter(pk=hidden.pk).update(is_deleted=True)
+
+        with TemporaryDirectory() as temp_directory:
+            path = f'{temp_directory}/dump.jsonl'
+            call_command('export_posts', path, stdout=io.StringIO())
+            with open(path) as dump:
+                self.assertEqual([json.loads(line)['model'] for line in dump], ['user', 'post', 'comment'])
+            call_command('import_posts', path, stdout=io.StringIO())
+
+        imported = Post.objects.exclude(pk=post.pk).get()
+        self.assertGreater(imported.pk, hidden.pk)
+        self.assertEqual((imported.text, imported.author), ('original', author))
+        self.assertEqual(list(post.comments.values_list('text', flat=True)), ['original comment'])
+        self.assertEqual(list(imported.comments.values_list('text', flat=True)), ['original comment'])
+
+    def test_export_resumes_from_checkpoint(self):
+        author = User.objects.create(username='author', email='author@email.com')
+        for name in ('first', 'second', 'third'):
+            post = Post.objects.create(text=name, author=author)
+            Post.objects.filter(pk=post.pk).update(image=f'posts/{name}.png')
+        with TemporaryDirectory() as temp_directory, override_settings(MEDIA_ROOT=temp_directory):
+            os.makedirs(f'{temp_directory}/posts')
+            for name in ('first', 'second', 'third'):
+                with open(f'{temp_directory}/posts/{name}.png', 'wb') as image:
+                    image.write(name.encode())
+            path, images = f'{temp_directory}/dump.jsonl', f'{temp_directory}/images.tar'
+            options = {'chunk_size': 1, 'checkpoint': f'{temp_directory}/export.json', 'images': images,
+                       'stdout': io.StringIO()}
+            save_checkpoint = export_posts.Command._save_checkpoint
+            saved = []
+
+            def interrupt_after_two(command, *args):
+                if len(saved) == 2:
+                    raise KeyboardInterrupt
+                saved.append(save_checkpoint(command, *args))
+
+            with mock.patch.object(export_posts.Command, '_save_checkpoint', interrupt_after_two):
+                with self.assertRaises(KeyboardInterrupt):
+                    call_command('export_posts', path, **options)
+            with open(path, 'a') as dump:
+                dump.write('{"model": "po')
+            call_command('export_posts', path, **options)
+
+            with open(path) as dump:
+                self.assertEqual([json.loads(line).get('text') for line in dump],
+                                 [None, 'first', 'second', 'third'])
+            with tarfile.open(images) as archive:
+                self.assertEqual(archive.getnames(), ['posts/first.png', 'posts/second.png', 'posts/third.png'])
+
+    def test_import_resumes_from_checkpoint(self):
+        with TemporaryDirectory() as temp_directory:
+            path = f'{temp_directory}/dump.jsonl'
+            with open(path, 'w') as dump:
+                for name in ('first', 'second'):
+                    dump.write(json.dumps({'model': 'group', 'slug': name, 'title': name, 'description': ''}) + '\n')
+            with open(f'{temp_directory}/import.json', 'w') as checkpoint:
+                json.dump({'line': 1}, checkpoint)
+            call_command('import_posts', path, checkpoint=f'{temp_directory}/import.json', skip_rebuild=True,
+                         stdout=io.StringIO())
+        self.assertEqual(list(Group.objects.values_list('slug', flat=True)), ['second'])
+
+
+@override_settings(TASKS_EAGER=True)
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', email='author@email.com', password='12345')
+        self.reader = User.objects.create_user(username='reader', email='reader@email.com', password='12345')
+        self.group = Group.objects.create(title='Group', slug='group', description='')
+        self.post = Post.objects.create(text='text', author=self.author, group=self.group)
+        self.urls = [
+            reverse('post', kwargs={'username': 'author', 'post_id': self.post.pk}),
+            reverse('profile', kwargs={'username': 'author'}),
+            reverse('group', kwargs={'slug': 'group'}),
+        ]
+
+    def test_not_modified_without_rendering(self):
+        for url in self.urls:
+            response = self.client.get(url)
+            self.assertIn('Cookie', response['Vary'])
+            with self.assertNumQueries(1):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_changes_invalidate_etag(self):
+        etags = [self.client.get(url)['ETag'] for url in self.urls]
+        Comment.objects.create(post=self.post, author=self.reader, text='comment')
+        for url, etag in zip(self.urls, etags):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(self.urls[1])['ETag']
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(self.client.get(self.urls[1], HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        etag = self.client.get(self.urls[2])['ETag']
+        self.group.description = 'changed'
+        self.group.save()
+        self.assertEqual(self.client.get(self.urls[2], HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_changes_move_last_modified(self):
+        last_modified = [self.client.get(url)['Last-Modified'] for url in self.urls]
+        # HTTP dates have a resolution of one second
+        with mock.patch('posts.page_cache.time') as clock:
+            clock.time.return_value = time.time() + 5
+            self.post.text = 'edited'
+            self.post.save()
+            Follow.objects.create(user=self.reader, author=self.author)
+        for url, date in zip(self.urls, last_modified):
+            self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=date).status_code, 200)
+
+    def test_etag_differs_per_user(self):
+        for url in self.urls:
+            etag = self.client.get(url)['ETag']
+            self.client.force_login(self.reader)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('Last-Modified', response)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+            self.client.logout()
+
+
+def _jpeg(size=(100, 100), color=(255, 0, 0)):
+    bytes_image = io.BytesIO()
+    Image.new('RGB', size=size, color=color).save(bytes_image, format='jpeg')
+    return bytes_image.getvalue()
+
+
+@override_settings(TASKS_EAGER=True)
+class TestImageStorage(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(username='author', email='author@email.com')
+        self.auth_client = Client()
+        self.auth_client.force_login(self.user)
+        self.temp_directory = TemporaryDirectory()
+        self.media = override_settings(MEDIA_ROOT=self.temp_directory.name)
+        self.media.enable()
+
+    def tearDown(self):
+        self.media.disable()
+        self.temp_directory.cleanup()
+
+    def test_identical_uploads_share_a_file(self):
+        for name in ('first.jpeg', 'second.jpeg'):
+            self.auth_client.post(reverse('new_post'), data={'text': 'text', 'image': ContentFile(_jpeg(), name)})
+        first, second = Post.objects.order_by('pk')
+        digest = hashlib.sha256(_jpeg()).hexdigest()
+        self.assertEqual(first.image.name, f'posts/{digest[:2]}/{digest[2:4]}/{digest}.jpg')
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertEqual(ImageBlob.objects.get().refcount, 2)
+
+        path = first.image.path
+        first.delete()
+        self.assertTrue(os.path.exists(path))
+        second.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(ImageBlob.objects.exists())
+
+    def test_replacing_image_releases_the_old_one(self):
+        post = Post.objects.create(text='text', author=self.user, image=ContentFile(_jpeg(), 'old.jpeg'))
+        old_path = post.image.path
+        post.image = ContentFile(_jpeg(color=(0, 0, 255)), 'new.jpeg')
+        post.save()
+        self.assertFalse(os.path.exists(old_path))
+        self.assertEqual(list(ImageBlob.objects.values_list('name', flat=True)), [post.image.name])
+
+    @override_settings(POST_IMAGE_MAX_SIZE=(200, 200))
+    def test_large_upload_is_downscaled(self):
+        post = Post.objects.create(text='text', author=self.user, image=ContentFile(_jpeg((1000, 500)), 'big.jpeg'))
+        with Image.open(post.image.path) as image:
+            self.assertEqual(image.size, (200, 100))
+
+    def test_migrate_images(self):
+        os.makedirs(os.path.join(self.temp_directory.name, 'posts'))
+        for name in ('a.jpeg', 'b.jpeg'):
+            with open(os.path.join(self.temp_directory.name, 'posts', name), 'wb') as image:
+                image.write(_jpeg())
+            post = Post.objects.create(text='text', author=self.user)
+            Post.objects.filter(pk=post.pk).update(image=f'posts/{name}')
+
+        output = io.StringIO()
+        call_command('migrate_images', stdout=output)
+        self.assertIn('Migrated 2 images into 1 files', output.getvalue())
+        names = set(Post.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(ImageBlob.objects.get(name=names.pop()).refcount, 2)
+        self.assertFalse(os.path.exists(os.path.join(self.temp_directory.name, 'posts', 'a.jpeg')))
+
+    def test_unpacked_images_are_counted(self):
+        post = Post.objects.create(text='text', author=self.user, image=ContentFile(_jpeg(), 'a.jpeg'))
+        name, path = post.image.name, post.image.path
+        with TemporaryDirectory() as temp_directory:
+            call_command('export_posts', f'{temp_directory}/dump.jsonl', images=f'{temp_directory}/images.tar',
+                         stdout=io.StringIO())
+            Post.objects.all().delete()
+            self.assertFalse(os.path.exists(path))
+            call_command('import_posts', f'{temp_directory}/dump.jsonl', images=f'{temp_directory}/images.tar',
+                         stdout=io.StringIO())
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
+
+        # A file already at its content-addressed name but without a blob row keeps its file
+        ImageBlob.objects.all().delete()
+        output = io.StringIO()
+        call_command('migrate_images', stdout=output)
+        self.assertIn('registered 1 stored images', output.getvalue())
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(ImageBlob.objects.get(name=name).refcount, 1)
+
+
+@override_settings(TASKS_EAGER=True, COMMENTS_PER_PAGE=3)
+class TestCommentPages(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author', email='author@email.com')
+        self.auth_client = Client()
+        self.auth_client.force_login(self.author)
+        self.post = Post.objects.create(text='text', author=self.author)
+        for number in range(7):
+            Comment.objects.create(post=self.post, author=self.author, text=f'reply {number}')
+        self.post_url = reverse('post', kwargs={'username': 'author', 'post_id': self.post.pk})
+
+    def test_first_page_inline_and_fragments(self):
+        response = self.client.get(self.post_url)
+        self.assertEqual([item.text for item in response.context['comments']],
+                         ['reply 0', 'reply 1', 'reply 2'])
+        self.assertNotContains(response, 'reply 3')
+
+        cursor = response.context['comments'].next_cursor
+        url = reverse('post_comments', kwargs={'username': 'author', 'post_id': self.post.pk})
+        with self.assertNumQueries(1):
+            response = self.client.get(url, {'cursor': cursor})
+        self.assertEqual([item.text for item in response.context['page']], ['reply 3', 'reply 4', 'reply 5'])
+        self.assertNotContains(response, '<html')
+        self.assertContains(response, 'data-fragment')
+
+    def test_new_comment_redirects_to_its_page(self):
+        url = reverse('add_comment', kwargs={'username': 'author', 'post_id': self.post.pk})
+        response = self.auth_client.post(url, {'text': 'newest'}, follow=True)
+        comment = Comment.objects.get(text='newest')
+        self.assertTrue(response.redirect_chain[-1][0].endswith(f'#comment_{comment.pk}'))
+        self.assertEqual([item.text for item in response.context['comments']],
+                         ['reply 5', 'reply 6', 'newest'])
+
+        Comment.objects.exclude(pk=comment.pk).delete()
+        response = self.auth_client.post(url, {'text': 'second'})
+        second = Comment.objects.get(text='second')
+        self.assertEqual(response['Location'], f'{self.post_url}#comment_{second.pk}')
+
+
+@override_settings(TASKS_EAGER=True, WRITE_BEHIND=True)
+class TestWriteBehind(TestCase):
+    def setUp(self):
+        cache.clear()
+        write_behind.drain()
+        self.author = User.objects.create(username='author', email='author@email.com')
+        self.reader = User.objects.create(username='reader', email='reader@email.com')
+        self.post = Post.objects.create(text='text', author=self.author)
+        self.client.force_login(self.reader)
+        self.post_url = reverse('post', kwargs={'username': 'author', 'post_id': self.post.pk})
+
+    def test_comment_is_visible_to_its_author_before_commit(self):
+        url = reverse('add_comment', kwargs={'username': 'author', 'post_id': self.post.pk})
+        response = self.client.post(url, {'text': 'queued comment'})
+        self.assertRedirects(response, f'{self.post_url}#comments', fetch_redirect_response=False)
+        self.assertFalse(Comment.objects.exists())
+        self.assertContains(self.client.get(self.post_url), 'queued comment')
+        self.assertNotContains(Client().get(self.post_url), 'queued comment')
+
+        self.assertEqual(write_behind.drain(), 1)
+        self.assertEqual(Post.objects.get().comments_count, 1)
+        self.assertEqual(write_behind.pending(self.reader.pk), [])
+        self.assertContains(self.client.get(self.post_url), 'queued comment', count=1)
+
+    def test_queued_writes_change_the_etag(self):
+        profile_url = reverse('profile', kwargs={'username': 'author'})
+        post_etag = self.client.get(self.post_url)['ETag']
+        profile_etag = self.client.get(profile_url)['ETag']
+        self.client.post(reverse('add_comment', kwargs={'username': 'author', 'post_id': self.post.pk}),
+                         {'text': 'queued comment'})
+        self.client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        response = self.client.get(self.post_url, HTTP_IF_NONE_MATCH=post_etag)
+        self.assertContains(response, 'queued comment')
+        response = self.client.get(profile_url, HTTP_IF_NONE_MATCH=profile_etag)
+        self.assertTrue(response.context['following'])
+        self.assertEqual(self.client.get(profile_url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+
+    def test_follow_and_unfollow_are_batched(self):
+        profile_url = reverse('profile', kwargs={'username': 'author'})
+        self.client.get(reverse('profile_follow', kwargs={'username': 'author'}))
+        self.assertTrue(self.client.get(profile_url).context['following'])
+        self.assertFalse(Follow.objects.exists())
+        write_behind.drain()
+        self.assertTrue(Follow.objects.filter(user=self.reader, author=self.author).exists())
+
+        self.client.get(reverse('profile_unfollow', kwargs={'username': 'author'}))
+        self.assertFalse(self.client.get(profile_url).context['following'])
+        write_behind.drain()
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(UserStats.objects.get(user=self.author).followers_count, 0)
+
+    def test_spill_and_replay(self):
+        with TemporaryDirectory() as temp_directory, override_settings(WRITE_BEHIND_SPILL_DIR=temp_directory):
+            write_behind.submit_comment(self.post, self.reader, 'spilled')
+            write_behind.shutdown()
+            self.assertEqual(len(os.listdir(temp_directory)), 1)
+            output = io.StringIO()
+            call_command('replay_write_behind', stdout=output)
+            self.assertIn('Replayed 1 writes', output.getvalue())
+            self.assertEqual(os.listdir(temp_directory), [])
+        self.assertTrue(Comment.objects.filter(text='spilled').exists())
+
+    @override_settings(WRITE_BEHIND_MAX_QUEUE=1, WRITE_BEHIND_PUT_TIMEOUT=0.01)
+    def test_full_queue_writes_synchronously(self):
+        write_behind._queue = None
+        try:
+            write_behind.submit_comment(self.post, self.reader, 'queued')
+            write_behind.submit_comment(self.post, self.reader, 'direct')
+            self.assertEqual(list(Comment.objects.values_list('text', flat=True)), ['direct'])
+            self.assertEqual([op['payload']['text'] for op in write_behind.pending(self.reader.pk)], ['queued'])
+            write_behind.drain()
+        finally:
+            write_behind._queue = None
+        self.assertEqual(Comment.objects.count(), 2)
+        self.assertEqual(write_behind.pending(self.reader.pk), [])
+
+    def test_writer_committing_before_submit_returns_leaves_nothing_pending(self):
+        queued = write_behind._get_queue()
+        put = queued.put
+
+        def put_and_commit(op, timeout=None):
+            put(op, timeout=timeout)
+            write_behind.drain()
+
+        with mock.patch.object(queued, 'put', put_and_commit):
+            write_behind.submit_comment(self.post, self.reader, 'fast writer')
+        self.assertTrue(Comment.objects.filter(text='fast writer').exists())
+        self.assertEqual(write_behind.pending(self.reader.pk), [])
+
+
+@override_settings(TASKS_EAGER=True)
+class TestRecommendations(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader, self.friend, self.author, self.writer, self.neighbour = [
+            User.objects.create(username=name, email=f'{name}@email.com')
+            for name in ('reader', 'friend', 'author', 'writer', 'neighbour')
+        ]
+        Follow.objects.create(user=self.reader, author=self.friend)
+        Follow.objects.create(user=self.neighbour, author=self.friend)
+        Follow.objects.create(user=self.neighbour, author=self.author)
+        group = Group.objects.create(title='Group', slug='group', description='')
+        Post.objects.create(text='text', author=self.friend, group=group)
+        Post.objects.create(text='text', author=self.writer, group=group)
+
+    def suggested(self, user):
+        return list(Recommendation.objects.filter(user=user).order_by('rank')
+                    .values_list('suggested__username', 'reason'))
+
+    def test_cofollow_and_group_suggestions(self):
+        list(recommendations.refresh(full=True))
+        self.assertEqual(self.suggested(self.reader), [('author', 'cofollow'), ('writer', 'group')])
+        self.client.force_login(self.reader)
+        response = self.client.get(reverse('follow_index'))
+        self.assertEqual([item.suggested for item in response.context['recommendations']], [self.author, self.writer])
+
+    def test_followed_authors_are_hidden_before_refresh(self):
+        list(recommendations.refresh(full=True))
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual([item.suggested for item in recommendations.for_user(self.reader)], [self.writer])
+
+    def test_refresh_only_touches_stale_users(self):
+        list(recommendations.refresh(full=True))
+        Recommendation.objects.filter(user=self.neighbour).delete()
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.assertEqual(list(recommendations.refresh()), [2])
+        self.assertEqual(self.suggested(self.reader), [('writer', 'group')])
+        self.assertEqual(self.suggested(self.neighbour), [('writer', 'group')])
+        self.assertEqual(list(recommendations.refresh()), [])
+
+    @override_settings(RECOMMENDATION_MAX_COFOLLOWERS=5)
+    def test_cofollowers_are_sampled(self):
+        followers = list(range(100))
+        self.assertEqual(recommendations.sample(followers[:5]), followers[:5])
+        samples = [recommendations.sample(followers, random.Random(seed)) for seed in range(10)]
+        self.assertEqual(samples[0], recommendations.sample(followers, random.Random(0)))
+        self.assertEqual({len(drawn) for drawn in samples}, {5})
+        self.assertGreater(max(max(drawn) for drawn in samples), 50)
+
+    def test_graph_keeps_sorted_id_arrays(self):
+        Follow.objects.create(user=self.reader, author=self.author)
+        graph = recommendations.FollowGraph()
+        self.assertEqual(graph.following[self.reader.pk], array('i', sorted([self.friend.pk, self.author.pk])))
+        self.assertEqual(graph.followers[self.friend.pk], array('i', sorted([self.reader.pk, self.neighbour.pk])))
+
+    @override_settings(RECOMMENDATION_MAX_COFOLLOWERS=1)
+    def test_mark_stale_takes_a_window_of_followers(self):
+        StaleRecommendation.objects.all().delete()
+        with self.assertNumQueries(4), mock.patch('random.randint', return_value=1) as randint:
+            recommendations.mark_stale(self.reader.pk, self.friend.pk)
+        # Two followers of friend, one drawn from the window at offset 1
+        randint.assert_called_once_with(0, 1)
+        self.assertEqual(set(StaleRecommendation.objects.values_list('user_id', flat=True)),
+                         {self.reader.pk, self.neighbour.pk})
+
+    def test_command(self):
+        output = io.StringIO()
+        call_command('refresh_recommendations', full=True, stdout=output)
+        self.assertIn('Refreshed 4 users', output.getvalue())
+
+
+@override_settings(TASKS_EAGER=True)
+class TestTrending(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author', email='author@email.com')
+        self.quiet, self.busy = [Group.objects.create(title=slug, slug=slug, description='')
+                                 for slug in ('quiet', 'busy')]
+        self.old = Post.objects.create(text='old', author=self.author, group=self.quiet)
+        self.new = Post.objects.create(text='new', author=self.author, group=self.busy)
+
+    def comment(self, post, count):
+        for number in range(count):
+            Comment.objects.create(post=post, author=self.author, text=f'reply {number}')
+
+    def test_activity_is_counted_per_hour(self):
+        self.comment(self.new, 3)
+        self.assertEqual(PostActivity.objects.get(post=self.new).count, 3)
+        self.assertEqual(GroupActivity.objects.get(group=self.busy).count, 4)
+
+    def test_recent_activity_outweighs_older(self):
+        self.comment(self.old, 3)
+        self.comment(self.new, 2)
+        earlier = trending.hour_of(timezone.now()) - timedelta(hours=12)
+        PostActivity.objects.filter(post=self.old).update(hour=earlier)
+        GroupActivity.objects.filter(group=self.quiet).update(hour=earlier)
+        self.assertEqual(trending.refresh(), (2, 2))
+        self.assertEqual(trending.posts(), [self.new, self.old])
+        self.assertEqual(trending.groups(), [self.busy, self.quiet])
+
+        response = self.client.get(reverse('trending'))
+        self.assertEqual(response.context['posts'], [self.new, self.old])
+        with self.assertNumQueries(0):
+            self.client.get(reverse('trending'))
+
+    def test_expired_buckets_are_dropped(self):
+        self.comment(self.old, 1)
+        trending.refresh(now=timezone.now() + timedelta(hours=settings.TRENDING_WINDOW_HOURS + 1))
+        self.assertFalse(PostActivity.objects.exists())
+        self.assertFalse(TrendingGroup.objects.exists())
+
+    def test_sidebar_follows_refresh(self):
+        url = reverse('group', kwargs={'slug': 'quiet'})
+        self.comment(self.old, 1)
+        trending.refresh()
+        self.assertEqual(self.client.get(url).context['trending_groups'], [self.quiet, self.busy])
+        self.comment(self.new, 2)
+        trending.refresh()
+        self.assertEqual(self.client.get(url).context['trending_groups'], [self.busy, self.quiet])
+
+    def test_rebuild_command(self):
+        self.comment(self.new, 2)
+        PostActivity.objects.all().delete()
+        output = io.StringIO()
+        call_command('refresh_trending', rebuild=True, stdout=output)
+        self.assertIn('Trending: 1 posts, 2 groups', output.getvalue())
+        self.assertEqual(PostActivity.objects.get(post=self.new).count, 2)
+
+
+@override_settings(TASKS_EAGER=True)
+class TestStreamedPages(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create(username='author', email='author@email.com')
+        for number in range(3):
+            Post.objects.create(text=f'streamed post {number}', author=self.author)
+
+    def test_shell_is_sent_before_the_cards(self):
+        response = self.client.get(reverse('index'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(len(response.context['page_obj']), 3)
+        chunks = [chunk.decode() for chunk in response.streaming_content]
+        self.assertIn('<head>', chunks[0])
+        self.assertNotIn('streamed post', chunks[0])
+        self.assertEqual(len(chunks), 5)
+        self.assertIn('streamed post 2', chunks[1])
+        self.assertIn('</html>', chunks[-1])
+
+    def test_streamed_page_is_cached_when_complete(self):
+        url = reverse('profile', kwargs={'username': 'author'})
+        streamed = self.client.get(url).getvalue()
+        # Only the freshness query of the conditional GET
+        with self.assertNumQueries(1):
+            cached = self.client.get(url)
+        self.assertFalse(cached.streaming)
+        self.assertEqual(cached.content, streamed)
+
+    @override_settings(FEED_STREAMING=False)
+    def test_streaming_can_be_disabled(self):
+        response = self.client.get(reverse('index'))
+        self.assertFalse(response.streaming)
+        self.assertContains(response, 'streamed post 0')
+
+
+@override_settings(TASKS_EAGER=True)
+class TestDeletion(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', email='author@email.com', password='12345')
+        self.reader = User.objects.create_user(username='reader', email='reader@email.com', password='12345')
+        Follow.objects.create(user=self.reader, author=self.author)
+        self.post = Post.objects.create(text='doomed post', author=self.author)
+        self.other = Post.objects.create(text='reader post', author=self.reader)
+        for number in range(3):
+            Comment.objects.create(post=self.post, author=self.reader, text=f'reply {number}')
+        Comment.objects.create(post=self.other, author=self.author, text='author reply')
+
+    def test_post_is_hidden_and_purged(self):
+        self.client.force_login(self.author)
+        response = self.client.post(reverse('post_delete', kwargs={'username': 'author', 'post_id': self.post.pk}))
+        self.assertRedirects(response, reverse('profile', kwargs={'username': 'author'}))
+        self.assertFalse(Post.objects.filter(pk=self.post.pk).exists())
+        self.assertEqual(UserStats.objects.get(pk=self.author.pk).posts_count, 0)
+        # TASKS_EAGER ran the purge right away
+        self.assertFalse(Post.all_objects.filter(pk=self.post.pk).exists())
+        self.assertFalse(Comment.objects.filter(post_id=self.post.pk).exists())
+        self.assertFalse(FeedEntry.objects.filter(post_id=self.post.pk).exists())
+        job = DeletionJob.objects.get()
+        # Feed entry, 3 comments, activity bucket, the post
+        self.assertEqual((job.deleted, job.total), (6, 6))
+        self.assertIsNotNone(job.finished_date)
+
+    @override_settings(TASKS_EAGER=False)
+    def test_hidden_post_leaves_the_pages_before_the_purge(self):
+        deletion.delete_post(self.post)
+        self.assertTrue(Post.all_objects.get(pk=self.post.pk).is_deleted)
+        self.assertNotIn(b'doomed post', self.client.get(reverse('index')).getvalue())
+        self.client.force_login(self.reader)
+        self.assertEqual(list(self.client.get(reverse('follow_index')).context['page_obj']), [])
+        response = self.client.get(reverse('post', kwargs={'username': 'author', 'post_id': self.post.pk}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_search_index_survives_the_purge(self):
+        Post.objects.create(text='doomed sibling', author=self.reader)
+        deletion.delete_post(self.post)
+        call_command('rebuild_search_index', stdout=io.StringIO())
+        deletion.delete_user(self.author)
+        deletion.run_job()
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {search.TABLE} ({search.TABLE}) VALUES ('integrity-check')")
+        self.assertEqual([post.text for post in search.search('doomed', 10)], ['doomed sibling'])
+        self.assertEqual(self.client.get(reverse('search'), {'q': 'doomed'}).status_code, 200)
+
+    def test_user_is_purged_in_batches(self):
+        job = deletion.delete_user(self.author)
+        self.assertEqual(deletion.delete_user(self.author), job)
+        self.assertFalse(User.objects.get(pk=self.author.pk).is_active)
+        self.assertFalse(Post.objects.filter(author=self.author).exists())
+        self.assertEqual(UserStats.objects.get(pk=self.reader.pk).following_count, 0)
+        self.assertEqual(self.client.get(reverse('profile', kwargs={'username': 'author'})).status_code, 404)
+
+        progress = [job.deleted for job in deletion.purge(deletion.claim_job(), batch_size=1)]
+        self.assertEqual(progress, list(range(1, len(progress))) + [len(progress) - 1])
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+        self.assertFalse(Follow.objects.exists())
+        self.assertEqual(list(Post.all_objects.all()), [self.other])
+        self.assertEqual(Post.objects.get(pk=self.other.pk).comments_count, 0)
+        self.assertIsNone(deletion.claim_job())
+
+    def test_purge_command(self):
+        deletion.delete_user(self.author)
+        output = io.StringIO()
+        call_command('purge_deleted', once=True, batch_size=2, stdout=output)
+        self.assertIn('User author: purged', output.getvalue())
+        self.assertFalse(User.objects.filter(pk=self.author.pk).exists())
+
+    def test_admin_deletes_softly(self):
+        User.objects.create_superuser(username='admin', email='admin@email.com', password='12345')
+        self.client.login(username='admin', password='12345')
+        url = reverse('admin:auth_user_delete', args=[self.author.pk])
+        self.assertEqual(self.client.post(url, {'post': 'yes'}).status_code, 302)
+        self.assertFalse(User.objects.get(pk=self.author.pk).is_active)
+        self.assertTrue(DeletionJob.objects.filter(kind=DeletionJob.USER, finished_date=None).exists())
+
+
+@override_settings(TASKS_EAGER=True)
+class TestAdminChangelist(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_superuser(username='admin', email='admin@email.com', password='12345')
+        self.client.force_login(self.author)
+        Post.objects.bulk_create([Post(text=f'post {number}', author=self.author) for number in range(101)])
+        self.old = Post.objects.order_by('pk').first()
+        Post.objects.filter(pk=self.old.pk).update(pub_date=timezone.now() - timedelta(days=400))
+
+    def test_pages_by_keyset_without_counting(self):
+        url = reverse('admin:posts_post_changelist')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+        changelist = response.context['cl']
+        self.assertEqual(len(changelist.result_list), 100)
+        self.assertTrue(changelist.result_count_is_estimate)
+        self.assertContains(response, changelist.next_page_url.replace('&', '&amp;'))
+
+        changelist = self.client.get(url + changelist.next_page_url).context['cl']
+        self.assertEqual(list(changelist.result_list), [self.old])
+        self.assertFalse(changelist.keyset_page.has_next())
+
+    @override_settings(ADMIN_COUNT_CAP=10)
+    def test_filtered_count_is_capped(self):
+        year = timezone.now().year
+        response = self.client.get(reverse('admin:posts_post_changelist'), {'pub_date__year': year})
+        changelist = response.context['cl']
+        self.assertEqual((changelist.result_count, changelist.result_count_is_capped), (10, True))
+        self.assertNotIn(self.old, changelist.result_list)
+
+    def test_date_hierarchy_seeks_the_index(self):
+        Comment.objects.create(post=self.old, author=self.author, text='reply')
+        for queryset in (Post.objects.all(), Comment.objects.all()):
+            field = 'pub_date' if queryset.model is Post else 'created_date'
+            indexed = IndexedDatesQuerySet(queryset.model, query=queryset.query)
+            for kind in ('year', 'month', 'day'):
+                self.assertEqual(indexed.dates(field, kind), list(queryset.dates(field, kind)))
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertContains(response, f'pub_date__year={self.old.pub_date.year - 1}')
+
+    def test_other_changelists(self):
+        Follow.objects.create(user=self.author, author=User.objects.create(username='author'))
+        for name in ('comment', 'follow'):
+            self.assertEqual(self.client.get(reverse(f'admin:posts_{name}_changelist')).status_code, 200)
+
+
+@override_settings(TASKS_EAGER=True)
+class TestRendering(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', email='author@email.com', password='12345')
+        self.client.force_login(self.author)
+
+    @override_settings(POST_MARKDOWN=True)
+    def test_body_is_rendered_on_save(self):
+        self.client.post(reverse('new_post'), {'text': '**bold** <script>x</script> [link](javascript:alert(1))'})
+        post = Post.objects.get()
+        self.assertEqual(post.render_version, rendering.version())
+        self.assertIn('<strong>bold</strong> &lt;script&gt;', post.text_html)
+        self.assertNotIn('javascript', post.text_html)
+        self.assertIn(post.text_html.encode(), self.client.get(reverse('index')).getvalue())
+
+        url = reverse('add_comment', kwargs={'username': 'author', 'post_id': post.pk})
+        self.client.post(url, {'text': 'first line\nsecond _line_'})
+        self.assertEqual(Comment.objects.get().text_html, '<p>first line<br />\nsecond <em>line</em></p>')
+
+    def test_plain_text_by_default(self):
+        post = Post.objects.create(text='**not bold**\n<b>', author=self.author)
+        self.assertEqual(post.text_html, '**not bold**<br>&lt;b&gt;')
+
+    @override_settings(POST_MARKDOWN=True)
+    def test_backfill_command(self):
+        post = Post.objects.create(text='*old*', author=self.author)
+        Post.objects.filter(pk=post.pk).update(text_html='', render_version=0)
+        version = Post.objects.get(pk=post.pk).version
+        # Not rendered yet: the template falls back to the plain text
+        self.assertIn(b'*old*', self.client.get(reverse('index')).getvalue())
+
+        output = io.StringIO()
+        call_command('render_bodies', batch_size=1, stdout=output)
+        self.assertIn('Post: rendered 1', output.getvalue())
+        post = Post.objects.get(pk=post.pk)
+        self.assertEqual((post.text_html, post.render_version), ('<p><em>old</em></p>', rendering.version()))
+        self.assertEqual(post.version, version + 1)
+        self.assertIn(b'<em>old</em>', self.client.get(reverse('index')).getvalue())
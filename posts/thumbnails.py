@@ -0,0 +1,84 @@
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from sorl.thumbnail import default, delete, get_thumbnail
+from sorl.thumbnail.conf import defaults as sorl_defaults, settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+from .models import Post, ThumbnailJob
+from .storage import image_storage
+from . import cards, page_cache
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(image):
+    if image:
+        ThumbnailJob.objects.get_or_create(image=image.name)
+
+
+def release_image(name):
+    """Drop one reference to a stored image, its thumbnails go together with the last one."""
+    if image_storage.release(name):
+        ThumbnailJob.objects.filter(image=name).delete()
+        delete(_image_file(name), delete_file=False)
+
+
+def _image_file(name):
+    # Go through the model field so the source storage (and thus the thumbnail name) matches templates
+    return Post(image=name).image
+
+
+def ready_thumbnail(image, alias):
+    """Return the thumbnail of image for the POST_THUMBNAILS alias if it was already generated, else None."""
+    geometry, options = settings.POST_THUMBNAILS[alias]
+    options = dict(options)
+    backend = default.backend
+    source = ImageFile(image)
+    # Same option defaults as ThumbnailBackend.get_thumbnail, which would render the image right away
+    if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+        options.setdefault('format', backend._get_format(source))
+    for key, value in backend.default_options.items():
+        options.setdefault(key, value)
+    for key, attr in backend.extra_options:
+        value = getattr(sorl_settings, attr)
+        if value != getattr(sorl_defaults, attr):
+            options.setdefault(key, value)
+    name = backend._get_thumbnail_filename(source, geometry, options)
+    return default.kvstore.get(ImageFile(name, default.storage))
+
+
+def generate(name):
+    """Render every thumbnail size used by the templates, return an error message or None."""
+    try:
+        for geometry, options in settings.POST_THUMBNAILS.values():
+            get_thumbnail(_image_file(name), geometry, **options)
+    except Exception as error:
+        logger.exception('Thumbnail generation for %s failed', name)
+        return str(error) or error.__class__.__name__
+    return None
+
+
+def claim_jobs(limit):
+    """Lease up to limit pending jobs so that concurrent workers never process the same image."""
+    now = timezone.now()
+    available = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+    ids = list(ThumbnailJob.objects.filter(available).order_by('pk').values_list('pk', flat=True)[:limit])
+    lease = now + timedelta(seconds=settings.THUMBNAIL_JOB_LEASE)
+    ThumbnailJob.objects.filter(available, pk__in=ids).update(locked_until=lease)
+    return list(ThumbnailJob.objects.filter(pk__in=ids, locked_until=lease))
+
+
+def finish_job(job, error):
+    if error is None or job.attempts + 1 >= settings.THUMBNAIL_JOB_MAX_ATTEMPTS:
+        job.delete()
+    else:
+        ThumbnailJob.objects.filter(pk=job.pk).update(attempts=F('attempts') + 1, locked_until=None)
+    if error is None:
+        # Cached cards and pages still point at the original image
+        posts = Post.objects.filter(image=job.image).select_related('author', 'group')
+        cards.bump_versions(posts)
+        for post in posts:
+            page_cache.bump(*page_cache.post_scopes(post))
@@ -0,0 +1,120 @@
+"""
+Trending posts and groups.
+
+New comments and posts add one to an hourly bucket of their post (PostActivity) and group (GroupActivity)
+in a single UPDATE. The refresh_trending command runs periodically: it drops buckets older than
+TRENDING_WINDOW_HOURS, decays the rest by TRENDING_HALF_LIFE_HOURS and stores the best posts and groups in
+TrendingPost / TrendingGroup, which the pages read by rank without touching the activity tables.
+"""
+import heapq
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+from .models import Comment, Post, PostActivity, GroupActivity, TrendingPost, TrendingGroup
+from . import page_cache
+
+# Page cache scopes of the trending page and of the group sidebar
+POSTS_SCOPE = 'trending'
+GROUPS_SCOPE = 'trending_groups'
+
+
+def hour_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _add(model, field, object_id, hour):
+    buckets = model.objects.filter(**{field: object_id, 'hour': hour})
+    if not buckets.update(count=F('count') + 1):
+        # First activity of the hour; a concurrent writer may create the bucket first, hence ignore_conflicts
+        model.objects.bulk_create([model(**{field: object_id, 'hour': hour})], ignore_conflicts=True)
+        buckets.update(count=F('count') + 1)
+
+
+def record_comment(post_id, group_id, created_date):
+    hour = hour_of(created_date)
+    _add(PostActivity, 'post_id', post_id, hour)
+    if group_id:
+        _add(GroupActivity, 'group_id', group_id, hour)
+
+
+def record_post(group_id, pub_date):
+    _add(GroupActivity, 'group_id', group_id, hour_of(pub_date))
+
+
+def _window_start(now):
+    return hour_of(now) - timedelta(hours=settings.TRENDING_WINDOW_HOURS)
+
+
+def _best(model, field, since, now, limit):
+    """[(object id, score)] of the limit highest decayed sums of the buckets since."""
+    half_life = settings.TRENDING_HALF_LIFE_HOURS * 3600
+    scores = Counter()
+    for object_id, hour, count in model.objects.filter(hour__gte=since).values_list(field, 'hour', 'count')\
+            .iterator():
+        age = max((now - hour).total_seconds(), 0)
+        scores[object_id] += count * 0.5 ** (age / half_life)
+    return heapq.nlargest(limit, scores.items(), key=lambda item: (item[1], item[0]))
+
+
+def _replace(model, field, best):
+    """Store the new top list, return True when its order changed."""
+    old = list(model.objects.order_by('rank').values_list(field, flat=True))
+    with transaction.atomic():
+        model.objects.all().delete()
+        model.objects.bulk_create([model(rank=rank, score=score, **{field: object_id})
+                                   for rank, (object_id, score) in enumerate(best)])
+    return old != [object_id for object_id, score in best]
+
+
+def refresh(now=None):
+    """Expire old buckets and recompute both top lists, return the numbers of trending posts and groups."""
+    now = now or timezone.now()
+    since = _window_start(now)
+    PostActivity.objects.filter(hour__lt=since).delete()
+    GroupActivity.objects.filter(hour__lt=since).delete()
+    posts = _best(PostActivity, 'post_id', since, now, settings.TRENDING_POSTS)
+    groups = _best(GroupActivity, 'group_id', since, now, settings.TRENDING_GROUPS)
+    if _replace(TrendingPost, 'post_id', posts):
+        page_cache.bump(POSTS_SCOPE)
+    if _replace(TrendingGroup, 'group_id', groups):
+        page_cache.bump(GROUPS_SCOPE)
+    return len(posts), len(groups)
+
+
+def rebuild(now=None):
+    """Recount the buckets of the whole window from the comments and posts, e.g. after an import."""
+    now = now or timezone.now()
+    since = _window_start(now)
+    post_buckets, group_buckets = Counter(), Counter()
+    comments = Comment.objects.filter(created_date__gte=since).annotate(hour=TruncHour('created_date'))\
+        .values_list('post_id', 'post__group_id', 'hour').annotate(total=Count('pk')).order_by()
+    for post_id, group_id, hour, total in comments.iterator():
+        post_buckets[post_id, hour] += total
+        if group_id:
+            group_buckets[group_id, hour] += total
+    posts = Post.objects.filter(pub_date__gte=since).exclude(group=None).annotate(hour=TruncHour('pub_date'))\
+        .values_list('group_id', 'hour').annotate(total=Count('pk')).order_by()
+    for group_id, hour, total in posts.iterator():
+        group_buckets[group_id, hour] += total
+    with transaction.atomic():
+        PostActivity.objects.all().delete()
+        GroupActivity.objects.all().delete()
+        PostActivity.objects.bulk_create([PostActivity(post_id=post_id, hour=hour, count=count)
+                                          for (post_id, hour), count in post_buckets.items()])
+        GroupActivity.objects.bulk_create([GroupActivity(group_id=group_id, hour=hour, count=count)
+                                           for (group_id, hour), count in group_buckets.items()])
+    return refresh(now)
+
+
+def posts():
+    rows = TrendingPost.objects.filter(post__is_deleted=False).select_related('post__author', 'post__group')
+    return [row.post for row in rows.order_by('rank')]
+
+
+def groups():
+    return [row.group for row in TrendingGroup.objects.select_related('group').order_by('rank')]
@@ -1,26 +1,41 @@
 from django.urls import path
 from . import views
-from django.views.decorators.cache import cache_page
+from .page_cache import cache_feed
+from .conditional import conditional_page, post_modified, profile_modified, group_modified
 from .views import (IndexView,
                     GroupView,
+                    TrendingView,
                     ProfileView,
                     PostView,
                     NewPostView,
                     PostEditView,
                     PostDeleteView,
                     AddCommentView,
-                    SubscriptionPostsView,)
+                    PostCommentsView,
+                    SubscriptionPostsView,
+                    SearchView,)
 
 urlpatterns = [
-    path('', cache_page(20)(IndexView.as_view()), name='index'),
+    path('', cache_feed('index')(IndexView.as_view()), name='index'),
     path('follow/', SubscriptionPostsView.as_view(), name='follow_index'),
     path('<str:username>/follow/', views.profile_follow, name='profile_follow'),
     path('<str:username>/unfollow/', views.profile_unfollow, name='profile_unfollow'),
-    path('group/<slug:slug>/', GroupView.as_view(), name='group'),
+    path('trending/', cache_feed('trending')(TrendingView.as_view()), name='trending'),
+    path('group/<slug:slug>/',
+         conditional_page(group_modified, 'group:{slug}', 'trending_groups')(
+             cache_feed('group:{slug}', 'trending_groups')(GroupView.as_view())),
+         name='group'),
     path('new/', NewPostView.as_view(), name='new_post'),
-    path('<str:username>/', ProfileView.as_view(), name='profile'),
-    path('<str:username>/<int:post_id>/', PostView.as_view(), name='post'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('<str:username>/',
+         conditional_page(profile_modified, 'profile:{username}')(
+             cache_feed('profile:{username}')(ProfileView.as_view())),
+         name='profile'),
+    path('<str:username>/<int:post_id>/',
+         conditional_page(post_modified, 'profile:{username}')(PostView.as_view()),
+         name='post'),
     path('<str:username>/<int:post_id>/edit/', PostEditView.as_view(), name='post_edit'),
     path('<str:username>/<int:post_id>/delete/', PostDeleteView.as_view(), name='post_delete'),
     path('<str:username>/<int:post_id>/comment/', AddCommentView.as_view(), name='add_comment'),
+    path('<str:username>/<int:post_id>/comments/', PostCommentsView.as_view(), name='post_comments'),
 ]
\ No newline at end of file
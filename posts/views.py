@@ -1,47 +1,92 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.http import HttpResponse, HttpResponseRedirect, Http404
 from django.urls import reverse_lazy
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth import get_user_model
 from django.contrib.auth.mixins import LoginRequiredMixin, AccessMixin
 from django.urls import reverse
-from .models import Post, Group, Comment, Follow
+from .models import Post, Group, Comment, Follow, FeedEntry
 from .forms import PostForm, CommentForm
-from django.views.generic import (ListView, DetailView, CreateView, UpdateView, DeleteView)
+from .pagination import CursorPaginator, CursorPaginationMixin, InvalidCursor
+from .streaming import StreamingCardsMixin
+from . import deletion, feed, recommendations, search, thumbnails, trending, write_behind
+from django.views.generic import (ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView)
 
 User = get_user_model()
 
+COMMENTS_ORDERING = ('created_date', 'id')
 
-class IndexView(ListView):
+
+def comments_paginator(post_id):
+    comments = Comment.objects.filter(post_id=post_id).select_related('author')
+    return CursorPaginator(comments, settings.COMMENTS_PER_PAGE, ordering=COMMENTS_ORDERING)
+
+
+def comment_page_url(comment):
+    """URL of the post page listing comment, as the last entry of its comments page."""
+    url = reverse('post', kwargs={'username': comment.post.author.username, 'post_id': comment.post_id})
+    cursor = comments_paginator(comment.post_id).cursor_ending_at(comment)
+    if cursor is not None:
+        url += f'?comments={cursor}'
+    return f'{url}#comment_{comment.pk}'
+
+
+def latest_comments_url(post):
+    """Where a queued comment will show up: the page of the newest committed comment."""
+    url = reverse('post', kwargs={'username': post.author.username, 'post_id': post.pk})
+    latest = post.comments.order_by('-created_date', '-id').first()
+    cursor = latest and comments_paginator(post.pk).cursor_ending_at(latest)
+    if cursor:
+        url += f'?comments={cursor}'
+    return f'{url}#comments'
+
+
+def with_pending_comments(context_data, request, post_id, page):
+    """Show the visitor's own queued comments after the last page until the writer commits them."""
+    if write_behind.enabled() and not page.has_next():
+        context_data['pending_comments'] = write_behind.pending_comments(request.user, post_id)
+    return context_data
+
+
+class IndexView(StreamingCardsMixin, CursorPaginationMixin, ListView):
     model = Post
-    queryset = Post.objects.all().select_related('author', 'group').prefetch_related('comments')
+    queryset = Post.objects.all().select_related('author', 'group')
     template_name = 'index.html'
     paginate_by = 10
-    ordering = '-pub_date'
 
 
-class GroupView(ListView):
+class GroupView(StreamingCardsMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'group.html'
     paginate_by = 10
-    ordering = '-pub_date'
+    paginate_count_cap = 1000
 
     def get_queryset(self):
         return Post.objects.filter(group__slug=self.kwargs['slug'])\
-            .select_related('author', 'group').prefetch_related('comments')
+            .select_related('author', 'group')
 
     def get_context_data(self, *, object_list=None, **kwargs):
         group = get_object_or_404(Group, slug=self.kwargs['slug'])
         context_data = super().get_context_data(object_list=object_list, **kwargs)
         context_data['group'] = group
+        context_data['trending_groups'] = trending.groups()
         return context_data
 
 
-class ProfileView(ListView):
+class TrendingView(ListView):
+    """Posts with the most recent comment activity, precomputed by the refresh_trending command."""
+    template_name = 'trending.html'
+    context_object_name = 'posts'
+
+    def get_queryset(self):
+        return trending.posts()
+
+
+class ProfileView(StreamingCardsMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'profile.html'
     paginate_by = 10
-    ordering = '-pub_date'
 
     def get_queryset(self):
         return Post.objects.filter(author__username=self.kwargs['username']) \
@@ -49,19 +94,27 @@ class ProfileView(ListView):
 
     @property
     def extra_context(self):
+        author = get_object_or_404(User.objects.select_related('stats'), username=self.kwargs['username'],
+                                   is_active=True)
         if self.request.user.is_authenticated:
+            following = None
+            if write_behind.enabled():
+                following = write_behind.pending_following(self.request.user, author.pk)
+            if following is None:
+                following = Follow.objects.filter(user=self.request.user, author=author).exists()
             return {
-                'author': get_object_or_404(User, username=self.kwargs['username']),
-                'following': Follow.objects.filter(user=self.request.user).filter(author__username=self.kwargs['username'])
+                'author': author,
+                'following': following,
+                'recommendations': recommendations.for_user(author) if author == self.request.user else [],
             }
         return {
-            'author': get_object_or_404(User, username=self.kwargs['username']),
+            'author': author,
         }
 
 
 class PostView(DetailView):
     model = Post
-    queryset = Post.objects.all().select_related('author', 'group').prefetch_related('comments')
+    queryset = Post.objects.all().select_related('author__stats', 'group')
     template_name = 'post.html'
     pk_url_kwarg = 'post_id'
     context_object_name = 'post'
@@ -69,7 +122,33 @@ class PostView(DetailView):
     def get_context_data(self, **kwargs):
         context_data = super().get_context_data(**kwargs)
         context_data['form'] = CommentForm()
-        return context_data
+        try:
+            context_data['comments'] = comments_paginator(self.object.pk).page(self.request.GET.get('comments'))
+        except InvalidCursor:
+            raise Http404('Invalid cursor')
+        return with_pending_comments(context_data, self.request, self.object.pk, context_data['comments'])
+
+
+class PostCommentsView(CursorPaginationMixin, ListView):
+    """Later comment pages of a post as an HTML fragment, loaded by the "more comments" button."""
+    template_name = 'comments_page.html'
+    cursor_ordering = COMMENTS_ORDERING
+
+    def get_paginate_by(self, queryset):
+        return settings.COMMENTS_PER_PAGE
+
+    def get_queryset(self):
+        return Comment.objects.filter(post_id=self.kwargs['post_id'], post__author__username=self.kwargs['username'])\
+            .select_related('author')
+
+    def get_context_data(self, **kwargs):
+        context_data = super().get_context_data(**kwargs)
+        context_data.update({
+            'page': context_data['page_obj'],
+            'username': self.kwargs['username'],
+            'post_id': self.kwargs['post_id'],
+        })
+        return with_pending_comments(context_data, self.request, self.kwargs['post_id'], context_data['page_obj'])
 
 
 class NewPostView(LoginRequiredMixin, CreateView):
@@ -81,6 +160,7 @@ class NewPostView(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         form.instance.author = self.request.user
         form.save()
+        thumbnails.enqueue(form.instance.image)
         return super().form_valid(form)
 
 
@@ -98,6 +178,12 @@ class PostEditView(LoginRequiredMixin, AccessMixin, UpdateView):
                            'post_id': self.kwargs['post_id'],
                        })
 
+    def form_valid(self, form):
+        response = super().form_valid(form)
+        if 'image' in form.changed_data:
+            thumbnails.enqueue(form.instance.image)
+        return response
+
     @property
     def extra_context(self):
         return {'username': self.kwargs['username']}
@@ -105,7 +191,8 @@ class PostEditView(LoginRequiredMixin, AccessMixin, UpdateView):
     def dispatch(self, request, *args, **kwargs):
         if request.user.is_authenticated:
             if request.user.username != self.kwargs['username']:
-                return render(request, 'alert.html', {'message': 'У вас нет доступа на редактирование поста!'})
+                message = 'У вас нет доступа на редактирование поста!'
+                return render(request, 'alert.html', {'message': message})
             return super().dispatch(request, *args, **kwargs)
         return redirect('login')
 
@@ -118,10 +205,17 @@ class PostDeleteView(DeleteView):
     def get_success_url(self):
         return reverse_lazy('profile', kwargs={'username': self.kwargs['username']})
 
+    def delete(self, request, *args, **kwargs):
+        # Hidden at once, comments and feed entries are purged in the background
+        self.object = self.get_object()
+        deletion.delete_post(self.object)
+        return HttpResponseRedirect(self.get_success_url())
+
     def dispatch(self, request, *args, **kwargs):
         if request.user.is_authenticated:
             if request.user.username != self.kwargs['username']:
-                return render(request, 'alert.html', {'message': 'У вас нет доступа на удаление поста!'})
+                message = 'У вас нет доступа на удаление поста!'
+                return render(request, 'alert.html', {'message': message})
             return super().dispatch(request, *args, **kwargs)
         return redirect('login')
 
@@ -134,15 +228,14 @@ class AddCommentView(LoginRequiredMixin, CreateView):
     def form_valid(self, form):
         form.instance.post = Post.objects.select_related('author', 'group').get(id=self.kwargs['post_id'])
         form.instance.author = self.request.user
+        if write_behind.enabled():
+            write_behind.submit_comment(form.instance.post, self.request.user, form.cleaned_data['text'])
+            return redirect(latest_comments_url(form.instance.post))
         form.save()
         return super().form_valid(form)
 
     def get_success_url(self):
-        return reverse('post',
-                       kwargs={
-                           'username': self.kwargs['username'],
-                           'post_id': self.kwargs['post_id'],
-                       })
+        return comment_page_url(self.object)
 
     @property
     def extra_context(self):
@@ -152,28 +245,68 @@ class AddCommentView(LoginRequiredMixin, CreateView):
         }
 
 
-class SubscriptionPostsView(LoginRequiredMixin, ListView):
+class SubscriptionPostsView(LoginRequiredMixin, StreamingCardsMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'follow.html'
     paginate_by = 10
 
+    @property
+    def extra_context(self):
+        return {'recommendations': recommendations.for_user(self.request.user)}
+
     def get_queryset(self):
-        posts = Post.objects.filter(author__following__user=self.request.user)
-        return posts
+        queryset = feed.feed_queryset(self.request.user)
+        if queryset.model is FeedEntry:
+            self.cursor_ordering = ('-pub_date', '-post_id')
+        return queryset
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page, object_list, is_paginated = super().paginate_queryset(queryset, page_size)
+        if queryset.model is FeedEntry:
+            page.object_list = object_list = [entry.post for entry in object_list]
+        return paginator, page, object_list, is_paginated
+
+
+class SearchView(TemplateView):
+    template_name = 'search.html'
+    paginate_by = 10
+
+    def get_context_data(self, **kwargs):
+        context_data = super().get_context_data(**kwargs)
+        query = self.request.GET.get('q', '').strip()
+        try:
+            page = max(int(self.request.GET.get('page', 1)), 1)
+        except ValueError:
+            page = 1
+        # One extra row tells whether there is a next page without counting matches
+        posts = search.search(query, self.paginate_by + 1, (page - 1) * self.paginate_by)
+        context_data.update({
+            'query': query,
+            'posts': posts[:self.paginate_by],
+            'page': page,
+            'has_next': len(posts) > self.paginate_by,
+        })
+        return context_data
 
 
 @login_required
 def profile_follow(request, username):
-    author = get_object_or_404(User, username=username)
+    author = get_object_or_404(User, username=username, is_active=True)
     if request.user != author:
-        Follow.objects.get_or_create(user=request.user, author=author)
+        if write_behind.enabled():
+            write_behind.submit_follow(request.user, author)
+        else:
+            Follow.objects.get_or_create(user=request.user, author=author)
     return redirect('profile', username=username)
 
 
 @login_required
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
-    Follow.objects.get(user=request.user, author=author).delete()
+    if write_behind.enabled():
+        write_behind.submit_follow(request.user, author, follow=False)
+    else:
+        Follow.objects.get(user=request.user, author=author).delete()
     return redirect('profile', username=username)
 
 
@@ -0,0 +1,252 @@
+"""
+Optional write-behind path for comments and follows (WRITE_BEHIND setting).
+
+Requests validate the write and put it on a bounded in-process queue; one writer thread per process
+commits queued writes in batches, so bursts turn into a few short transactions instead of one lock
+fight per request. A full queue blocks the request for up to WRITE_BEHIND_PUT_TIMEOUT and then falls
+back to writing synchronously. Pending writes are kept per user in the cache until committed, so the
+author sees them right away. On shutdown whatever is still queued is spilled to WRITE_BEHIND_SPILL_DIR
+and replayed by the next writer to start (or by the replay_write_behind command).
+Under TASKS_EAGER no thread is started and drain() commits the queue in the calling thread.
+"""
+import atexit
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from .models import Comment, Follow
+
+logger = logging.getLogger(__name__)
+
+_queue = None
+_writer = None
+_stop = threading.Event()
+_lock = threading.Lock()
+
+
+def enabled():
+    return settings.WRITE_BEHIND
+
+
+def _get_queue():
+    global _queue
+    with _lock:
+        if _queue is None:
+            _queue = queue.Queue(maxsize=settings.WRITE_BEHIND_MAX_QUEUE)
+        return _queue
+
+
+def pending_key(user_id):
+    return f'write_behind:{user_id}'
+
+
+def pending(user_id):
+    """Writes of the user still waiting in the queue, oldest first."""
+    return cache.get(pending_key(user_id), [])
+
+
+def pending_comments(user, post_id):
+    if not user.is_authenticated:
+        return []
+    return [op['payload'] for op in pending(user.pk) if op['kind'] == 'comment' and op['payload']['post_id'] == post_id]
+
+
+def pending_following(user, author_id):
+    """True or False if the user has a queued follow or unfollow of author_id, None otherwise."""
+    state = None
+    for op in pending(user.pk):
+        if op['kind'] in ('follow', 'unfollow') and op['payload']['author_id'] == author_id:
+            state = op['kind'] == 'follow'
+    return state
+
+
+def _remember(op):
+    key = pending_key(op['user_id'])
+    cache.set(key, pending(op['user_id']) + [op], settings.WRITE_BEHIND_PENDING_TIMEOUT)
+
+
+def _forget(ops):
+    tokens = {}
+    for op in ops:
+        tokens.setdefault(op['user_id'], set()).add(op['token'])
+    for user_id, done in tokens.items():
+        left = [op for op in pending(user_id) if op['token'] not in done]
+        if left:
+            cache.set(pending_key(user_id), left, settings.WRITE_BEHIND_PENDING_TIMEOUT)
+        else:
+            cache.delete(pending_key(user_id))
+
+
+def submit(kind, user_id, **payload):
+    op = {'kind': kind, 'user_id': user_id, 'token': uuid.uuid4().hex, 'payload': payload}
+    # Remembered before it is queued: a writer committing it first must find it to forget it
+    _remember(op)
+    try:
+        # Blocking here is the backpressure: requests slow down instead of the queue growing unbounded
+        _get_queue().put(op, timeout=settings.WRITE_BEHIND_PUT_TIMEOUT)
+    except queue.Full:
+        logger.warning('Write-behind queue is full, writing %s synchronously', kind)
+        try:
+            # Forgets op once committed
+            _apply_batch([op])
+        except Exception:
+            _forget([op])
+            raise
+        return
+    _ensure_writer()
+
+
+def submit_comment(post, author, text):
+    submit('comment', author.pk, post_id=post.pk, text=text)
+
+
+def submit_follow(user, author, follow=True):
+    submit('follow' if follow else 'unfollow', user.pk, author_id=author.pk)
+
+
+def _apply(op):
+    payload = op['payload']
+    if op['kind'] == 'comment':
+        Comment.objects.create(post_id=payload['post_id'], author_id=op['user_id'], text=payload['text'])
+    elif op['kind'] == 'follow':
+        Follow.objects.get_or_create(user_id=op['user_id'], author_id=payload['author_id'])
+    elif op['kind'] == 'unfollow':
+        follows = Follow.objects.filter(user_id=op['user_id'], author_id=payload['author_id'])
+        for follow in follows.select_related('user', 'author'):
+            follow.delete()
+
+
+def _apply_batch(ops):
+    """Commit ops in one transaction; an op that fails (e.g. its post was deleted meanwhile) is dropped alone."""
+    with transaction.atomic():
+        for op in ops:
+            try:
+                with transaction.atomic():
+                    _apply(op)
+            except OperationalError:
+                raise
+            except Exception:
+                logger.exception('Dropping write-behind %s of user %s', op['kind'], op['user_id'])
+    _forget(ops)
+
+
+def _commit(ops):
+    for attempt in range(settings.WRITE_BEHIND_RETRIES):
+        try:
+            _apply_batch(ops)
+            return
+        except OperationalError:
+            logger.warning('Write-behind batch of %s failed, retrying', len(ops), exc_info=True)
+            time.sleep(0.1 * 2 ** attempt)
+    spill(ops)
+
+
+def _next_batch(first):
+    batch = [first]
+    deadline = time.monotonic() + settings.WRITE_BEHIND_BATCH_WAIT
+    while len(batch) < settings.WRITE_BEHIND_BATCH_SIZE:
+        remaining = deadline - time.monotonic()
+        try:
+            batch.append(_queue.get(timeout=remaining) if remaining > 0 else _queue.get_nowait())
+        except queue.Empty:
+            break
+    return batch
+
+
+def _write_loop():
+    try:
+        replay_spill()
+        while not _stop.is_set():
+            try:
+                first = _queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            _commit(_next_batch(first))
+    finally:
+        connection.close()
+
+
+def _ensure_writer():
+    global _writer
+    if settings.TASKS_EAGER:
+        return
+    with _lock:
+        if _writer is None or not _writer.is_alive():
+            _stop.clear()
+            _writer = threading.Thread(target=_write_loop, name='yatube-write-behind', daemon=True)
+            _writer.start()
+
+
+def drain():
+    """Commit everything queued so far in the calling thread, return the number of writes."""
+    written = 0
+    queued = _get_queue()
+    while True:
+        try:
+            first = queued.get_nowait()
+        except queue.Empty:
+            return written
+        batch = _next_batch(first)
+        _commit(batch)
+        written += len(batch)
+
+
+def spill(ops):
+    """Persist ops that could not be committed, one JSON object per line."""
+    if not ops:
+        return
+    os.makedirs(settings.WRITE_BEHIND_SPILL_DIR, exist_ok=True)
+    path = os.path.join(settings.WRITE_BEHIND_SPILL_DIR, f'{os.getpid()}-{time.time_ns()}.jsonl')
+    with open(f'{path}.tmp', 'w') as target:
+        for op in ops:
+            target.write(json.dumps(op) + '\n')
+        target.flush()
+        os.fsync(target.fileno())
+    os.replace(f'{path}.tmp', path)
+    logger.warning('Spilled %s write-behind ops to %s', len(ops), path)
+
+
+def replay_spill():
+    """Commit the ops spilled by earlier processes, return their number."""
+    directory = settings.WRITE_BEHIND_SPILL_DIR
+    if not os.path.isdir(directory):
+        return 0
+    replayed = 0
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith('.jsonl'):
+            continue
+        claimed = os.path.join(directory, f'{name}.{os.getpid()}.replaying')
+        try:
+            # Whoever renames the file first replays it
+            os.rename(os.path.join(directory, name), claimed)
+        except OSError:
+            continue
+        with open(claimed) as source:
+            ops = [json.loads(line) for line in source if line.strip()]
+        for start in range(0, len(ops), settings.WRITE_BEHIND_BATCH_SIZE):
+            _commit(ops[start:start + settings.WRITE_BEHIND_BATCH_SIZE])
+        os.remove(claimed)
+        replayed += len(ops)
+    return replayed
+
+
+@atexit.register
+def shutdown():
+    """Let the writer finish its batch, then spill whatever is still queued."""
+    if _writer is not None and _writer.is_alive():
+        _stop.set()
+        _writer.join(settings.WRITE_BEHIND_SHUTDOWN_TIMEOUT)
+    left = []
+    while _queue is not None:
+        try:
+            left.append(_queue.get_nowait())
+        except queue.Empty:
+            break
+    spill(left)
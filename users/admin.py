@@ -1,3 +1,15 @@
 from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.admin import UserAdmin
+from posts import deletion
+from posts.admin import SoftDeleteAdminMixin
 
-# Register your models here.
+User = get_user_model()
+
+
+class SoftDeleteUserAdmin(SoftDeleteAdminMixin, UserAdmin):
+    delete_function = staticmethod(deletion.delete_user)
+
+
+admin.site.unregister(User)
+admin.site.register(User, SoftDeleteUserAdmin)
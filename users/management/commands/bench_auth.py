@@ -0,0 +1,64 @@
+import uuid
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.management.commands.benchmark_views import benchmark_database
+from posts.models import Post
+
+User = get_user_model()
+
+ROUTES = ('index', 'follow_index', 'new_post', 'profile')
+
+
+def _database_settings():
+    """Stock session and authentication: both rows are read from the database on every request."""
+    middleware = ['django.contrib.auth.middleware.AuthenticationMiddleware'
+                  if path == 'users.middleware.CachedAuthenticationMiddleware' else path
+                  for path in settings.MIDDLEWARE]
+    return {'SESSION_ENGINE': 'django.contrib.sessions.backends.db', 'MIDDLEWARE': middleware}
+
+
+class Command(BaseCommand):
+    help = 'Compare SQL queries per authenticated request with database and cached sessions and users'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help='Requests per route')
+        parser.add_argument('--in-place', action='store_true',
+                            help='Use the configured database instead of a throwaway test database')
+
+    def handle(self, *args, **options):
+        with benchmark_database(options['in_place']), override_settings(TASKS_EAGER=True, DEBUG=False):
+            username = f'bench{uuid.uuid4().hex[:8]}'
+            user = User.objects.create_user(username=username, password='benchmark')
+            Post.objects.create(text='Benchmark post', author=user)
+            results = {name: self.measure(username, options['requests'], overrides)
+                       for name, overrides in (('database', _database_settings()), ('cached', {}))}
+
+        self.stdout.write(f'{"route":<14} {"database":>9} {"cached":>9} {"saved":>9}')
+        for route in ROUTES:
+            before, after = results['database'][route], results['cached'][route]
+            self.stdout.write(f'{route:<14} {before:>9.1f} {after:>9.1f} {before - after:>9.1f}')
+        saved = sum(results['database'].values()) - sum(results['cached'].values())
+        self.stdout.write(self.style.SUCCESS(f'{saved / len(ROUTES):.1f} queries saved per authenticated request'))
+
+    def measure(self, username, requests, overrides):
+        """Average queries per request of every route once the session and the user are warm."""
+        with override_settings(**overrides):
+            cache.clear()
+            client = Client()
+            client.login(username=username, password='benchmark')
+            averages = {}
+            for route in ROUTES:
+                url = reverse(route, kwargs={'username': username} if route == 'profile' else None)
+                client.get(url)
+                with CaptureQueriesContext(connection) as context:
+                    for _ in range(requests):
+                        client.get(url)
+                averages[route] = len(context.captured_queries) / requests
+        return averages
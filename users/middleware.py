@@ -0,0 +1,78 @@
+import copy
+import logging
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+logger = logging.getLogger(__name__)
+
+
+def user_cache_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def cache_user(user):
+    """Store user without the related objects it may have loaded, those go stale independently."""
+    user = copy.copy(user)
+    user._state = copy.copy(user._state)
+    user._state.fields_cache = {}
+    user.__dict__.pop('_prefetched_objects_cache', None)
+    try:
+        cache.set(user_cache_key(user.pk), user, settings.USER_CACHE_TIMEOUT)
+    except Exception:
+        logger.warning('Could not cache user %s', user.pk, exc_info=True)
+
+
+def forget_user(user_id):
+    try:
+        cache.delete(user_cache_key(user_id))
+    except Exception:
+        logger.warning('Could not drop cached user %s', user_id, exc_info=True)
+
+
+def _load_user(request):
+    try:
+        user_id = request.session[SESSION_KEY]
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return AnonymousUser()
+    try:
+        user = cache.get(user_cache_key(user_id))
+    except Exception:
+        logger.warning('User cache is unavailable', exc_info=True)
+        return get_user(request)
+    if user is None or backend_path not in settings.AUTHENTICATION_BACKENDS:
+        user = get_user(request)
+        if user.is_authenticated:
+            cache_user(user)
+        return user
+    # The checks django.contrib.auth.get_user does after loading the row
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if not session_hash or not constant_time_compare(session_hash, user.get_session_auth_hash()):
+        request.session.flush()
+        return AnonymousUser()
+    user.backend = backend_path
+    return user
+
+
+def get_cached_user(request):
+    if not hasattr(request, '_cached_user'):
+        request._cached_user = _load_user(request)
+    return request._cached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """
+    Drop-in for AuthenticationMiddleware that reads request.user from the cache instead of the users table.
+    Entries are written on login and on the first miss and dropped whenever the user row is saved or deleted,
+    which covers password changes. Any cache failure falls back to the database.
+    """
+
+    def process_request(self, request):
+        assert hasattr(request, 'session'), 'CachedAuthenticationMiddleware requires SessionMiddleware'
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .middleware import cache_user, forget_user
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if update_fields == frozenset(['last_login']):
+        # Saved by update_last_login after user_logged_in_cache ran: keep the freshly cached user warm
+        cache_user(instance)
+    else:
+        forget_user(instance.pk)
+
+
+@receiver(user_logged_in)
+def user_logged_in_cache(sender, request, user, **kwargs):
+    cache_user(user)
+
+
+@receiver(user_logged_out)
+def user_logged_out_cache(sender, request, user, **kwargs):
+    if user is not None:
+        forget_user(user.pk)
@@ -1,3 +1,77 @@
-from django.test import TestCase
+import io
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from .middleware import user_cache_key
+
+User = get_user_model()
+
+
+@override_settings(TASKS_EAGER=True)
+class TestCachedAuthentication(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='reader', email='reader@email.com', password='12345')
+        self.client.login(username='reader', password='12345')
+        self.url = reverse('new_post')
+
+    def test_warm_requests_skip_session_and_user_queries(self):
+        cache.delete(user_cache_key(self.user.pk))
+        with self.assertNumQueries(2):
+            # the user row on a miss plus the groups of the form
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_login_leaves_the_user_cached(self):
+        self.assertEqual(cache.get(user_cache_key(self.user.pk)), self.user)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    def test_password_change_logs_out_other_sessions(self):
+        self.client.get(self.url)
+        user = User.objects.get(pk=self.user.pk)
+        user.set_password('54321')
+        user.save()
+        self.assertRedirects(self.client.get(self.url), f'{reverse("login")}?next={self.url}')
+
+    def test_renamed_user_is_reloaded(self):
+        self.client.get(self.url)
+        User.objects.filter(pk=self.user.pk).update(username='stale')
+        self.assertEqual(self.client.get(self.url).context['user'].username, 'reader')
+        user = User.objects.get(pk=self.user.pk)
+        user.username = 'renamed'
+        user.save()
+        self.assertEqual(self.client.get(self.url).context['user'].username, 'renamed')
+
+    def test_falls_back_to_database_when_cache_fails(self):
+        with mock.patch('users.middleware.cache.get', side_effect=ConnectionError):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context['user'], self.user)
+
+    def test_logout(self):
+        self.client.get(self.url)
+        self.client.get(reverse('logout'))
+        self.assertIsNone(cache.get(user_cache_key(self.user.pk)))
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+
+class TestSignup(TestCase):
+    def test_names_of_site_pages_are_reserved(self):
+        for username in ('search', 'Trending'):
+            response = self.client.post(reverse('signup'), {'username': username, 'email': 'user@email.com',
+                                                            'password1': 'Yatube-12345', 'password2': 'Yatube-12345'})
+            self.assertFormError(response, 'form', 'username', 'This username is reserved.')
+        self.assertFalse(User.objects.exists())
+
+
+class TestBenchAuth(TestCase):
+    def test_reports_saved_queries(self):
+        output = io.StringIO()
+        call_command('bench_auth', requests=3, in_place=True, stdout=output)
+        self.assertIn('saved', output.getvalue())
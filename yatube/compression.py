@@ -0,0 +1,34 @@
+import zlib
+
+from django.middleware.gzip import GZipMiddleware, re_accepts_gzip
+from django.utils.cache import patch_vary_headers
+
+
+def compress_flushed(chunks):
+    """Gzip a sequence of chunks, flushing after each so every chunk reaches the client when it is produced."""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if chunk:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush()
+
+
+class StreamingGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware whose streamed responses are flushed chunk by chunk. Django's compress_sequence leaves
+    data in the compressor until its buffer fills up, which would hold back the shell of streamed pages.
+    """
+
+    def process_response(self, request, response):
+        if not response.streaming or response.has_header('Content-Encoding'):
+            return super().process_response(request, response)
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if not re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            return response
+        response.streaming_content = compress_flushed(response.streaming_content)
+        del response['Content-Length']
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        response['Content-Encoding'] = 'gzip'
+        return response
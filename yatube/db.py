@@ -0,0 +1,72 @@
+"""
+SQLite production profile helpers.
+
+Every connection runs the PRAGMAS of its DATABASES entry when it is opened. ReplicaRouter sends reads of
+the posts app to REPLICA_DATABASE, a read-only connection to the same WAL file: readers then never queue
+behind the single writer. ReplicaMiddleware pins a client to the primary for REPLICA_STICKY_SECONDS after
+it sent a write, so people always see what they have just posted.
+"""
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+STICKY_COOKIE = 'db_primary_until'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+REPLICA_APPS = ('posts',)
+
+_use_primary = ContextVar('use_primary', default=False)
+
+
+@receiver(connection_created)
+def apply_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in connection.settings_dict.get('PRAGMAS', {}).items():
+            cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label not in REPLICA_APPS or _use_primary.get():
+            return None
+        # Rows written by the open transaction are only visible through the primary connection
+        if connections['default'].in_atomic_block:
+            return None
+        return settings.REPLICA_DATABASE
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases are the same database file
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+class ReplicaMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sticky = request.method not in SAFE_METHODS
+        if not sticky:
+            try:
+                sticky = float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+            except ValueError:
+                pass
+        token = _use_primary.set(sticky)
+        try:
+            response = self.get_response(request)
+        finally:
+            _use_primary.reset(token)
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + settings.REPLICA_STICKY_SECONDS:.0f}',
+                                max_age=settings.REPLICA_STICKY_SECONDS, httponly=True, samesite='Lax')
+        return response
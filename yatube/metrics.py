@@ -0,0 +1,252 @@
+"""
+Per-view request metrics in Prometheus text format.
+
+MetricsMiddleware keeps cheap in-process aggregates (request count, latency histogram,
+DB queries and time, template render time, cache hits and misses) keyed by view name.
+Every process dumps its aggregates to <pid>.json in METRICS_DIR at most every METRICS_FLUSH_INTERVAL
+seconds; the /metrics view merges the files of all live worker processes and removes those of dead ones.
+Workers forked from a preloading master start from empty aggregates.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.contrib.auth.decorators import user_passes_test
+from django.db import connections
+from django.http import HttpResponse
+
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNTERS = ('requests', 'duration', 'queries', 'query_seconds', 'render_seconds', 'cache_hits', 'cache_misses')
+# Counted per request in _request
+REQUEST_COUNTERS = COUNTERS[2:]
+METRICS = (
+    ('requests', 'yatube_requests_total', 'Requests handled'),
+    ('queries', 'yatube_db_queries_total', 'SQL queries executed'),
+    ('query_seconds', 'yatube_db_query_seconds_total', 'Time spent in SQL queries'),
+    ('render_seconds', 'yatube_template_render_seconds_total', 'Time spent rendering templates'),
+    ('cache_hits', 'yatube_cache_hits_total', 'Feed page and post card cache hits'),
+    ('cache_misses', 'yatube_cache_misses_total', 'Feed page and post card cache misses'),
+)
+
+_lock = threading.Lock()
+_views = {}
+_request = threading.local()
+_last_flush = 0.0
+_DONE = object()
+
+
+def _after_fork():
+    # The parent's requests are not this worker's, and its lock may have been held at the fork
+    global _lock, _views, _last_flush
+    _lock, _views, _last_flush = threading.Lock(), {}, 0.0
+
+
+os.register_at_fork(after_in_child=_after_fork)
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _empty():
+    return dict({name: 0 for name in COUNTERS}, buckets=[0] * (len(BUCKETS) + 1))
+
+
+def record_cache(hits, misses):
+    """Count cache lookups of the current request, a no-op outside of requests."""
+    if getattr(_request, 'active', False):
+        _request.cache_hits += hits
+        _request.cache_misses += misses
+
+
+def _count_query(execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        _request.queries += 1
+        _request.query_seconds += time.perf_counter() - started
+
+
+@contextmanager
+def execute_wrapper(wrapper):
+    """connection.execute_wrapper on every database alias, so reads routed to the replica are seen too."""
+    with ExitStack() as stack:
+        for alias in connections:
+            stack.enter_context(connections[alias].execute_wrapper(wrapper))
+        yield
+
+
+def _begin(counters=None):
+    """Start counting in this thread, from zero or from the counters of a request being continued."""
+    _request.active = True
+    for name in REQUEST_COUNTERS:
+        setattr(_request, name, counters[name] if counters else 0)
+
+
+def _end():
+    _request.active = False
+    return {name: getattr(_request, name) for name in REQUEST_COUNTERS}
+
+
+def _record(view, duration, counters):
+    with _lock:
+        aggregate = _views.get(view)
+        if aggregate is None:
+            aggregate = _views[view] = _empty()
+        aggregate['requests'] += 1
+        aggregate['duration'] += duration
+        aggregate['buckets'][bisect_left(BUCKETS, duration)] += 1
+        for name in REQUEST_COUNTERS:
+            aggregate[name] += counters[name]
+
+
+def flush(force=False):
+    """Write this process' aggregates for the /metrics view, at most once per METRICS_FLUSH_INTERVAL."""
+    global _last_flush
+    now = time.monotonic()
+    if not force and now - _last_flush < settings.METRICS_FLUSH_INTERVAL:
+        return
+    _last_flush = now
+    with _lock:
+        data = json.dumps(_views)
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    path = os.path.join(settings.METRICS_DIR, f'{os.getpid()}.json')
+    with open(f'{path}.tmp', 'w') as output:
+        output.write(data)
+    os.replace(f'{path}.tmp', path)
+
+
+class _StreamedRequest:
+    """
+    The body of a streaming response (e.g. the post cards of a feed page) is produced by the server after the
+    middleware has returned: keep counting while it is iterated and record the request once it is closed.
+    """
+
+    def __init__(self, view, started, counters):
+        self.view, self.started, self.counters = view, started, counters
+        self.recorded = False
+
+    def measure(self, content):
+        content = iter(content)
+        while True:
+            _begin(self.counters)
+            started = time.perf_counter()
+            try:
+                with execute_wrapper(_count_query):
+                    chunk = next(content, _DONE)
+            finally:
+                _request.render_seconds += time.perf_counter() - started
+                self.counters = _end()
+            if chunk is _DONE:
+                return
+            yield chunk
+
+    def close(self):
+        if not self.recorded:
+            self.recorded = True
+            _record(self.view, time.perf_counter() - self.started, self.counters)
+            flush()
+
+
+class MetricsMiddleware:
+    """
+    Measures every middleware after it and the view. Only StaticFilesMiddleware, which answers static files
+    without reaching Django, and StreamingGZipMiddleware, which only compresses the body, may come before it.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _begin()
+        started = time.perf_counter()
+        try:
+            with execute_wrapper(_count_query):
+                response = self.get_response(request)
+        finally:
+            counters = _end()
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        if response.streaming:
+            streamed = _StreamedRequest(view, started, counters)
+            response.streaming_content = streamed.measure(response.streaming_content)
+            response._closable_objects.append(streamed)
+            return response
+        _record(view, time.perf_counter() - started, counters)
+        flush()
+        return response
+
+    def process_template_response(self, request, response):
+        started = time.perf_counter()
+
+        def rendered(response):
+            _request.render_seconds += time.perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+
+def collect():
+    """Sum the aggregates of every process."""
+    flush(force=True)
+    merged = {}
+    for name in os.listdir(settings.METRICS_DIR):
+        pid, extension = os.path.splitext(name)
+        if extension != '.json' or not pid.isdigit():
+            continue
+        path = os.path.join(settings.METRICS_DIR, name)
+        if not _is_alive(int(pid)):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            continue
+        try:
+            with open(path) as source:
+                views = json.load(source)
+        except (OSError, ValueError):
+            continue
+        for view, aggregate in views.items():
+            total = merged.setdefault(view, _empty())
+            for counter in COUNTERS:
+                total[counter] += aggregate[counter]
+            total['buckets'] = [a + b for a, b in zip(total['buckets'], aggregate['buckets'])]
+    return merged
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render(views):
+    lines = []
+    for key, metric, description in METRICS:
+        lines += [f'# HELP {metric} {description}', f'# TYPE {metric} counter']
+        lines += [f'{metric}{{view="{_escape(view)}"}} {aggregate[key]}' for view, aggregate in sorted(views.items())]
+    metric = 'yatube_request_duration_seconds'
+    lines += [f'# HELP {metric} Request latency', f'# TYPE {metric} histogram']
+    for view, aggregate in sorted(views.items()):
+        label = _escape(view)
+        cumulative = 0
+        for bound, count in zip(BUCKETS + ('+Inf',), aggregate['buckets']):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{view="{label}",le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_sum{{view="{label}"}} {aggregate["duration"]}')
+        lines.append(f'{metric}_count{{view="{label}"}} {aggregate["requests"]}')
+    return '\n'.join(lines) + '\n'
+
+
+@user_passes_test(lambda user: user.is_staff)
+def metrics_view(request):
+    return HttpResponse(render(collect()), content_type='text/plain; version=0.0.4; charset=utf-8')
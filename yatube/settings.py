@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import pathlib
+import tempfile
 from dotenv import load_dotenv
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 import django.core.cache.backends.locmem
@@ -25,7 +27,7 @@ load_dotenv(os.path.join(BASE_DIR, '.env'))
 SECRET_KEY = os.getenv('SECRET_KEY')
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'True').lower() in ('true', '1', 'yes')
 
 ALLOWED_HOSTS = [
     "localhost",
@@ -49,14 +51,19 @@ INSTALLED_APPS = [
     'django.contrib.staticfiles',
     'debug_toolbar',
     'sorl.thumbnail',
+    'rest_framework',
+    'api',
+    'yatube.apps.YatubeConfig',
 ]
 
 MIDDLEWARE = [
+    'yatube.compression.StreamingGZipMiddleware',
+    'yatube.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'users.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
@@ -93,6 +100,38 @@ DATABASES = {
     }
 }
 
+# YATUBE_ENV=production tunes SQLite for concurrent workers, see yatube/db.py
+YATUBE_ENV = os.getenv('YATUBE_ENV', 'development')
+REPLICA_DATABASE = 'replica'
+REPLICA_STICKY_SECONDS = 10
+SQLITE_PRAGMAS = {
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+if YATUBE_ENV == 'production':
+    # Also makes {% static %} emit the hashed names that are served as immutable
+    DEBUG = False
+    DATABASES['default'].update({
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20},
+        'PRAGMAS': dict(SQLITE_PRAGMAS, journal_mode='WAL'),
+    })
+    DATABASES[REPLICA_DATABASE] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f"{pathlib.Path(DATABASES['default']['NAME']).as_uri()}?mode=ro",
+        'CONN_MAX_AGE': 600,
+        'OPTIONS': {'timeout': 20},
+        'PRAGMAS': dict(SQLITE_PRAGMAS, query_only=1),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['yatube.db.ReplicaRouter']
+    MIDDLEWARE.insert(MIDDLEWARE.index('yatube.metrics.MetricsMiddleware') + 1, 'yatube.db.ReplicaMiddleware')
+    STATICFILES_STORAGE = 'yatube.static_files.CompressedManifestStorage'
+    MIDDLEWARE.insert(0, 'yatube.static_files.StaticFilesMiddleware')
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -129,12 +168,18 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
+# Hashed and precompressed by collectstatic and served by yatube/static_files.py in production
+STATIC_MAX_AGE = 60 * 60 * 24 * 365
+STATIC_UNHASHED_MAX_AGE = 60
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 LOGIN_URL = '/auth/login/'
 LOGIN_REDIRECT_URL = 'index'
 # LOGOUT_REDIRECT_URL = 'index'
+# Profiles live at /<username>/: these names would be hidden behind the site's own pages
+RESERVED_USERNAMES = ('about', 'about-us', 'admin', 'api', 'auth', 'follow', 'group', 'media', 'new', 'search',
+                      'static', 'technology', 'trending')
 
 EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
@@ -143,8 +188,105 @@ INTERNAL_IPS = ["127.0.0.1", ]
 
 SITE_ID = 1
 
-CACHE = {
+CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
     }
 }
+
+# A cache shared by all worker processes on the host, see yatube/sqlite_cache.py
+if os.getenv('CACHE_LOCATION'):
+    CACHES['default'] = {
+        'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+        'LOCATION': os.getenv('CACHE_LOCATION'),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    }
+
+
+# Background tasks run in a thread pool after commit, TASKS_EAGER runs them inline
+TASKS_EAGER = False
+TASKS_WORKERS = 2
+
+# Comments and follows committed in batches by a writer thread, see posts/write_behind.py
+WRITE_BEHIND = False
+WRITE_BEHIND_MAX_QUEUE = 1000
+WRITE_BEHIND_PUT_TIMEOUT = 2
+WRITE_BEHIND_BATCH_SIZE = 100
+WRITE_BEHIND_BATCH_WAIT = 0.05
+WRITE_BEHIND_RETRIES = 5
+WRITE_BEHIND_PENDING_TIMEOUT = 5 * 60
+WRITE_BEHIND_SHUTDOWN_TIMEOUT = 10
+WRITE_BEHIND_SPILL_DIR = os.path.join(tempfile.gettempdir(), 'yatube-write-behind')
+
+# Follow feed fan-out on write
+FEED_FANOUT_BATCH_SIZE = 500
+FEED_BACKFILL_SIZE = 100
+FEED_FANOUT_MAX_FOLLOWERS = 10000
+
+# Sessions and the logged in user are read from the cache, the database is only hit on a miss
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+USER_CACHE_TIMEOUT = 60 * 60
+# Django 2.2 looks for AuthenticationMiddleware by name, CachedAuthenticationMiddleware subclasses it
+SILENCED_SYSTEM_CHECKS = ['admin.E408']
+
+# JSON API under /api/<version>/, see api/
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ('rest_framework.renderers.JSONRenderer',),
+    'DEFAULT_AUTHENTICATION_CLASSES': ('rest_framework.authentication.SessionAuthentication',),
+    'DEFAULT_PAGINATION_CLASS': 'api.pagination.CursorPagination',
+    'DEFAULT_VERSIONING_CLASS': 'rest_framework.versioning.URLPathVersioning',
+    'ALLOWED_VERSIONS': ('v1',),
+}
+
+# Comments under a post are shown in keyset pages of this size
+COMMENTS_PER_PAGE = 20
+
+# Who to follow suggestions, rebuilt by the refresh_recommendations command
+RECOMMENDATIONS_PER_USER = 10
+RECOMMENDATION_MAX_COFOLLOWERS = 1000
+RECOMMENDATION_GROUP_WEIGHT = 0.5
+
+# Trending posts and groups: hourly activity buckets decayed by the refresh_trending command
+TRENDING_WINDOW_HOURS = 48
+TRENDING_HALF_LIFE_HOURS = 6
+TRENDING_POSTS = 20
+TRENDING_GROUPS = 10
+
+# Admin changelists count filtered rows up to the cap and estimate the rest, see posts/admin_changelist.py
+ADMIN_COUNT_CAP = 10000
+ADMIN_COUNT_CACHE_TIMEOUT = 5 * 60
+
+# Post and comment bodies are stored as HTML rendered on save, from Markdown when this is on (posts/rendering.py).
+# Off by default, existing plain text would change meaning; after switching it run render_bodies
+POST_MARKDOWN = False
+
+# Rendered post cards are cached by (post id, version)
+POST_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Feed pages send their shell first and stream the post cards after it, see posts/streaming.py
+FEED_STREAMING = True
+
+# Anonymous feed pages are cached until a post, comment or follow bumps their generation
+FEED_CACHE_TIMEOUT = 60 * 60
+FEED_CACHE_STALE_TIMEOUT = 60 * 60 * 24
+FEED_CACHE_LOCK_TIMEOUT = 30
+
+# Deleted posts and users are hidden at once and purged in batches of this size, see posts/deletion.py
+DELETION_BATCH_SIZE = 500
+DELETION_JOB_LEASE = 300
+
+# Thumbnail sizes used by the templates, pre-rendered by the thumbnail_worker command
+POST_THUMBNAILS = {
+    'card': ('960x339', {'crop': 'center', 'upscale': True}),
+}
+THUMBNAIL_JOB_LEASE = 300
+THUMBNAIL_JOB_MAX_ATTEMPTS = 3
+
+# Uploaded originals are stored once per content and re-encoded beyond these bounds, see posts/storage.py
+POST_IMAGE_MAX_SIZE = (2048, 2048)
+POST_IMAGE_MAX_BYTES = 1024 * 1024
+POST_IMAGE_QUALITY = 85
+
+# Per-process request metrics merged by the /metrics view
+METRICS_DIR = os.path.join(tempfile.gettempdir(), 'yatube-metrics')
+METRICS_FLUSH_INTERVAL = 5
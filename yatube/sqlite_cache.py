@@ -0,0 +1,218 @@
+"""
+Cache backend storing entries in a SQLite database in WAL mode.
+
+Unlike LocMemCache the cache is shared by every worker process on the host, and unlike
+FileBasedCache it supports atomic incr, bulk get_many/set_many and LRU eviction bounded
+by MAX_ENTRIES. Configure it with:
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'yatube.sqlite_cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        }
+    }
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+SCHEMA = (
+    'CREATE TABLE IF NOT EXISTS cache ('
+    ' key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL, accessed REAL NOT NULL) WITHOUT ROWID',
+    'CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)',
+)
+ALIVE = '(expires IS NULL OR expires > ?)'
+# Reads refresh the LRU timestamp at most this often, so hot keys do not turn every get into a write
+ACCESS_RESOLUTION = 30
+# SQLite limits the number of bound parameters per statement
+CHUNK_SIZE = 500
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5))
+        self._cull_every = int(options.get('CULL_EVERY', 100))
+        self._local = threading.local()
+        self._writes = 0
+
+    def _connection(self):
+        # Connections are neither shared between threads nor inherited across fork
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            for statement in SCHEMA:
+                connection.execute(statement)
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    @staticmethod
+    def _dump(value):
+        # Plain ints are stored natively so that incr can be a single UPDATE
+        return value if type(value) is int else pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _load(value):
+        return value if isinstance(value, int) else pickle.loads(value)
+
+    def _write(self, sql, rows, many=False):
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = connection.executemany(sql, rows) if many else connection.execute(sql, rows)
+            changed = cursor.rowcount
+            self._writes += 1
+            if self._writes % self._cull_every == 0:
+                self._cull(connection)
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return changed
+
+    def _cull(self, connection):
+        now = time.time()
+        connection.execute('DELETE FROM cache WHERE expires <= ?', (now,))
+        count = connection.execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        if count > self._max_entries:
+            victims = count // self._cull_frequency if self._cull_frequency else count
+            connection.execute('DELETE FROM cache WHERE key IN '
+                               '(SELECT key FROM cache ORDER BY accessed LIMIT ?)', (victims,))
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        return self._write(
+            'INSERT INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET value = excluded.value, expires = excluded.expires, '
+            'accessed = excluded.accessed WHERE cache.expires <= ?',
+            (key, self._dump(value), self.get_backend_timeout(timeout), now, now),
+        ) == 1
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._get_many_raw([key]).get(key, default)
+
+    def _get_many_raw(self, keys):
+        connection = self._connection()
+        now = time.time()
+        found, stale = {}, []
+        for start in range(0, len(keys), CHUNK_SIZE):
+            chunk = keys[start:start + CHUNK_SIZE]
+            rows = connection.execute(
+                f'SELECT key, value, accessed FROM cache WHERE key IN ({",".join("?" * len(chunk))}) AND {ALIVE}',
+                chunk + [now],
+            )
+            for key, value, accessed in rows:
+                found[key] = self._load(value)
+                if accessed < now - ACCESS_RESOLUTION:
+                    stale.append((now, key))
+        if stale:
+            self._touch_accessed(connection, stale)
+        return found
+
+    def _touch_accessed(self, connection, rows):
+        """LRU bookkeeping is best effort: skipped instead of waiting when another writer holds the lock."""
+        connection.execute('PRAGMA busy_timeout = 0')
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                connection.executemany('UPDATE cache SET accessed = ? WHERE key = ?', rows)
+                connection.execute('COMMIT')
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+        except sqlite3.OperationalError:
+            pass
+        finally:
+            connection.execute(f'PRAGMA busy_timeout = {int(self._busy_timeout * 1000)}')
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        mapping = {self.make_key(key, version=version): key for key in keys}
+        for key in mapping:
+            self.validate_key(key)
+        return {mapping[key]: value for key, value in self._get_many_raw(list(mapping)).items()}
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.set_many({key: value}, timeout, version=version)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        expires, now = self.get_backend_timeout(timeout), time.time()
+        rows = []
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key, self._dump(value), expires, now))
+        if rows:
+            self._write('INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)',
+                        rows, many=True)
+        return []
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        now = time.time()
+        return self._write(f'UPDATE cache SET expires = ?, accessed = ? WHERE key = ? AND {ALIVE}',
+                           (self.get_backend_timeout(timeout), now, key, now)) == 1
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        connection = self._connection()
+        now = time.time()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            changed = connection.execute(
+                f"UPDATE cache SET value = value + ?, accessed = ? "
+                f"WHERE key = ? AND typeof(value) = 'integer' AND {ALIVE}",
+                (delta, now, key, now),
+            ).rowcount
+            value = connection.execute('SELECT value FROM cache WHERE key = ?', (key,)).fetchone() if changed else None
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        if value is None:
+            raise ValueError(f"Key '{key}' not found")
+        return value[0]
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return self._connection().execute(f'SELECT 1 FROM cache WHERE key = ? AND {ALIVE}',
+                                          (key, time.time())).fetchone() is not None
+
+    def delete(self, key, version=None):
+        self.delete_many([key], version=version)
+
+    def delete_many(self, keys, version=None):
+        rows = []
+        for key in keys:
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            rows.append((key,))
+        if rows:
+            self._write('DELETE FROM cache WHERE key = ?', rows, many=True)
+
+    def clear(self):
+        self._write('DELETE FROM cache', ())
+
+    def close(self, **kwargs):
+        # Connections are kept open for the life of the thread, like persistent DB connections
+        pass
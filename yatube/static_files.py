@@ -0,0 +1,161 @@
+"""
+Static files without a separate server.
+
+collectstatic with CompressedManifestStorage writes content-hashed copies of the files and staticfiles.json,
+plus a .gz (and a .br when the optional brotli package is installed) next to every compressible hashed file.
+StaticFilesMiddleware reads the manifest once per process into an in-memory index and answers STATIC_URL
+requests from it with the smallest variant the client accepts. Hashed names never change content and are
+cached for STATIC_MAX_AGE as immutable; the original names stay available for STATIC_UNHASHED_MAX_AGE.
+"""
+import gzip
+import json
+import logging
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import FileResponse, HttpResponse, HttpResponseNotAllowed, HttpResponseNotModified
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE = ('.css', '.js', '.map', '.svg', '.json', '.txt', '.xml', '.html', '.ico', '.ttf', '.otf', '.eot')
+# Best first; a variant is only written when it saves at least MIN_SAVING of the file
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+MIN_SAVING = 0.05
+TEXT_TYPES = ('application/javascript', 'application/json', 'image/svg+xml')
+
+
+def _compressors():
+    yield '.gz', lambda data: gzip.compress(data, 9, mtime=0)
+    if brotli is not None:
+        yield '.br', brotli.compress
+
+
+def compress(path):
+    """Write the compressed variants of the file at path, return their suffixes."""
+    with open(path, 'rb') as source:
+        data = source.read()
+    written = []
+    for suffix, compressor in _compressors():
+        compressed = compressor(data)
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            with open(path + suffix, 'wb') as target:
+                target.write(compressed)
+            written.append(suffix)
+    return written
+
+
+class CompressedManifestStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        for name in set(self.hashed_files.values()):
+            if name.endswith(COMPRESSIBLE):
+                compress(self.path(name))
+
+
+class StaticFile:
+    __slots__ = ('variants', 'content_type', 'cache_control', 'mtime', 'last_modified')
+
+    def __init__(self, path, cache_control):
+        # [(encoding, path)] best first, the uncompressed file last
+        self.variants = [(encoding, path + suffix) for encoding, suffix in ENCODINGS if os.path.exists(path + suffix)]
+        self.variants.append((None, path))
+        content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type in TEXT_TYPES:
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.mtime = int(os.stat(path).st_mtime)
+        self.last_modified = http_date(self.mtime)
+
+    def choose(self, accept_encoding):
+        accepted = _accepted_encodings(accept_encoding)
+        for encoding, path in self.variants:
+            if encoding is None or accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding, path
+
+
+def _accepted_encodings(header):
+    """{coding: q} of an Accept-Encoding header."""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        match = re.search(r'q=([0-9.]+)', params)
+        try:
+            quality = float(match.group(1)) if match else 1.0
+        except ValueError:
+            quality = 0.0
+        if coding.strip():
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+def load_index(root, manifest_name):
+    """{name relative to STATIC_URL: StaticFile} of every manifest entry, both hashed and original names."""
+    with open(os.path.join(root, manifest_name)) as manifest:
+        paths = json.load(manifest)['paths']
+    immutable = f'public, max-age={settings.STATIC_MAX_AGE}, immutable'
+    unhashed = f'public, max-age={settings.STATIC_UNHASHED_MAX_AGE}'
+    index = {}
+    for original, hashed in paths.items():
+        for name, cache_control in ((hashed, immutable), (original, unhashed)):
+            path = os.path.join(root, name)
+            if name not in index and os.path.isfile(path):
+                index[name] = StaticFile(path, cache_control)
+    return index
+
+
+class StaticFilesMiddleware:
+    """Serve collected static files from the in-memory manifest index before any other middleware runs."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = settings.STATIC_URL
+        try:
+            self.index = load_index(settings.STATIC_ROOT, staticfiles_storage.manifest_name)
+        except (OSError, ValueError, KeyError):
+            logger.warning('No static files manifest in %s, run collectstatic', settings.STATIC_ROOT)
+            raise MiddlewareNotUsed
+        logger.info('Serving %s static files', len(self.index))
+
+    def __call__(self, request):
+        if request.path_info.startswith(self.prefix):
+            static_file = self.index.get(request.path_info[len(self.prefix):])
+            if static_file is not None:
+                return self.serve(request, static_file)
+        return self.get_response(request)
+
+    def serve(self, request, static_file):
+        if request.method not in ('GET', 'HEAD'):
+            return HttpResponseNotAllowed(['GET', 'HEAD'])
+        encoding, path = static_file.choose(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        size = os.path.getsize(path)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), static_file.mtime, size):
+            response = HttpResponseNotModified()
+        elif request.method == 'HEAD':
+            response = HttpResponse(content_type=static_file.content_type)
+            response['Content-Length'] = size
+        else:
+            response = FileResponse(open(path, 'rb'))
+            # FileResponse guesses application/gzip from the variant's name
+            response['Content-Type'] = static_file.content_type
+        if encoding:
+            response['Content-Encoding'] = encoding
+        if len(static_file.variants) > 1:
+            response['Vary'] = 'Accept-Encoding'
+        response['Cache-Control'] = static_file.cache_control
+        response['Last-Modified'] = static_file.last_modified
+        response['X-Content-Type-Options'] = 'nosniff'
+        return response
@@ -0,0 +1,263 @@
+import gzip
+import importlib.util
+import json
+import os
+import sqlite3
+import subprocess
+import time
+import zlib
+from tempfile import TemporaryDirectory
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.backends.sqlite3.base import DatabaseWrapper
+from django.http import HttpResponse, StreamingHttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from posts.models import Post
+
+from . import compression, db, metrics, static_files
+from .sqlite_cache import SQLiteCache
+
+
+class TestSQLiteCache(SimpleTestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = SQLiteCache(self.location, {'OPTIONS': {'MAX_ENTRIES': 10, 'CULL_EVERY': 1}})
+
+    def test_get_set_many(self):
+        self.cache.set_many({'a': 1, 'b': {'nested': [1, 2]}})
+        self.assertEqual(self.cache.get_many(['a', 'b', 'c']), {'a': 1, 'b': {'nested': [1, 2]}})
+        self.cache.delete('a')
+        self.assertIsNone(self.cache.get('a'))
+
+    def test_add_and_incr_are_shared_between_instances(self):
+        other = SQLiteCache(self.location, {})
+        self.assertTrue(self.cache.add('counter', 1))
+        self.assertFalse(other.add('counter', 5))
+        self.assertEqual(other.incr('counter'), 2)
+        self.assertEqual(self.cache.get('counter'), 2)
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+    def test_expired_entries_are_invisible(self):
+        self.cache.set('key', 'value', -1)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertTrue(self.cache.add('key', 'new'))
+
+    def test_lru_eviction(self):
+        for i in range(30):
+            self.cache.set(f'key{i}', i)
+        count = self.cache._connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+        self.assertLessEqual(count, 10)
+        self.assertEqual(self.cache.get('key29'), 29)
+
+    def test_reads_do_not_wait_for_the_write_lock(self):
+        self.cache.set('key', 'value')
+        self.cache._connection().execute('UPDATE cache SET accessed = 0')
+        writer = sqlite3.connect(self.location, isolation_level=None)
+        self.addCleanup(writer.close)
+        writer.execute('BEGIN IMMEDIATE')
+        started = time.perf_counter()
+        self.assertEqual(self.cache.get('key'), 'value')
+        self.assertLess(time.perf_counter() - started, 1)
+        writer.execute('ROLLBACK')
+        self.assertEqual(self.cache.get('key'), 'value')
+        accessed = self.cache._connection().execute('SELECT accessed FROM cache').fetchone()[0]
+        self.assertGreater(accessed, 0)
+
+
+class TestMetrics(TestCase):
+    def setUp(self):
+        metrics._views.clear()
+        cache.clear()
+
+    def test_metrics_are_staff_only(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_metrics_report_views(self):
+        with TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            b''.join(self.client.get(reverse('index')).streaming_content)
+            staff = User.objects.create(username='staff', is_staff=True)
+            self.client.force_login(staff)
+            response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'yatube_requests_total{view="index"} 1')
+        self.assertContains(response, 'yatube_request_duration_seconds_bucket{view="index",le="+Inf"} 1')
+        self.assertContains(response, 'yatube_db_queries_total{view="index"}')
+
+    def test_files_of_dead_processes_are_removed(self):
+        dead = subprocess.Popen(['true'])
+        dead.wait()
+        with TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            with open(os.path.join(directory, f'{dead.pid}.json'), 'w') as stale:
+                json.dump({'index': dict(metrics._empty(), requests=5)}, stale)
+            metrics._record('index', 0.01, dict.fromkeys(metrics.REQUEST_COUNTERS, 0))
+            self.assertEqual(metrics.collect()['index']['requests'], 1)
+            self.assertEqual(os.listdir(directory), [f'{os.getpid()}.json'])
+
+    def test_forked_worker_starts_empty(self):
+        metrics._record('index', 0.01, dict.fromkeys(metrics.REQUEST_COUNTERS, 0))
+        pid = os.fork()
+        if pid == 0:
+            os._exit(1 if metrics._views else 0)
+        self.assertEqual(os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1]), 0)
+        self.assertIn('index', metrics._views)
+
+    def test_streamed_response_is_recorded_when_closed(self):
+        with TemporaryDirectory() as directory, override_settings(METRICS_DIR=directory):
+            response = self.client.get(reverse('index'))
+            self.assertNotIn('index', metrics._views)
+            # The test client closes the response once the body has been read
+            b''.join(response.streaming_content)
+        self.assertEqual(metrics._views['index']['requests'], 1)
+        self.assertGreater(metrics._views['index']['queries'], 0)
+        self.assertGreater(metrics._views['index']['render_seconds'], 0)
+
+
+class TestSQLiteProfile(SimpleTestCase):
+    def test_pragmas_run_on_connect(self):
+        with TemporaryDirectory() as directory:
+            settings_dict = dict(connection.settings_dict, NAME=os.path.join(directory, 'db.sqlite3'),
+                                 PRAGMAS={'journal_mode': 'WAL', 'synchronous': 'NORMAL'})
+            wrapper = DatabaseWrapper(settings_dict, alias='pragmas')
+            try:
+                with wrapper.cursor() as cursor:
+                    cursor.execute('PRAGMA journal_mode')
+                    self.assertEqual(cursor.fetchone()[0], 'wal')
+                    cursor.execute('PRAGMA synchronous')
+                    self.assertEqual(cursor.fetchone()[0], 1)
+            finally:
+                wrapper.close()
+
+    def test_router_reads_posts_from_replica_unless_pinned(self):
+        router = db.ReplicaRouter()
+        self.assertEqual(router.db_for_read(Post), 'replica')
+        self.assertIsNone(router.db_for_read(User))
+        self.assertEqual(router.db_for_write(Post), 'default')
+        self.assertFalse(router.allow_migrate('replica', 'posts'))
+
+        seen = []
+        middleware = db.ReplicaMiddleware(lambda request: seen.append(router.db_for_read(Post)) or HttpResponse())
+        factory = RequestFactory()
+        response = middleware(factory.post('/new/'))
+        middleware(factory.get('/'))
+        request = factory.get('/')
+        request.COOKIES[db.STICKY_COOKIE] = response.cookies[db.STICKY_COOKIE].value
+        middleware(request)
+        self.assertEqual(seen, [None, 'replica', None])
+
+    @override_settings(DATABASE_ROUTERS=['yatube.db.ReplicaRouter'], REPLICA_DATABASE='replica')
+    def test_metrics_count_queries_routed_to_the_replica(self):
+        # The replica reads the test database through a connection of its own
+        with mock.patch.dict(connections.databases, replica=dict(connection.settings_dict)):
+            try:
+                self.assertEqual(Post.objects.all().db, 'replica')
+                seen = []
+                with metrics.execute_wrapper(lambda execute, *args: seen.append(args[0]) or execute(*args)):
+                    list(Post.objects.all())
+            finally:
+                connections['replica'].close()
+                del connections['replica']
+        self.assertEqual(len(seen), 1)
+
+
+class TestStaticFiles(SimpleTestCase):
+    def setUp(self):
+        directory = TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        source = os.path.join(directory.name, 'source')
+        os.makedirs(os.path.join(source, 'css'))
+        os.makedirs(os.path.join(source, 'img'))
+        with open(os.path.join(source, 'css', 'site.css'), 'w') as css:
+            css.write(".dot { background: url('../img/dot.png'); }\n" * 50)
+        with open(os.path.join(source, 'img', 'dot.png'), 'wb') as png:
+            png.write(b'\x89PNG dot')
+        overrides = override_settings(
+            STATICFILES_DIRS=[source], STATIC_ROOT=os.path.join(directory.name, 'static'),
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATICFILES_STORAGE='yatube.static_files.CompressedManifestStorage',
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.middleware = static_files.StaticFilesMiddleware(lambda request: HttpResponse('application'))
+        self.css = staticfiles_storage.stored_name('css/site.css')
+
+    def get(self, path, **headers):
+        response = self.middleware(RequestFactory().get(f'/static/{path}', **headers))
+        self.addCleanup(response.close)
+        return response
+
+    def test_hashed_file_is_precompressed_and_immutable(self):
+        response = self.get(self.css, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css; charset=utf-8')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        self.assertIn('immutable', response['Cache-Control'])
+        content = gzip.decompress(b''.join(response.streaming_content)).decode()
+        self.assertIn(staticfiles_storage.stored_name('img/dot.png'), content)
+
+    def test_encoding_negotiation(self):
+        self.assertFalse(self.get(self.css).has_header('Content-Encoding'))
+        self.assertFalse(self.get(self.css, HTTP_ACCEPT_ENCODING='gzip;q=0').has_header('Content-Encoding'))
+        png = self.get(staticfiles_storage.stored_name('img/dot.png'), HTTP_ACCEPT_ENCODING='gzip')
+        self.assertFalse(png.has_header('Content-Encoding'))
+        self.assertFalse(png.has_header('Vary'))
+
+    def test_original_names_unknown_files_and_methods(self):
+        response = self.get('css/site.css')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.get(self.css, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get('css/missing.css').content, b'application')
+        request = RequestFactory().post(f'/static/{self.css}')
+        self.assertEqual(self.middleware(request).status_code, 405)
+
+
+    def test_production_templates_link_hashed_names(self):
+        environment = {key: os.environ.get(key) for key in ('YATUBE_ENV', 'DEBUG')}
+        os.environ.update(YATUBE_ENV='production', DEBUG='True')
+        try:
+            spec = importlib.util.spec_from_file_location('production_settings', os.path.join(
+                os.path.dirname(__file__), 'settings.py'))
+            production = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(production)
+        finally:
+            for key, value in environment.items():
+                if value is None:
+                    os.environ.pop(key, None)
+                else:
+                    os.environ[key] = value
+        self.assertFalse(production.DEBUG)
+        self.assertEqual(production.STATICFILES_STORAGE, 'yatube.static_files.CompressedManifestStorage')
+        with override_settings(DEBUG=production.DEBUG):
+            url = Template("{% load static %}{% static 'css/site.css' %}").render(Context())
+        self.assertEqual(url, f'/static/{self.css}')
+        self.assertIn('immutable', self.get(url[len('/static/'):])['Cache-Control'])
+
+
+class TestStreamingGZip(SimpleTestCase):
+    def test_every_chunk_is_flushed(self):
+        middleware = compression.StreamingGZipMiddleware(
+            lambda request: StreamingHttpResponse(iter([b'<head>shell</head>', b'card ' * 100, b'</html>'])))
+        response = middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip, br'))
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+        decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        chunks = iter(response.streaming_content)
+        self.assertEqual(decompressor.decompress(next(chunks)), b'<head>shell</head>')
+        rest = b''.join(decompressor.decompress(chunk) for chunk in chunks)
+        self.assertEqual(rest, b'card ' * 100 + b'</html>')
+
+    def test_plain_responses_are_left_to_gzip_middleware(self):
+        middleware = compression.StreamingGZipMiddleware(lambda request: HttpResponse(b'page ' * 100))
+        response = middleware(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'))
+        self.assertEqual(gzip.decompress(response.content), b'page ' * 100)
@@ -4,11 +4,14 @@ from django.contrib.flatpages import views as fp_views
 from django.conf.urls import handler404, handler500
 from django.conf import settings
 from django.conf.urls.static import static
+from .metrics import metrics_view
 
 urlpatterns = [
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('admin/', admin.site.urls),
+    path('api/<str:version>/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
     path('about/', include('django.contrib.flatpages.urls')),
     path('about-us/', fp_views.flatpage, {'url': '/about-us/'}, name='about_us'),
     path('technology/', fp_views.flatpage, {'url': '/technology/'}, name='technology'),